@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the `footprint` library.
+
+Measures the operations footprint scripts spend their time in: creating
+rows of pins and pads, `base=` inherited construction, pin lookups,
+serialization, writing to disk, and running a whole footprint script.
+Each case reports operations per second (best of several timed runs)
+and the peak memory allocated by one operation (measured separately with
+tracemalloc).
+
+Usage:
+
+  python benchmark.py                 run all cases, compare to baseline
+  python benchmark.py add_pins        run cases whose names contain a word
+  python benchmark.py --save          run all cases and record a baseline
+
+The baseline is kept in benchmark-baseline.json next to this script.
+Timings depend on the machine, so compare against a baseline recorded on
+the same machine.
+"""
+import sys, os, json, time, runpy, tempfile, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from footprint import *
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "benchmark-baseline.json")
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+    "example-footprints.py")
+SIZES = (10, 100, 1000, 10000)
+
+
+def pin_footprint(count):
+  f = Footprint("PINS%d" % count)
+  f.add_pins(count, x=0, y=0, dx=100, dy=(0, 100), hole=40, diameter=70)
+  return f
+
+
+def pad_footprint(count, fixed_point=False):
+  f = Footprint("PADS%d" % count, fixed_point=fixed_point)
+  f.add_pads(count, x=0, y=0, dx=0.5*mm, width=0.3*mm, height=1.2*mm)
+  return f
+
+
+def inherited(count):
+  f = Footprint("BASE%d" % count)
+  p = f.add_pad(x=0, y=0, width=0.3*mm, height=1.2*mm)
+  for i in range(count - 1):
+    p = f.add_pad(base=p, left=p.right + 0.2*mm, number=i + 2)
+  return f
+
+
+def lookups(f, count):
+  def run():
+    for number in range(1, count + 1):
+      f[number]
+  return run
+
+
+def serialize(f):
+  return lambda: str(f)
+
+
+def write(f, directory):
+  filename = os.path.join(directory, f.name + ".fp")
+  return lambda: f.write(filename)
+
+
+def run_example(directory):
+  def run():
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+      runpy.run_path(EXAMPLE)
+    finally:
+      os.chdir(cwd)
+  return run
+
+
+def cases(directory):
+  """Returns a list of (name, function) benchmark cases."""
+  result = []
+  for n in SIZES:
+    result.append(("add_pins/%d" % n, lambda n=n: pin_footprint(n)))
+  for n in SIZES:
+    result.append(("add_pads/%d" % n, lambda n=n: pad_footprint(n)))
+  result.append(("base_inherited/1000", lambda: inherited(1000)))
+  result.append(("getitem/1000", lookups(pin_footprint(1000), 1000)))
+  for n in (100, 1000, 10000):
+    result.append(("str/%d" % n, serialize(pad_footprint(n))))
+  result.append(("str_fixed_point/10000",
+      serialize(pad_footprint(10000, fixed_point=True))))
+  result.append(("write/1000", write(pad_footprint(1000), directory)))
+  result.append(("example_script", run_example(directory)))
+  return result
+
+
+def measure(fn, min_time=0.2, repeat=3):
+  """Returns (operations per second, peak bytes allocated by one
+  operation) for a function."""
+  fn()  # warm up
+  loops = 1
+  while True:
+    start = time.perf_counter()
+    for i in range(loops):
+      fn()
+    elapsed = time.perf_counter() - start
+    if elapsed >= min_time:
+      break
+    loops *= 2 if elapsed <= 0 else max(2, int(min_time / elapsed * 1.2))
+  best = elapsed
+  for i in range(repeat - 1):
+    start = time.perf_counter()
+    for i in range(loops):
+      fn()
+    best = min(best, time.perf_counter() - start)
+  tracemalloc.start()
+  fn()
+  peak = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+  return loops / best, peak
+
+
+def main(argv):
+  save = "--save" in argv
+  words = [a for a in argv if not a.startswith("-")]
+  try:
+    with open(BASELINE) as f:
+      baseline = json.load(f)
+  except (IOError, OSError, ValueError):
+    baseline = {}
+  results = {}
+  directory = tempfile.mkdtemp(prefix="footprint-bench-")
+  print("%-22s %14s %12s %10s" % ("case", "ops/sec", "peak memory",
+      "vs base"))
+  for name, fn in cases(directory):
+    if words and not any(w in name for w in words):
+      continue
+    rate, peak = measure(fn)
+    results[name] = {"ops_per_sec": rate, "peak_bytes": peak}
+    old = baseline.get(name)
+    ratio = "%9.2fx" % (rate / old["ops_per_sec"]) if old else "         -"
+    print("%-22s %14.1f %10.1fKB %s" % (name, rate, peak / 1024., ratio))
+  for filename in os.listdir(directory):
+    os.remove(os.path.join(directory, filename))
+  os.rmdir(directory)
+  if save:
+    baseline.update(results)
+    with open(BASELINE, "w") as f:
+      json.dump(baseline, f, indent=2, sort_keys=True)
+      f.write("\n")
+    print("baseline saved to %s" % os.path.basename(BASELINE))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -43,6 +43,10 @@ staggered. This line creates the hole pattern for a 9-pin D-sub connector:
 
   f.add_pins(9, x=0, y=0, dx=54, dy=(112, -112), hole=30, diameter=66)
 
+The pins or pads are stored column-wise in a single `PinArray` or `PadArray`
+shape rather than as one object each, which keeps large rows and grids
+compact. The returned array can be indexed like a list, e.g. `pins[2].x`.
+
 Though the library encourages the use of declarative syntax (e.g. defining
 parameters relative to those of other elements), the implementation is
 simple and each line is executed imperatively. There is no solver or
@@ -53,13 +57,48 @@ in a successive statement, property B will *not* be updated. Despite these
 limitations, it should be possible to create complex footprints with few
 lines of code.
 
+Creating a footprint with `Footprint("NAME", track_dependencies=True)` lifts
+this restriction for single pins, pads and silkscreen shapes. Values computed
+from other shapes' properties, such as `left=p1.right+6.2*mm` or those
+inherited with `base`, are then recorded as formulas, and changing property A
+recomputes B and anything depending on B, without rerunning the rest of the
+script. Assigning a plain number to B replaces its formula. Pins and pads
+created in arrays are not tracked.
+
 Not all pcb shape types and attributes are supported at the moment.
 """
-import sys, os
+import sys, os, io, re, json, hashlib, math, mmap, operator, copy, time
+import threading, struct
+from traceback import format_exception_only
+from array import array
+from bisect import bisect_left, insort
+from itertools import accumulate, chain, compress, cycle, islice, repeat
 
 __author__  = "Matt Sarnoff (msarnoff.org)"
 __version__ = "1.0"
 
+# The names footprint scripts get from `from footprint import *`. The
+# command line tools (build, watch, serve, submit) are left out.
+__all__ = [
+  "mm", "between",
+  "Shape", "Pad", "Pin", "SilkLine", "SilkPolyline", "SilkArc",
+  "PadArray", "PinArray", "FixedPad", "FixedPin", "FixedSilkLine",
+  "FixedSilkPolyline", "FixedSilkArc", "FixedPadArray", "FixedPinArray",
+  "Footprint", "FootprintTemplate", "footprint_template", "templates",
+  "template_stats",
+  "GedaEmitter", "KicadEmitter", "emitters", "use_formats",
+  "Violation", "check_library",
+  "load_library", "find_duplicates", "link_duplicates",
+  "PackWriter", "PackReader", "use_pack", "snapshot_key",
+  "OutputCache", "use_output_cache", "FootprintIndex", "use_metadata_index",
+  "AsyncWriter", "use_async_writer",
+  "Profiler", "summarize_profile", "use_profiler",
+]
+
+
+# When a script is run by `python -m footprint build`, this is a list
+# that records each footprint written or failed while the script runs.
+_run_log = None
 
 # use to specify dimensions in mm, e.g. "2.54*mm"
 mm = 1.0/0.0254
@@ -96,15 +135,130 @@ def _mil_to_unit(mil):
   return round(mil * 100)
 
 
+# pcb format of each kind of record produced by Footprint.records()
+_PCB_FORMATS = {
+  "Element": "Element[\"\" \"%s\" \"\" \"%s\" %d %d %d %d %d %d \"\"] (",
+  "Pad": "Pad[%d %d %d %d %d %d %d \"%s\" \"%s\" %#x]",
+  "Pin": "Pin[%d %d %d %d %d %d \"%s\" \"%s\" %#x]",
+  "ElementLine": "ElementLine[%d %d %d %d %d]",
+  "ElementArc": "ElementArc[%d %d %d %d %d %d %d]",
+}
+
+
+def _pad_fields(left, top, width, height, clearance, name, number, round,
+    tx=0, ty=0):
+  """Returns the fields of a pad's "Pad" record given its edges and size.
+
+  Shared by Pad and PadArray so both emit identical output.
+  """
+  # pcb is silly and defines pads as line segments...
+  if width > height:
+    thickness = height
+    x1 = left + thickness/2.
+    y1 = between(top, top + height)
+    x2 = (left + width) - thickness/2.
+    y2 = y1
+  else:
+    thickness = width
+    x1 = between(left, left + width)
+    y1 = top + thickness/2.
+    x2 = x1
+    y2 = (top + height) - thickness/2.
+  mask = thickness + clearance
+  return (_mil_to_unit(x1+tx), _mil_to_unit(y1+ty),
+      _mil_to_unit(x2+tx), _mil_to_unit(y2+ty),
+      _mil_to_unit(thickness), _mil_to_unit(clearance),
+      _mil_to_unit(mask),
+      name,
+      number,
+      0 if round else 0x100)
+
+
+def _pad_repr(*args):
+  """Returns the pcb representation of a pad; takes the same arguments
+  as _pad_fields()."""
+  return _PCB_FORMATS["Pad"] % _pad_fields(*args)
+
+
+def _pin_fields(x, y, hole, diameter, clearance, mask_offset, name, number,
+    round, tx=0, ty=0):
+  """Returns the fields of a pin's "Pin" record given its center and
+  size.
+
+  Shared by Pin and PinArray so both emit identical output.
+  """
+  return (_mil_to_unit(x+tx), _mil_to_unit(y+ty),
+      _mil_to_unit(diameter), _mil_to_unit(clearance),
+      _mil_to_unit(diameter+mask_offset), _mil_to_unit(hole),
+      name, number,
+      0x1 | (0 if round else 0x100))
+
+
+def _pin_repr(*args):
+  """Returns the pcb representation of a pin; takes the same arguments
+  as _pin_fields()."""
+  return _PCB_FORMATS["Pin"] % _pin_fields(*args)
+
+
+def _positions(start, step, count, typecode="d"):
+  """Returns an array of `count` coordinates, beginning at `start` and
+  advancing by `step` after each one.
+
+  `step` may be a tuple, in which case its elements are used in turn
+  (this is how staggered rows are specified). The positions are
+  accumulated the same way as repeated `+=` would, so they match
+  shape-by-shape placement exactly.
+  """
+  if count <= 0:
+    return array(typecode)
+  if isinstance(step, tuple):
+    steps = islice(cycle(step), count-1)
+  else:
+    steps = (step for i in range(count-1))
+  return array(typecode, accumulate(chain((start,), steps)))
+
+
 
 class Shape(object):
-  """Abstract base class for all shapes."""
+  """Abstract base class for all shapes.
+
+  Shapes use __slots__ rather than a per-instance __dict__ to keep large
+  footprints compact. Pads and pins get a __dict__ only when their own
+  clearance or mask offset is set. See the README for measured memory
+  use per 100,000 shapes.
+  """
+
+  # _owner and _position are the footprint this shape was added to and
+  # the shape's index in its shapes array; they are used to keep the
+  # footprint's pin number lookup table up to date.
+  __slots__ = ("name", "_number", "_owner", "_position")
+
+  # Names of the attributes that determine the shape's extent. A
+  # footprint compares their values with those it saw last to find the
+  # shapes that have moved since its spatial index was last used; if
+  # None, bounds() is compared instead.
+  _geometry = None
 
   def __init__(self):
     """Initializer. Takes no arguments."""
+    self._owner = None
+    self._position = None
+    self._number = ""
     self.name = ""
-    self.number = ""
-  
+
+  @property
+  def number(self):
+    """Pin number."""
+    return self._number
+  @number.setter
+  def number(self, value):
+    """Sets the pin number, updating the owning footprint's lookup
+    table."""
+    old = self._number
+    self._number = value
+    if self._owner is not None:
+      self._owner._renumber(self, -1, old, value)
+
   def pcb_repr(self, tx=0, ty=0):
     """Returns a string representation of this shape in pcb format.
 
@@ -117,7 +271,54 @@ class Shape(object):
     out pins and pads starting from (0,0), and then set the mark later.
     """
     return None
+
+  def records(self, tx=0, ty=0):
+    """Returns an iterable of the records this shape is made of, in the
+    format-neutral form used by Footprint.records(): (kind, fields)
+    tuples, where `kind` is the name of the pcb record type ("Pad",
+    "Pin", "ElementLine" or "ElementArc") and `fields` the values of its
+    fields, with lengths in 1/100 mils. See pcb_repr() for a description
+    of the arguments.
+
+    Shapes that only define pcb_repr() have their records read back from
+    its output."""
+    return _pcb_records("\n".join(line for line in self.pcb_lines(tx, ty)
+        if line))
   
+  def elements(self):
+    """Returns an iterable of the individual shapes this shape is made
+    of. For most shapes this is just the shape itself; arrays yield one
+    view per pin or pad."""
+    return (self,)
+
+  def bounds(self):
+    """Returns the (left, top, right, bottom) extents of the shape, or
+    None if it is empty."""
+    return self.left, self.top, self.right, self.bottom
+
+  def element_bounds(self):
+    """Returns an iterable of the bounds() of each of the shapes
+    returned by elements(), in the same order."""
+    return (self.bounds(),)
+
+  def _transform(self, m, dx, dy):
+    """Moves the shape by an orthogonal transform; see
+    Footprint.transform(). `m` is the (a, b, c, d) matrix and dx, dy the
+    translation, in mils.
+
+    Shapes that do not define this are instead converted to the built-in
+    shapes their records() describe, which are transformed and returned
+    in a list for the footprint to put in place of the shape."""
+    shapes = _shapes_from_records(self.records())
+    for shape in shapes:
+      shape._transform(m, dx, dy)
+    return shapes
+
+  def pcb_lines(self, tx=0, ty=0):
+    """Returns an iterable of the lines of this shape's pcb
+    representation. See pcb_repr() for a description of the arguments."""
+    return (self.pcb_repr(tx, ty),)
+
   def __str__(self):
     return self.pcb_repr()
 
@@ -130,7 +331,13 @@ class Shape(object):
 class Pad(Shape):
   """A surface-mount pad."""
 
-  # Default value, in mils, of the clearance width.
+  # "__dict__" is only allocated once a pad's own clearance is set; until
+  # then, reads fall through to the class attribute below.
+  __slots__ = ("left", "top", "width", "height", "round", "__dict__")
+  _geometry = ("left", "top", "width", "height")
+
+  # Default value, in mils, of the clearance width. It can be set on
+  # individual pads as well as on the class.
   clearance = 1
 
   def __init__(self, **kwargs):
@@ -170,6 +377,7 @@ class Pad(Shape):
     parameter duplication.
     """
     super(Pad, self).__init__()
+    self.left = self.top = self.width = self.height = None
     self.round = False
     inheritable_keys = ["left", "width", "top", "height", "number", "name", "round"]
     all_keys = inheritable_keys + ["right", "x", "bottom", "y"]
@@ -183,29 +391,18 @@ class Pad(Shape):
         setattr(self, key, value)
 
   def pcb_repr(self, tx=0, ty=0):
-    # pcb is silly and defines pads as line segments...
-    x1, y1, x2, y2, thickness = 0, 0, 0, 0, 0
-    if self.width > self.height:
-      thickness = self.height
-      x1 = self.left + thickness/2.
-      y1 = self.y
-      x2 = self.right - thickness/2.
-      y2 = self.y
-    else:
-      thickness = self.width
-      x1 = self.x
-      y1 = self.top + thickness/2.
-      x2 = self.x
-      y2 = self.bottom - thickness/2.
-    mask = thickness + self.clearance
-    return "Pad[%d %d %d %d %d %d %d \"%s\" \"%s\" %#x]" % (
-        _mil_to_unit(x1+tx), _mil_to_unit(y1+ty),
-        _mil_to_unit(x2+tx), _mil_to_unit(y2+ty),
-        _mil_to_unit(thickness), _mil_to_unit(self.clearance),
-        _mil_to_unit(mask),
-        self.name,
-        self.number,
-        0 if self.round else 0x100)
+    return _pad_repr(self.left, self.top, self.width, self.height,
+        self.clearance, self.name, self.number, self.round, tx, ty)
+
+  def records(self, tx=0, ty=0):
+    return (("Pad", _pad_fields(self.left, self.top, self.width,
+        self.height, self.clearance, self.name, self.number, self.round,
+        tx, ty)),)
+
+  def _transform(self, m, dx, dy):
+    box = self.left, self.top, self.width, self.height
+    self.left, self.width = _transform_extent(m[0], m[1], box, dx)
+    self.top, self.height = _transform_extent(m[2], m[3], box, dy)
 
   @property
   def right(self):
@@ -251,10 +448,39 @@ class Pad(Shape):
 
 
 
+def _transform_extent(p, q, box, offset):
+  """Returns the (low edge, size) on one axis of a (left, top, width,
+  height) box after an orthogonal transform, given the row (p, q) of
+  the transform's matrix for that axis and the offset along it."""
+  low, size, scale = (box[0], box[2], p) if p else (box[1], box[3], q)
+  return (offset + low if scale > 0 else offset - low - size), size
+
+
+# (a, b, c, d) matrices of counterclockwise rotations by multiples of 90
+# degrees, as seen on screen (the y axis points down)
+_ROTATIONS = {0: (1, 0, 0, 1), 90: (0, 1, -1, 0), 180: (-1, 0, 0, -1),
+    270: (0, -1, 1, 0)}
+
+def _rotation_angle(m):
+  """Returns the rotation, in degrees counterclockwise on screen, of an
+  orthogonal (a, b, c, d) matrix; for a mirror image, that of the
+  matrix after first undoing a mirror in x (x -> -x)."""
+  a, b, c, d = m
+  if a*d - b*c < 0:
+    a, c = -a, -c
+  return next(r for r, rm in _ROTATIONS.items() if rm == (a, b, c, d))
+
+
+
 class Pin(Shape):
   """A plated-through hole."""
 
-  # Default value, in mils, of the clearance width.
+  # see Pad.__slots__
+  __slots__ = ("x", "y", "hole", "diameter", "round", "__dict__")
+  _geometry = ("x", "y", "hole", "diameter")
+
+  # Default value, in mils, of the clearance width. Like mask_offset, it
+  # can be set on individual pins as well as on the class.
   clearance = 2
   """Default value, in mils, of the clearance width."""
   
@@ -282,6 +508,7 @@ class Pin(Shape):
     parameter duplication.
     """
     super(Pin, self).__init__()
+    self.x = self.y = self.hole = self.diameter = None
     self.round = True
     keys = ["x", "y", "hole", "diameter", "number", "name", "round"]
     base = kwargs.get("base")
@@ -294,12 +521,19 @@ class Pin(Shape):
         setattr(self, key, value)
 
   def pcb_repr(self, tx=0, ty=0):
-    return "Pin[%d %d %d %d %d %d \"%s\" \"%s\" %#x]" % (
-        _mil_to_unit(self.x+tx), _mil_to_unit(self.y+ty),
-        _mil_to_unit(self.diameter), _mil_to_unit(self.clearance),
-        _mil_to_unit(self.diameter+self.mask_offset), _mil_to_unit(self.hole),
-        self.name, self.number,
-        0x1 | (0 if self.round else 0x100))
+    return _pin_repr(self.x, self.y, self.hole, self.diameter,
+        self.clearance, self.mask_offset, self.name, self.number,
+        self.round, tx, ty)
+
+  def records(self, tx=0, ty=0):
+    return (("Pin", _pin_fields(self.x, self.y, self.hole, self.diameter,
+        self.clearance, self.mask_offset, self.name, self.number,
+        self.round, tx, ty)),)
+
+  def _transform(self, m, dx, dy):
+    x, y = self.x, self.y
+    self.x = m[0]*x + m[1]*y + dx
+    self.y = m[2]*x + m[3]*y + dy
 
   @property
   def left(self):
@@ -342,6 +576,9 @@ class Pin(Shape):
 class SilkLine(Shape):
   """A line on the silkscreen layer."""
 
+  __slots__ = ("x1", "y1", "x2", "y2", "thickness")
+  _geometry = __slots__
+
   default_thickness = 10
 
   def __init__(self, x1, y1, x2, y2, **kwargs):
@@ -355,6 +592,7 @@ class SilkLine(Shape):
     thickness -- (optional) line thickness
       SilkLine.default_thickness is used if unspecified
     """
+    super(SilkLine, self).__init__()
     self.x1 = x1
     self.y1 = y1
     self.x2 = x2
@@ -362,15 +600,92 @@ class SilkLine(Shape):
     self.thickness = kwargs.get("thickness", self.default_thickness)
 
   def pcb_repr(self, tx=0, ty=0):
-    return "ElementLine[%d %d %d %d %d]" % (
+    return _PCB_FORMATS["ElementLine"] % self.records(tx, ty)[0][1]
+
+  def records(self, tx=0, ty=0):
+    return (("ElementLine", (
         _mil_to_unit(self.x1+tx), _mil_to_unit(self.y1+ty),
         _mil_to_unit(self.x2+tx), _mil_to_unit(self.y2+ty),
-        _mil_to_unit(self.thickness))
+        _mil_to_unit(self.thickness))),)
+
+  def _transform(self, m, dx, dy):
+    x1, y1, x2, y2 = self.x1, self.y1, self.x2, self.y2
+    self.x1, self.y1 = m[0]*x1 + m[1]*y1 + dx, m[2]*x1 + m[3]*y1 + dy
+    self.x2, self.y2 = m[0]*x2 + m[1]*y2 + dx, m[2]*x2 + m[3]*y2 + dy
+
+  @property
+  def left(self):
+    """X coordinate of the line's left edge, including its thickness."""
+    return min(self.x1, self.x2) - self.thickness/2.
+
+  @property
+  def right(self):
+    """X coordinate of the line's right edge, including its thickness."""
+    return max(self.x1, self.x2) + self.thickness/2.
+
+  @property
+  def top(self):
+    """Y coordinate of the line's top edge, including its thickness."""
+    return min(self.y1, self.y2) - self.thickness/2.
+
+  @property
+  def bottom(self):
+    """Y coordinate of the line's bottom edge, including its
+    thickness."""
+    return max(self.y1, self.y2) + self.thickness/2.
+
+
+
+def _silk_segment_count(shapes):
+  """Returns the number of ElementLine records written for the
+  silkscreen lines and polylines among some shapes."""
+  return sum(len(list(shape.segment_coords()))
+      if isinstance(shape, SilkPolyline) else 1
+      for shape in shapes if isinstance(shape, (SilkLine, SilkPolyline)))
+
+
+def _simplify_points(points, tolerance):
+  """Returns a list of the (x, y) points of an open polyline, without the
+  points within `tolerance` of the segment between the points kept on
+  either side of them. The first point is always kept, and so are at
+  least two points."""
+  result = [points[0]]
+  covered = []  # points since result[-2], up to and including result[-1]
+  for q in points[1:]:
+    a = result[-1]
+    if len(result) >= 2 and all(_point_segment_distance(*(r + result[-2] +
+        q)) <= tolerance for r in covered):
+      result[-1] = q
+      covered.append(q)
+    elif math.hypot(q[0] - a[0], q[1] - a[1]) <= tolerance:
+      covered.append(q)
+    else:
+      result.append(q)
+      covered = [q]
+  if len(result) == 1:
+    result.append(points[-1])
+  return result
 
 
 
 class SilkPolyline(Shape):
-  """A series of connected line segments on the silkscreen layer."""
+  """A series of connected line segments on the silkscreen layer.
+
+  The vertices are kept in a flat array of coordinates
+  (x0, y0, x1, y1, ...) rather than as one SilkLine per segment.
+  """
+
+  __slots__ = ("points", "closed", "thickness")
+  _geometry = ("points", "thickness")
+
+  # How coordinates are kept in `points`: as floating-point mils here;
+  # FixedSilkPolyline stores integer 1/100 mils instead.
+  _typecode = "d"
+  _unit = 1.0
+
+  @staticmethod
+  def _store(value):
+    return value
 
   def __init__(self, *points, **kwargs):
     """Polyline initializer.
@@ -384,30 +699,127 @@ class SilkPolyline(Shape):
     closed -- if True, an additional segment connects the first and last
       points
     """
-    thickness = kwargs.get("thickness", SilkLine.default_thickness)
-    self.segments = []
-    last_point = None
-    for x, y in points:
-      if last_point is not None:
-        self.segments.append(SilkLine(
-          last_point[0], last_point[1],
-          x, y,
-          thickness=thickness))
-      last_point = (x, y)
-    if kwargs.get("closed") is True:
-      self.segments.append(SilkLine(
-        last_point[0], last_point[1],
-        self.segments[0].x1, self.segments[0].y1,
-        thickness=thickness))
+    super(SilkPolyline, self).__init__()
+    self.thickness = kwargs.get("thickness", SilkLine.default_thickness)
+    self.points = array(self._typecode,
+        (self._store(c) for point in points for c in point))
+    self.closed = kwargs.get("closed") is True
+
+  def __len__(self):
+    """Returns the number of vertices."""
+    return len(self.points) // 2
+
+  def vertices(self):
+    """Returns a list of the (x, y) vertices, in mils."""
+    p, u = self.points, self._unit
+    return [(p[i]*u, p[i+1]*u) for i in range(0, len(p), 2)]
+
+  def segment_coords(self):
+    """Generates (x1, y1, x2, y2) for each segment, including the closing
+    segment of a closed polyline, in mils."""
+    p, u = self.points, self._unit
+    for i in range(0, len(p) - 2, 2):
+      yield p[i]*u, p[i+1]*u, p[i+2]*u, p[i+3]*u
+    if self.closed and len(p) >= 4:
+      yield p[-2]*u, p[-1]*u, p[0]*u, p[1]*u
+
+  @property
+  def segments(self):
+    """A list of SilkLine objects, one per segment. The lines are
+    created on demand; changing them does not change the polyline."""
+    return [SilkLine(x1, y1, x2, y2, thickness=self.thickness)
+        for x1, y1, x2, y2 in self.segment_coords()]
 
   def pcb_repr(self, tx, ty):
-    return "\n".join(s.pcb_repr(tx, ty) for s in self.segments)
+    return "\n".join(self.pcb_lines(tx, ty))
+
+  @property
+  def left(self):
+    """X coordinate of the polyline's left edge, including its
+    thickness."""
+    return min(self.points[0::2])*self._unit - self.thickness/2.
+
+  @property
+  def right(self):
+    """X coordinate of the polyline's right edge, including its
+    thickness."""
+    return max(self.points[0::2])*self._unit + self.thickness/2.
+
+  @property
+  def top(self):
+    """Y coordinate of the polyline's top edge, including its
+    thickness."""
+    return min(self.points[1::2])*self._unit - self.thickness/2.
+
+  @property
+  def bottom(self):
+    """Y coordinate of the polyline's bottom edge, including its
+    thickness."""
+    return max(self.points[1::2])*self._unit + self.thickness/2.
+
+  def bounds(self):
+    if not self.points:
+      return None
+    return self.left, self.top, self.right, self.bottom
+
+  def _transform(self, m, dx, dy):
+    a, b, c, d = m
+    dx, dy = self._store(dx), self._store(dy)
+    p = self.points
+    self.points = array(self._typecode, chain.from_iterable(
+        (a*x + b*y + dx, c*x + d*y + dy) for x, y in zip(p[0::2], p[1::2])))
+
+  def simplify(self, tolerance=0.01):
+    """Removes the vertices that do not change the polyline's shape:
+    repeated vertices, and vertices lying on the straight line between
+    their neighbours. Every vertex removed is within `tolerance` mils of
+    the simplified polyline, so the drawn outline stays the same.
+
+    Return value:
+    the number of vertices removed
+    """
+    p = self.points
+    count = len(p) // 2
+    if count < 2:
+      return 0
+    tolerance /= self._unit
+    points = _simplify_points(list(zip(p[0::2], p[1::2])), tolerance)
+    if self.closed and len(points) > 3:
+      # the closing segment can make the last vertex, or the first,
+      # redundant too
+      if math.hypot(points[-1][0] - points[0][0],
+          points[-1][1] - points[0][1]) <= tolerance:
+        points.pop()
+      if len(points) > 3 and _point_segment_distance(*(points[-1] +
+          points[-2] + points[0])) <= tolerance:
+        points.pop()
+      if len(points) > 3 and _point_segment_distance(*(points[0] +
+          points[-1] + points[1])) <= tolerance:
+        points.pop(0)
+    if len(points) < count:
+      self.points = array(self._typecode, chain.from_iterable(points))
+    return count - len(points)
+
+  def pcb_lines(self, tx=0, ty=0):
+    line = _PCB_FORMATS["ElementLine"]
+    return (line % fields for kind, fields in self.records(tx, ty))
+
+  def records(self, tx=0, ty=0):
+    thickness = _mil_to_unit(self.thickness)
+    return (("ElementLine", (
+        _mil_to_unit(x1+tx), _mil_to_unit(y1+ty),
+        _mil_to_unit(x2+tx), _mil_to_unit(y2+ty),
+        thickness)) for x1, y1, x2, y2 in self.segment_coords())
 
 
 
 class SilkArc(Shape):
   """An arc on the silkscreen layer."""
 
+  __slots__ = ("x", "y", "x_radius", "y_radius", "start_angle",
+      "delta_angle", "thickness")
+  _geometry = __slots__
+
   def __init__(self, x, y, **kwargs):
     """Arc initializer.
 
@@ -428,6 +840,7 @@ class SilkArc(Shape):
     radius -- specifies the arc radius on the x and y axes
     diameter -- specifies the arc diameter on the x and y axes
     """
+    super(SilkArc, self).__init__()
     self.x = x
     self.y = y
     self.x_radius = kwargs.get("x_radius")
@@ -463,248 +876,5194 @@ class SilkArc(Shape):
     """Sets the x and y diameters of the arc to the given value."""
     self.radius = value/2.
 
+  def point_at(self, angle):
+    """Returns the (x, y) point on the arc's center line at the given
+    angle, in degrees counterclockwise from negative x."""
+    a = math.radians(angle)
+    return (self.x - self.x_radius*math.cos(a),
+        self.y + self.y_radius*math.sin(a))
+
+  def _extent(self):
+    """Returns (left, top, right, bottom) of the arc's center line."""
+    start, delta = self.start_angle, self.delta_angle
+    if abs(delta) >= 360:
+      return (self.x - self.x_radius, self.y - self.y_radius,
+          self.x + self.x_radius, self.y + self.y_radius)
+    lo, hi = min(start, start+delta), max(start, start+delta)
+    angles = [lo, hi]
+    # the arc reaches an axis extreme at every multiple of 90 degrees it
+    # sweeps through
+    angles.extend(range(int(math.ceil(lo/90.))*90, int(hi)+1, 90))
+    points = [self.point_at(a) for a in angles]
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+  @property
+  def left(self):
+    """X coordinate of the arc's left edge, including its thickness."""
+    return self._extent()[0] - self.thickness/2.
+
+  @property
+  def top(self):
+    """Y coordinate of the arc's top edge, including its thickness."""
+    return self._extent()[1] - self.thickness/2.
+
+  @property
+  def right(self):
+    """X coordinate of the arc's right edge, including its thickness."""
+    return self._extent()[2] + self.thickness/2.
+
+  @property
+  def bottom(self):
+    """Y coordinate of the arc's bottom edge, including its
+    thickness."""
+    return self._extent()[3] + self.thickness/2.
+
   def pcb_repr(self, tx, ty):
-    return "ElementArc[%d %d %d %d %d %d %d]" % (
+    return _PCB_FORMATS["ElementArc"] % self.records(tx, ty)[0][1]
+
+  def records(self, tx=0, ty=0):
+    return (("ElementArc", (
         _mil_to_unit(self.x+tx), _mil_to_unit(self.y+ty),
         _mil_to_unit(self.x_radius), _mil_to_unit(self.y_radius),
         self.start_angle, self.delta_angle,
-        _mil_to_unit(self.thickness))
+        _mil_to_unit(self.thickness))),)
+
+  def _transform(self, m, dx, dy):
+    a, b, c, d = m
+    x, y = self.x, self.y
+    self.x, self.y = a*x + b*y + dx, c*x + d*y + dy
+    if a == 0:
+      self.x_radius, self.y_radius = self.y_radius, self.x_radius
+    # angles run counterclockwise on screen from negative x; a rotation
+    # by r adds r to them, and a mirror (x -> -x) maps a to 180 - a and
+    # reverses the sweep
+    rotation = _rotation_angle(m)
+    if a*d - b*c > 0:
+      self.start_angle = (self.start_angle + rotation) % 360
+    else:
+      self.start_angle = (rotation + 180 - self.start_angle) % 360
+      self.delta_angle = -self.delta_angle
 
 
 
-class Footprint(object):
-  """A footprint definition. (an "element" in pcb terms)
+class _ArrayElement(object):
+  """Mixin for a single pin or pad inside a PinArray/PadArray.
 
-  A footprint is composed of multiple shapes, defined in the classes
-  above.
+  Views hold no geometry of their own; every attribute listed in the
+  array's `columns` reads and writes the array's storage, so changes made
+  through a view are reflected in the array's output.
   """
 
-  def __init__(self, name, **kwargs):
-    """Footprint initializer.
-
-    Arguments:
-    name -- name of the component
+  __slots__ = ()
+
+  def __init__(self, shape_array, index):
+    self._array = shape_array
+    self._index = index
+
+  def __eq__(self, other):
+    return (isinstance(other, _ArrayElement) and
+        self._array is other._array and self._index == other._index)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def __hash__(self):
+    return hash((id(self._array), self._index))
+
+
+def _column(name, convert=None):
+  """Returns a property that maps an attribute of an array element view
+  onto the corresponding column of its array. If `convert` is given, it
+  is applied to values read from the column."""
+  def fget(self):
+    value = getattr(self._array, name)[self._index]
+    return value if convert is None else convert(value)
+  def fset(self, value):
+    getattr(self._array, name)[self._index] = value
+    if self._array._owner is not None:
+      self._array._owner._shape_changed(self._array, self._index)
+  return property(fget, fset)
+
+
+def _setting_column(name):
+  """Returns a property that maps a per-element setting, such as
+  `clearance`, onto its array's column of that name. Elements the
+  setting has not been given for hold None, and read the default from
+  the array's shape_class; deleting the setting restores the default."""
+  def fget(self):
+    value = getattr(self._array, name)[self._index]
+    if value is None:
+      return getattr(self._array.shape_class, name)
+    return value
+  def fset(self, value):
+    getattr(self._array, name)[self._index] = value
+  def fdel(self):
+    getattr(self._array, name)[self._index] = None
+  return property(fget, fset, fdel)
+
+
+def _number_column():
+  """Returns a property that maps the `number` attribute of an array
+  element view onto its array's `number` column, updating the owning
+  footprint's lookup table when it changes."""
+  def fget(self):
+    return self._array.number[self._index]
+  def fset(self, value):
+    numbers = self._array.number
+    old = numbers[self._index]
+    numbers[self._index] = value
+    if self._array._owner is not None:
+      self._array._owner._renumber(self._array, self._index, old, value)
+  return property(fget, fset)
+
+
+class _ShapeArray(Shape):
+  """Abstract base class for column-oriented arrays of pins or pads.
+
+  Subclasses define `columns` (the names of the per-element attributes,
+  each stored as a contiguous array or list named after the attribute),
+  `settings` (those of the columns that hold None where the element
+  uses the default from `shape_class`) and `element_class` (the view
+  type returned by indexing).
+  """
 
-    Keyword arguments:
-    description -- text description of the component
-    mark_x -- x coordinate of the element's "diamond" marker
-      (optional; defaults to 0)
-    mark_y -- y coordinate of the element's "diamond" marker
-      (optional; defaults to 0)
-    text_x -- x coordinate of the left edge of the text
-      (optional; defaults to 0)
-    text_y -- y coordinate of the top edge of the text
-      (optional; defaults to 0)
-    text_direction -- rotation of the text
-      (optional; 0=normal, 1=rotated 90 degrees left, 2=upside down,
-      3=rotated 270 degrees left; defaults to 0)
-    """
-    self.name = name
-    self.description = kwargs.get("description", "")
-    self.mark_x = 0
-    self.mark_y = 0
-    self.text_x = 0
-    self.text_y = 0
-    self.text_direction = 0
-    self.text_scale = 100
-    self.shapes = []
-    self.pinpadcounter = 1  # for pin/pad auto-numbering
+  __slots__ = ()
+
+  # elements changed through views update the spatial index themselves
+  _geometry = ()
+
+  columns = ()
+  settings = ()
+  element_class = None
+
+  # How lengths are kept in the columns: as floating-point mils here;
+  # fixed-point subclasses store integer 1/100 mils instead.
+  _typecode = "d"
+
+  @staticmethod
+  def _store(value):
+    """Converts a length in mils to the columns' representation."""
+    return value
+
+  @staticmethod
+  def _half(value):
+    """Halves a length in the columns' representation."""
+    return value/2.
+
+  def _step(self, step):
+    if isinstance(step, tuple):
+      return tuple(self._store(s) for s in step)
+    return self._store(step)
+
+  def __len__(self):
+    return len(self.number)
+
+  def __getitem__(self, index):
+    """Returns a view of the element at `index`, or a list of views if
+    `index` is a slice."""
+    if isinstance(index, slice):
+      return [self.element_class(self, i)
+          for i in range(*index.indices(len(self)))]
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError("%s index out of range" % type(self).__name__)
+    return self.element_class(self, index)
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self.element_class(self, i)
+
+  def elements(self):
+    return iter(self)
+
+  def _setting(self, name):
+    """Returns the values of a settings column, with the default from
+    shape_class in place of None."""
+    default = getattr(self.shape_class, name)
+    return [default if value is None else value
+        for value in getattr(self, name)]
+
+  def element_bounds(self):
+    return (element.bounds() for element in self)
 
-  def __enter__(self):
-    """Convenience to allow use of the `with` statement.
+  def pcb_repr(self, tx=0, ty=0):
+    return "\n".join(self.pcb_lines(tx, ty))
 
-    At the end of a `with` statement, the footprint is written to disk
-    if no exceptions are raised."""
-    return self
+  def pcb_lines(self, tx=0, ty=0):
+    """Yields the pcb representation of each element in turn."""
+    formats = _PCB_FORMATS
+    return (formats[kind] % fields for kind, fields in self.records(tx, ty))
 
-  def __exit__(self, type, value, traceback):
-    """Ends a `with` statement.
+  @classmethod
+  def grid(cls, rows, cols, pitch, depopulate=None, omit=None, **kwargs):
+    """Creates an array of elements on a rectangular grid.
 
-    If no exceptions were raised, the footprint is written to a file in
-    the current directoryl the `name` property is used as the filename,
-    and the `.fp` extension is appended.
+    See Footprint.add_pad_grid() for a description of the arguments.
     """
-    if type is None and self.name:
-      self.write(self.name + ".fp")
-
-  def __getitem__(self, number):
-    """Returns the pin or pad with the given number attribute.
-
-    This may not correspond to the actual index of the pin or pad in the
-    shapes array. Returns None if there is no matching pin or pad."""
-    try:
-      return next(s for s in self.shapes if getattr(s, "number", None) == number) 
-    except StopIteration:
-      return None
-
-  def add_pad(self, **kwargs):
-    """Adds a pad to the footprint.
+    x = kwargs.setdefault("x", 0)
+    y = kwargs.setdefault("y", 0)
+    first = cls.shape_class(**kwargs)
+    px, py = pitch if isinstance(pitch, tuple) else (pitch, pitch)
+    typecode, store = cls._typecode, cls._store
+    xs = _positions(store(x), store(px), cols, typecode) * rows
+    ys = array(typecode, chain.from_iterable(repeat(v, cols)
+        for v in _positions(store(y), store(py), rows, typecode)))
+    numbers = ["%s%d" % (row, col) for row in _ball_rows(rows)
+        for col in range(1, cols+1)]
+    if depopulate is not None or omit is not None:
+      keep = _grid_keep(rows, cols, depopulate, omit)
+      xs = array(typecode, compress(xs, keep))
+      ys = array(typecode, compress(ys, keep))
+      numbers = list(compress(numbers, keep))
+    shape_array = cls.__new__(cls)
+    Shape.__init__(shape_array)
+    shape_array._set_columns(first, xs, ys, numbers)
+    return shape_array
+
+  @staticmethod
+  def _numbers(first, count):
+    return list(range(first, first + count))
+
+  @staticmethod
+  def _fill(typecode, value, count):
+    return array(typecode, (value,)) * count
+
+
+
+class PadArray(_ShapeArray):
+  """A row of surface-mount pads stored column-wise.
+
+  Rather than one Pad object per pad, the edges, sizes, names and numbers
+  of all pads are held in contiguous arrays. Indexing returns a view that
+  behaves like a Pad (it has the same `left/right/x/top/bottom/y`
+  properties and can be used as a `base`), and whose attributes read and
+  write the array's columns.
+  """
 
-    Keyword arguments:
-    same as those for Pad.__init__()
+  # `name` is stored in the slot inherited from Shape
+  __slots__ = ("left", "top", "width", "height", "number", "round",
+      "clearance")
 
-    Return value:
-    the added pad
+  columns = ("left", "top", "width", "height", "number", "name", "round",
+      "clearance")
+  settings = ("clearance",)
 
-    If `base` and `number` are not specified, the current pin/pad number
-    is assigned to the `number` attribute and incremented.
-    """
-    if not "base" in kwargs:
-      kwargs["number"] = kwargs.get("number", self.pinpadcounter)
-    pad = Pad(**kwargs)
-    self.shapes.append(pad)
-    self.pinpadcounter += 1
-    return pad
+  def __init__(self, count, **kwargs):
+    """PadArray initializer.
 
-  def add_pin(self, **kwargs):
-    """Adds a pin to the footprint.
+    Arguments:
+    count -- number of pads
 
     Keyword arguments:
-    same as those for Pin.__init__()
+    same as those for Footprint.add_pads(); the keyword arguments for
+    Pad.__init__() describe the first pad, and the remaining pads are
+    offset from it by `dx` and `dy`.
+    """
+    super(PadArray, self).__init__()
+    first = self.shape_class(**kwargs)
+    x = kwargs.get("x")
+    y = kwargs.get("y")
+    xs = _positions(self._store(first.x if x is None else x),
+        self._step(kwargs.get("dx", 0)), count, self._typecode)
+    ys = _positions(self._store(first.y if y is None else y),
+        self._step(kwargs.get("dy", 0)), count, self._typecode)
+    self._set_columns(first, xs, ys,
+        self._numbers(kwargs.get("number", 1), count))
+
+  def _set_columns(self, first, xs, ys, numbers):
+    """Fills in the columns from a prototype pad and arrays of center
+    coordinates (in the columns' representation)."""
+    count = len(numbers)
+    typecode, half = self._typecode, self._half
+    width, height = self._store(first.width), self._store(first.height)
+    self.left = array(typecode, (v - half(width) for v in xs))
+    self.top = array(typecode, (v - half(height) for v in ys))
+    self.width = self._fill(typecode, width, count)
+    self.height = self._fill(typecode, height, count)
+    self.number = numbers
+    self.name = [first.name] * count
+    self.round = self._fill("B", bool(first.round), count)
+    self.clearance = [None] * count
+
+  def bounds(self):
+    if not len(self):
+      return None
+    return (min(self.left), min(self.top),
+        max(l + w for l, w in zip(self.left, self.width)),
+        max(t + h for t, h in zip(self.top, self.height)))
+
+  def element_bounds(self):
+    return ((l, t, l + w, t + h) for l, t, w, h in
+        zip(self.left, self.top, self.width, self.height))
+
+  def records(self, tx=0, ty=0):
+    return (("Pad", _pad_fields(left, top, width, height, clearance, name,
+        number, round, tx, ty)) for left, top, width, height, clearance,
+        name, number, round in zip(self.left, self.top, self.width,
+        self.height, self._setting("clearance"), self.name, self.number,
+        self.round))
+
+  def _transform(self, m, dx, dy):
+    columns = self.left, self.top, self.width, self.height
+    self.left, self.width = self._transform_extent(m[0], m[1], columns,
+        self._store(dx))
+    self.top, self.height = self._transform_extent(m[2], m[3], columns,
+        self._store(dy))
+
+  def _transform_extent(self, p, q, columns, offset):
+    """Column-wise version of _transform_extent()."""
+    low, size, scale = ((columns[0], columns[2], p) if p else
+        (columns[1], columns[3], q))
+    if scale > 0:
+      return array(self._typecode, (offset + v for v in low)), size
+    return array(self._typecode,
+        (offset - v - s for v, s in zip(low, size))), size
+
+
+
+class PinArray(_ShapeArray):
+  """A row of plated-through holes stored column-wise.
+
+  Rather than one Pin object per hole, the centers, sizes, names and
+  numbers of all pins are held in contiguous arrays. Indexing returns a
+  view that behaves like a Pin (it has the same `left/right/top/bottom`
+  properties and can be used as a `base`), and whose attributes read and
+  write the array's columns.
+  """
 
-    Return value:
-    the added pin
+  # `name` is stored in the slot inherited from Shape
+  __slots__ = ("x", "y", "hole", "diameter", "number", "round",
+      "clearance", "mask_offset")
 
-    If `base` and `number` are not specified, the current pin/pad number
-    is assigned to the `number` attribute and incremented.
-    """
-    if not "base" in kwargs:
-      kwargs["number"] = kwargs.get("number", self.pinpadcounter)
-    pin = Pin(**kwargs)
-    self.shapes.append(pin)
-    self.pinpadcounter += 1
-    return pin
+  columns = ("x", "y", "hole", "diameter", "number", "name", "round",
+      "clearance", "mask_offset")
+  settings = ("clearance", "mask_offset")
 
-  def add_pads(self, count, **kwargs):
-    """Adds multiple pads at given intervals.
+  def __init__(self, count, **kwargs):
+    """PinArray initializer.
 
     Arguments:
-    count -- number of pads to add
+    count -- number of pins
 
     Keyword arguments:
-    x -- x coordinate of the center of the first pad
-    y -- y coordinate of the center of the first pad
-    dx -- amount to step in the x direction after placing a pad
-    dy -- amount to step in the y direction after placing a pad
-    width -- width of each pad
-    height -- height of each pad
-
-    Return value:
-    array of the added pads
-
-    To place staggered pads, a tuple of length >= 2 may be specified for
-    `dx` and/or `dy`. In the case of a 2-element tuple, the first
-    element is used as the step value after placing every odd pad, and
-    the second element is used as the step value after placing every
-    even pad.
+    same as those for Footprint.add_pins(); the keyword arguments for
+    Pin.__init__() describe the first pin, and the remaining pins are
+    offset from it by `dx` and `dy`.
     """
-    return self.__add_shapes(count, self.add_pad, **kwargs)
+    super(PinArray, self).__init__()
+    first = self.shape_class(**kwargs)
+    self._set_columns(first,
+        _positions(self._store(first.x), self._step(kwargs.get("dx", 0)),
+            count, self._typecode),
+        _positions(self._store(first.y), self._step(kwargs.get("dy", 0)),
+            count, self._typecode),
+        self._numbers(kwargs.get("number", 1), count))
+
+  def _set_columns(self, first, xs, ys, numbers):
+    """Fills in the columns from a prototype pin and arrays of center
+    coordinates (in the columns' representation)."""
+    count = len(numbers)
+    typecode = self._typecode
+    self.x = xs
+    self.y = ys
+    self.hole = self._fill(typecode, self._store(first.hole), count)
+    self.diameter = self._fill(typecode, self._store(first.diameter), count)
+    self.number = numbers
+    self.name = [first.name] * count
+    self.round = self._fill("B", bool(first.round), count)
+    self.clearance = [None] * count
+    self.mask_offset = [None] * count
+
+  def bounds(self):
+    if not len(self):
+      return None
+    return (min(x - d/2. for x, d in zip(self.x, self.diameter)),
+        min(y - d/2. for y, d in zip(self.y, self.diameter)),
+        max(x + d/2. for x, d in zip(self.x, self.diameter)),
+        max(y + d/2. for y, d in zip(self.y, self.diameter)))
+
+  def element_bounds(self):
+    return ((x - d/2., y - d/2., x + d/2., y + d/2.) for x, y, d in
+        zip(self.x, self.y, self.diameter))
+
+  def records(self, tx=0, ty=0):
+    return (("Pin", _pin_fields(x, y, hole, diameter, clearance,
+        mask_offset, name, number, round, tx, ty)) for x, y, hole, diameter,
+        clearance, mask_offset, name, number, round in zip(self.x, self.y,
+        self.hole, self.diameter, self._setting("clearance"),
+        self._setting("mask_offset"), self.name, self.number, self.round))
+
+  def _transform(self, m, dx, dy):
+    a, b, c, d = m
+    dx, dy = self._store(dx), self._store(dy)
+    xs, ys = self.x, self.y
+    self.x = array(self._typecode, (a*x + b*y + dx for x, y in zip(xs, ys)))
+    self.y = array(self._typecode, (c*x + d*y + dy for x, y in zip(xs, ys)))
+
+
+
+class _PadArrayElement(_ArrayElement, Pad):
+  """A single pad inside a PadArray."""
+  __slots__ = ("_array", "_index")
+  left = _column("left")
+  top = _column("top")
+  width = _column("width")
+  height = _column("height")
+  number = _number_column()
+  name = _column("name")
+  round = _column("round", bool)
+  clearance = _setting_column("clearance")
+
+PadArray.element_class = _PadArrayElement
+PadArray.shape_class = Pad
+
+
+class _PinArrayElement(_ArrayElement, Pin):
+  """A single pin inside a PinArray."""
+  __slots__ = ("_array", "_index")
+  x = _column("x")
+  y = _column("y")
+  hole = _column("hole")
+  diameter = _column("diameter")
+  number = _number_column()
+  name = _column("name")
+  round = _column("round", bool)
+  clearance = _setting_column("clearance")
+  mask_offset = _setting_column("mask_offset")
+
+PinArray.element_class = _PinArrayElement
+PinArray.shape_class = Pin
+
+
+# Letters used for ball grid array rows (JEDEC omits I, O, Q, S, X and Z)
+_BALL_ROW_LETTERS = "ABCDEFGHJKLMNPRTUVWY"
+
+def _ball_rows(count):
+  """Returns the names of the first `count` rows of a ball grid array:
+  A, B, ... Y, then AA, AB, ... AY, BA, ..."""
+  letters = _BALL_ROW_LETTERS
+  n = len(letters)
+  names = list(letters[:count])
+  for i in range(n, count):
+    i -= n
+    if i >= n*n:
+      raise ValueError("too many rows for ball grid naming")
+    names.append(letters[i // n] + letters[i % n])
+  return names
+
+
+def _grid_keep(rows, cols, depopulate, omit):
+  """Returns a row-major list of flags, one per grid position, that are
+  True for the positions that are populated."""
+  if depopulate is not None:
+    if len(depopulate) != rows or any(len(r) != cols for r in depopulate):
+      raise ValueError("depopulation mask must be %d rows of %d columns" %
+          (rows, cols))
+    keep = [not removed for row in depopulate for removed in row]
+  else:
+    keep = [True] * (rows*cols)
+  if omit:
+    row_index = dict((name, i) for i, name in enumerate(_ball_rows(rows)))
+    for ball in omit:
+      if isinstance(ball, tuple):
+        row, col = ball
+      else:
+        match = re.match(r"([A-Z]+)([0-9]+)$", ball)
+        if match is None or match.group(1) not in row_index:
+          raise ValueError("invalid ball name: %s" % ball)
+        row, col = row_index[match.group(1)], int(match.group(2)) - 1
+      if not (0 <= row < rows and 0 <= col < cols):
+        raise ValueError("ball %s is outside the grid" % (ball,))
+      keep[row*cols + col] = False
+  return keep
+
+
+
+class _Centimils(object):
+  """Descriptor for a length that is stored as an integer number of
+  1/100 mils in another attribute, and read and written in mils.
+
+  The value is rounded to the nearest 1/100 mil once, when it is set.
+  """
 
-  def add_pins(self, count, **kwargs):
-    """Adds multiple pins at given intervals.
+  __slots__ = ("attr",)
 
-    Arguments:
-    count -- number of pins to add
+  def __init__(self, attr):
+    self.attr = attr
 
-    Keyword arguments:
-    x -- x coordinate of the center of the first pin
-    y -- y coordinate of the center of the first pin
-    dx -- amount to step in the x direction after placing a pin
-    dy -- amount to step in the y direction after placing a pin
-    hole -- diameter of each pin's drill hole
-    diameter -- outer diameter of each pin's copper annulus
+  def __get__(self, obj, cls=None):
+    if obj is None:
+      return self
+    value = getattr(obj, self.attr)
+    return None if value is None else value / 100.
 
-    Return value:
-    array of the added pins
+  def __set__(self, obj, value):
+    setattr(obj, self.attr, None if value is None else _mil_to_unit(value))
 
-    To place staggered pins, a tuple of length >= 2 may be specified for
-    `dx` and/or `dy`. In the case of a 2-element tuple, the first
-    element is used as the step value after placing every odd pin, and
-    the second element is used as the step value after placing every
-    even pin.
-    """
-    return self.__add_shapes(count, self.add_pin, **kwargs)
-
-  def __add_shapes(self, count, fn, **kwargs):
-    added_shapes = []
-    number = kwargs.get("number", self.pinpadcounter)
-    dx = kwargs.get("dx", 0)
-    dy = kwargs.get("dy", 0)
-    for i in range(0, count):
-      kwargs["number"] = number
-      added_shapes.append(fn(**kwargs))
-      kwargs["x"] += dx if not isinstance(dx, tuple) else dx[i % len(dx)]
-      kwargs["y"] += dy if not isinstance(dy, tuple) else dy[i % len(dy)]
-      number += 1
-    return added_shapes
 
-  def add_line(self, *args, **kwargs):
-    """Adds a line to the silkscreen layer.
+def _fixed_pad_fields(left, top, width, height, clearance, name, number,
+    round, tx=0, ty=0):
+  """Returns the fields of the "Pad" record of a pad whose edges and size
+  (and the translation) are integers in 1/100 mils. The pad's center is its
+  left/top edge plus half its width/height, rounded down."""
+  if width > height:
+    thickness = height
+    x1 = left + (thickness >> 1)
+    x2 = left + width - thickness + (thickness >> 1)
+    y1 = y2 = top + (height >> 1)
+  else:
+    thickness = width
+    x1 = x2 = left + (width >> 1)
+    y1 = top + (thickness >> 1)
+    y2 = top + height - thickness + (thickness >> 1)
+  return (x1+tx, y1+ty, x2+tx, y2+ty, thickness, clearance,
+      thickness + clearance, name, number, 0 if round else 0x100)
 
-    Arguments:
-    same as those for SilkLine.__init__()
 
-    Keyword arguments:
-    same as those for SilkLine.__init__()
+def _fixed_pad_repr(*args):
+  """Returns the pcb representation of a pad; takes the same arguments
+  as _fixed_pad_fields()."""
+  return _PCB_FORMATS["Pad"] % _fixed_pad_fields(*args)
 
-    Return value:
-    the added line
-    """
-    line = SilkLine(*args, **kwargs)
-    self.shapes.append(line)
-    return line
 
-  def add_polyline(self, *args, **kwargs):
-    """Adds a polyline to the silkscreen layer.
+def _fixed_pin_fields(x, y, hole, diameter, clearance, mask_offset, name,
+    number, round, tx=0, ty=0):
+  """Returns the fields of the "Pin" record of a pin whose center and
+  size (and the translation) are integers in 1/100 mils."""
+  return (x+tx, y+ty, diameter, clearance, diameter + mask_offset, hole,
+      name, number, 0x1 | (0 if round else 0x100))
 
-    Arguments:
-    same as those for SilkPolyline.__init__()
 
-    Keyword arguments:
-    same as those for SilkPolyline.__init__()
+def _fixed_pin_repr(*args):
+  """Returns the pcb representation of a pin; takes the same arguments
+  as _fixed_pin_fields()."""
+  return _PCB_FORMATS["Pin"] % _fixed_pin_fields(*args)
 
-    Return value:
-    the added polyline
-    """
-    pline = SilkPolyline(*args, **kwargs)
-    self.shapes.append(pline)
-    return pline
 
-  def add_arc(self, *args, **kwargs):
-    """Adds an arc to the silkscreen layer.
 
-    Arguments:
-    same as those for SilkArc.__init__()
+class FixedPad(Pad):
+  """A Pad whose geometry is stored as integers in pcb's native units.
 
-    Keyword arguments:
-    same as those for SilkArc.__init__()
+  Lengths are read and written in mils like those of a Pad, but are
+  rounded to the nearest 1/100 mil when set. Edges and centers are then
+  computed with exact integer arithmetic, so chains of relative
+  placements do not accumulate floating-point error, and the pad is
+  written out without any further rounding. The center of a pad with an
+  odd size is half a unit to the left of/above its true center.
+  """
 
-    Return value:
-    the added arc
-    """
-    arc = SilkArc(*args, **kwargs)
-    self.shapes.append(arc)
-    return arc
+  __slots__ = ("_left", "_top", "_width", "_height")
+  _geometry = __slots__
 
-  def mark(self, pin_or_pad):
-    """Sets the mark position to the center of the given pin or pad."""
-    self.mark_x = pin_or_pad.x
-    self.mark_y = pin_or_pad.y
+  left = _Centimils("_left")
+  top = _Centimils("_top")
+  width = _Centimils("_width")
+  height = _Centimils("_height")
+
+  def pcb_repr(self, tx=0, ty=0):
+    return _fixed_pad_repr(self._left, self._top, self._width, self._height,
+        _mil_to_unit(self.clearance), self.name, self.number, self.round,
+        _mil_to_unit(tx), _mil_to_unit(ty))
+
+  def records(self, tx=0, ty=0):
+    return (("Pad", _fixed_pad_fields(self._left, self._top, self._width,
+        self._height, _mil_to_unit(self.clearance), self.name, self.number,
+        self.round, _mil_to_unit(tx), _mil_to_unit(ty))),)
+
+  @property
+  def right(self):
+    """X coordinate of the pad's right edge."""
+    return (self._left + self._width) / 100.
+  @right.setter
+  def right(self, value):
+    """Sets the x coordinate of the pad's right edge."""
+    if self._width is not None:
+      self._left = _mil_to_unit(value) - self._width
+    else:
+      self._width = _mil_to_unit(value) - self._left
+
+  @property
+  def x(self):
+    """Coordinate of the pad's center on the x axis."""
+    return (self._left + (self._width >> 1)) / 100.
+  @x.setter
+  def x(self, value):
+    """Sets the coordinate of the pad's center on the x axis."""
+    self._left = _mil_to_unit(value) - (self._width >> 1)
+
+  @property
+  def bottom(self):
+    """Y coordinate of the pad's bottom edge."""
+    return (self._top + self._height) / 100.
+  @bottom.setter
+  def bottom(self, value):
+    """Sets the y coordinate of the pad's bottom edge."""
+    if self._height is not None:
+      self._top = _mil_to_unit(value) - self._height
+    else:
+      self._height = _mil_to_unit(value) - self._top
+
+  @property
+  def y(self):
+    """Coordinate of the pad's center on the y axis."""
+    return (self._top + (self._height >> 1)) / 100.
+  @y.setter
+  def y(self, value):
+    """Sets the coordinate of the pad's center on the y axis."""
+    self._top = _mil_to_unit(value) - (self._height >> 1)
+
+
+
+class FixedPin(Pin):
+  """A Pin whose geometry is stored as integers in pcb's native units.
+
+  See FixedPad. The edges of a pin with an odd diameter are computed
+  from its center minus half the diameter, rounded down.
+  """
+
+  __slots__ = ("_x", "_y", "_hole", "_diameter")
+  _geometry = __slots__
+
+  x = _Centimils("_x")
+  y = _Centimils("_y")
+  hole = _Centimils("_hole")
+  diameter = _Centimils("_diameter")
+
+  def pcb_repr(self, tx=0, ty=0):
+    return _fixed_pin_repr(self._x, self._y, self._hole, self._diameter,
+        _mil_to_unit(self.clearance), _mil_to_unit(self.mask_offset),
+        self.name, self.number, self.round,
+        _mil_to_unit(tx), _mil_to_unit(ty))
+
+  def records(self, tx=0, ty=0):
+    return (("Pin", _fixed_pin_fields(self._x, self._y, self._hole,
+        self._diameter, _mil_to_unit(self.clearance),
+        _mil_to_unit(self.mask_offset), self.name, self.number, self.round,
+        _mil_to_unit(tx), _mil_to_unit(ty))),)
+
+  @property
+  def left(self):
+    """X coordinate of the copper annulus' outer left edge."""
+    return (self._x - (self._diameter >> 1)) / 100.
+  @left.setter
+  def left(self, value):
+    """Sets the x coordinate of the copper annulus' outer left edge."""
+    self._x = _mil_to_unit(value) + (self._diameter >> 1)
+
+  @property
+  def right(self):
+    """X coordinate of the copper annulus' outer right edge."""
+    return (self._x - (self._diameter >> 1) + self._diameter) / 100.
+  @right.setter
+  def right(self, value):
+    """Sets the x coordinate of the copper annulus' outer right edge."""
+    self._x = _mil_to_unit(value) - self._diameter + (self._diameter >> 1)
+
+  @property
+  def top(self):
+    """Y coordinate of the copper annulus' outer top edge."""
+    return (self._y - (self._diameter >> 1)) / 100.
+  @top.setter
+  def top(self, value):
+    """Sets the y coordinate of the copper annulus' outer top edge."""
+    self._y = _mil_to_unit(value) + (self._diameter >> 1)
+
+  @property
+  def bottom(self):
+    """Y coordinate of the copper annulus' outer bottom edge."""
+    return (self._y - (self._diameter >> 1) + self._diameter) / 100.
+  @bottom.setter
+  def bottom(self, value):
+    """Sets the y coordinate of the copper annulus' outer bottom edge."""
+    self._y = _mil_to_unit(value) - self._diameter + (self._diameter >> 1)
+
+
+
+class FixedSilkLine(SilkLine):
+  """A SilkLine whose geometry is stored as integers in pcb's native
+  units. See FixedPad."""
+
+  __slots__ = ("_x1", "_y1", "_x2", "_y2", "_thickness")
+  _geometry = __slots__
+
+  x1 = _Centimils("_x1")
+  y1 = _Centimils("_y1")
+  x2 = _Centimils("_x2")
+  y2 = _Centimils("_y2")
+  thickness = _Centimils("_thickness")
+
+  def records(self, tx=0, ty=0):
+    tx, ty = _mil_to_unit(tx), _mil_to_unit(ty)
+    return (("ElementLine", (self._x1+tx, self._y1+ty, self._x2+tx,
+        self._y2+ty, self._thickness)),)
+
+
+
+class FixedSilkPolyline(SilkPolyline):
+  """A SilkPolyline whose vertices are stored as integers in pcb's
+  native units. See FixedPad."""
+
+  __slots__ = ("_thickness",)
+  _geometry = __slots__
+
+  _typecode = "q"
+  _unit = 0.01
+  thickness = _Centimils("_thickness")
+
+  @staticmethod
+  def _store(value):
+    return _mil_to_unit(value)
+
+  def records(self, tx=0, ty=0):
+    tx, ty = _mil_to_unit(tx), _mil_to_unit(ty)
+    thickness = self._thickness
+    p = self.points
+    coords = [(p[i], p[i+1], p[i+2], p[i+3]) for i in range(0, len(p)-2, 2)]
+    if self.closed and len(p) >= 4:
+      coords.append((p[-2], p[-1], p[0], p[1]))
+    return (("ElementLine", (x1+tx, y1+ty, x2+tx, y2+ty, thickness))
+        for x1, y1, x2, y2 in coords)
+
+
+
+class FixedSilkArc(SilkArc):
+  """A SilkArc whose geometry is stored as integers in pcb's native
+  units. See FixedPad."""
+
+  __slots__ = ("_x", "_y", "_x_radius", "_y_radius", "_thickness")
+  _geometry = __slots__
+
+  x = _Centimils("_x")
+  y = _Centimils("_y")
+  x_radius = _Centimils("_x_radius")
+  y_radius = _Centimils("_y_radius")
+  thickness = _Centimils("_thickness")
+
+  def records(self, tx=0, ty=0):
+    return (("ElementArc", (
+        self._x + _mil_to_unit(tx), self._y + _mil_to_unit(ty),
+        self._x_radius, self._y_radius,
+        self.start_angle, self.delta_angle, self._thickness)),)
+
+
+
+class FixedPadArray(PadArray):
+  """A PadArray whose columns hold integers in pcb's native units. See
+  FixedPad."""
+
+  __slots__ = ()
+
+  _typecode = "q"
+
+  @staticmethod
+  def _store(value):
+    return _mil_to_unit(value)
+
+  @staticmethod
+  def _half(value):
+    return value >> 1
+
+  def bounds(self):
+    bounds = super(FixedPadArray, self).bounds()
+    return None if bounds is None else tuple(b / 100. for b in bounds)
+
+  def element_bounds(self):
+    return ((l / 100., t / 100., (l + w) / 100., (t + h) / 100.)
+        for l, t, w, h in zip(self.left, self.top, self.width, self.height))
+
+  def records(self, tx=0, ty=0):
+    tx, ty = _mil_to_unit(tx), _mil_to_unit(ty)
+    return (("Pad", _fixed_pad_fields(left, top, width, height, clearance,
+        name, number, round, tx, ty)) for left, top, width, height,
+        clearance, name, number, round in zip(self.left, self.top,
+        self.width, self.height, map(_mil_to_unit, self._setting("clearance")),
+        self.name, self.number, self.round))
+
+
+
+class FixedPinArray(PinArray):
+  """A PinArray whose columns hold integers in pcb's native units. See
+  FixedPad."""
+
+  __slots__ = ()
+
+  _typecode = "q"
+
+  @staticmethod
+  def _store(value):
+    return _mil_to_unit(value)
+
+  @staticmethod
+  def _half(value):
+    return value >> 1
+
+  def bounds(self):
+    if not len(self):
+      return None
+    return (min(x - (d >> 1) for x, d in zip(self.x, self.diameter)) / 100.,
+        min(y - (d >> 1) for y, d in zip(self.y, self.diameter)) / 100.,
+        max(x - (d >> 1) + d for x, d in zip(self.x, self.diameter)) / 100.,
+        max(y - (d >> 1) + d for y, d in zip(self.y, self.diameter)) / 100.)
+
+  def element_bounds(self):
+    for x, y, d in zip(self.x, self.y, self.diameter):
+      left, top = x - (d >> 1), y - (d >> 1)
+      yield left / 100., top / 100., (left + d) / 100., (top + d) / 100.
+
+  def records(self, tx=0, ty=0):
+    tx, ty = _mil_to_unit(tx), _mil_to_unit(ty)
+    return (("Pin", _fixed_pin_fields(x, y, hole, diameter, clearance,
+        mask_offset, name, number, round, tx, ty)) for x, y, hole, diameter,
+        clearance, mask_offset, name, number, round in zip(self.x, self.y,
+        self.hole, self.diameter,
+        map(_mil_to_unit, self._setting("clearance")),
+        map(_mil_to_unit, self._setting("mask_offset")), self.name,
+        self.number, self.round))
+
+
+
+class _FixedPadArrayElement(_ArrayElement, FixedPad):
+  """A single pad inside a FixedPadArray."""
+  __slots__ = ("_array", "_index")
+  _left = _column("left")
+  _top = _column("top")
+  _width = _column("width")
+  _height = _column("height")
+  number = _number_column()
+  name = _column("name")
+  round = _column("round", bool)
+  clearance = _setting_column("clearance")
+
+FixedPadArray.element_class = _FixedPadArrayElement
+FixedPadArray.shape_class = FixedPad
+
+
+class _FixedPinArrayElement(_ArrayElement, FixedPin):
+  """A single pin inside a FixedPinArray."""
+  __slots__ = ("_array", "_index")
+  _x = _column("x")
+  _y = _column("y")
+  _hole = _column("hole")
+  _diameter = _column("diameter")
+  number = _number_column()
+  name = _column("name")
+  round = _column("round", bool)
+  clearance = _setting_column("clearance")
+  mask_offset = _setting_column("mask_offset")
+
+FixedPinArray.element_class = _FixedPinArrayElement
+FixedPinArray.shape_class = FixedPin
+
+
+
+class _Tracked(float):
+  """A length read from a shape in a footprint that tracks dependencies.
+
+  Besides its value, it remembers the (shape, attribute) pairs it was
+  computed from and how to compute it again, and arithmetic on it
+  produces new _Tracked values, so that an expression like
+  `p1.right + 6.2*mm` can be re-evaluated when p1 changes.
+  """
+
+  __slots__ = ("compute", "sources")
+
+  def __new__(cls, value, compute, sources):
+    self = float.__new__(cls, value)
+    self.compute = compute
+    self.sources = sources
+    return self
+
+  def __reduce__(self):
+    # copies and pickles are plain numbers
+    return float, (float(self),)
+
+
+def _lift(value):
+  """Returns (compute function, sources) for a tracked or plain value."""
+  if isinstance(value, _Tracked):
+    return value.compute, value.sources
+  return (lambda: value), ()
+
+def _tracked_operator(op, reflected=False):
+  def method(self, other):
+    if not isinstance(other, (int, float)):
+      return NotImplemented
+    a, b = (other, self) if reflected else (self, other)
+    (fa, sa), (fb, sb) = _lift(a), _lift(b)
+    return _Tracked(op(float(a), float(b)), lambda: op(fa(), fb()), sa + sb)
+  return method
+
+def _tracked_unary(op):
+  def method(self):
+    f = self.compute
+    return _Tracked(op(float(self)), lambda: op(f()), self.sources)
+  return method
+
+for _name in ("add", "sub", "mul", "truediv"):
+  _op = getattr(operator, _name)
+  setattr(_Tracked, "__%s__" % _name, _tracked_operator(_op))
+  setattr(_Tracked, "__r%s__" % _name, _tracked_operator(_op, True))
+for _name in ("neg", "pos", "abs"):
+  _op = getattr(operator, _name)
+  setattr(_Tracked, "__%s__" % _name, _tracked_unary(_op))
+del _name, _op
+
+
+# The attributes whose values dependent shapes record as formulas, and
+# the properties computed from them: each property maps to the
+# attribute its setter writes and the other attribute it reads, except
+# those in _SHARED_ATTRS, whose setters write the same value, times the
+# given factor, to both attributes.
+_DEPENDENT_ATTRS = ((Pad, ("left", "top", "width", "height")),
+    (Pin, ("x", "y", "hole", "diameter")),
+    (SilkLine, ("x1", "y1", "x2", "y2", "thickness")),
+    (SilkPolyline, ("thickness",)),
+    (SilkArc, ("x", "y", "x_radius", "y_radius", "start_angle",
+        "delta_angle", "thickness")))
+_DERIVED_ATTRS = ((Pad, {"right": ("left", "width"), "x": ("left", "width"),
+    "bottom": ("top", "height"), "y": ("top", "height")}),
+    (Pin, {"left": ("x", "diameter"), "right": ("x", "diameter"),
+    "top": ("y", "diameter"), "bottom": ("y", "diameter")}),
+    (SilkArc, {"radius": ("x_radius", "y_radius"),
+    "diameter": ("x_radius", "y_radius")}))
+_SHARED_ATTRS = ((SilkArc, {"radius": 1, "diameter": 0.5}),)
+
+_dependent_classes = {}
+
+# True while values are being set without recording formulas or
+# recomputing dependents; see _assign().
+_assigning = False
+
+def _dependent_class(cls):
+  """Returns a subclass of the shape class `cls` that records the
+  dependencies between its values and those of other shapes.
+
+  Reading one of the shape's lengths returns a _Tracked value. When one
+  is assigned to a length of another dependent shape, that shape keeps
+  the value's formula and registers itself as a dependent of its
+  sources; assigning to a source later recomputes its dependents (and
+  theirs, in dependency order). Assigning a plain number, or a formula
+  that would make a value depend on itself (e.g. `p.x = p.x + 10`),
+  just sets the value.
+  """
+  dependent = _dependent_classes.get(cls)
+  if dependent is not None:
+    return dependent
+  attrs = frozenset(next(a for c, a in _DEPENDENT_ATTRS if issubclass(cls, c)))
+  derived = next((d for c, d in _DERIVED_ATTRS if issubclass(cls, c)), {})
+  shared = next((s for c, s in _SHARED_ATTRS if issubclass(cls, c)), {})
+
+  def __getattribute__(self, name):
+    value = object.__getattribute__(self, name)
+    if not isinstance(value, (int, float)):
+      return value
+    if name in attrs:
+      return _Tracked(value, lambda: object.__getattribute__(self, name),
+          ((self, name),))
+    if name in derived:
+      fget = getattr(cls, name).fget
+      return _Tracked(value, lambda: float(fget(self)),
+          tuple((self, attr) for attr in derived[name]))
+    return value
+
+  def __setattr__(self, name, value):
+    if _assigning or name not in attrs and name not in derived:
+      if isinstance(value, _Tracked):
+        value = float(value)
+      return cls.__setattr__(self, name, value)
+    if name in attrs:
+      _unbind(self, name)
+      if isinstance(value, _Tracked):
+        _bind(self, name, value)
+        value = float(value)
+      _assign(cls.__setattr__, self, name, value)
+      _recompute(_dependents_of(((self, name),), ordered=True))
+      return
+    if name in shared:
+      # e.g. an arc's radius, which sets both of its radii
+      for attr in derived[name]:
+        setattr(self, attr, value * shared[name])
+      return
+    target, other = derived[name]
+    if object.__getattribute__(self, other) is None:
+      # the setter computes `other` instead, e.g. a pad's width from its
+      # left and right edges
+      if isinstance(value, _Tracked):
+        return setattr(self, other, value - getattr(self, target))
+      target = other
+    _unbind(self, target)
+    fset = getattr(cls, name).fset
+    _assign(fset, self, float(value) if isinstance(value, _Tracked) else value)
+    if isinstance(value, _Tracked):
+      def compute():
+        _assign(fset, self, value.compute())
+        return object.__getattribute__(self, target)
+      _bind(self, target, _Tracked(object.__getattribute__(self, target),
+          compute, value.sources + ((self, other),)))
+    _recompute(_dependents_of(((self, target),), ordered=True))
+
+  def __init__(self, *args, **kwargs):
+    object.__setattr__(self, "_bindings", {})
+    object.__setattr__(self, "_dependents", {})
+    cls.__init__(self, *args, **kwargs)
+
+  def __reduce_ex__(self, protocol):
+    # The class cannot be found by name, so copies and pickles are made
+    # through _dependent_shape(). As with Footprint.copy(), formulas are
+    # not kept.
+    reduced = object.__reduce_ex__(self, max(protocol, 2))
+    instance_dict, slots = reduced[2]
+    slots = dict(slots, _bindings={}, _dependents={})
+    return (_dependent_shape, (cls,), (instance_dict, slots)) + reduced[3:]
+
+  def __setstate__(self, state):
+    instance_dict, slots = state
+    if instance_dict:
+      object.__getattribute__(self, "__dict__").update(instance_dict)
+    for name, value in slots.items():
+      object.__setattr__(self, name, value)
+
+  dependent = type(cls.__name__, (cls,), {"__slots__": ("_bindings",
+      "_dependents"), "__getattribute__": __getattribute__,
+      "__setattr__": __setattr__, "__init__": __init__,
+      "__reduce_ex__": __reduce_ex__, "__setstate__": __setstate__,
+      "__doc__": cls.__doc__, "__module__": __name__})
+  # Footprints hold the class in their pad_class etc., and pickle finds
+  # classes by their qualified name, so it gets a unique one here
+  qualname = "_Dependent" + cls.__name__
+  while qualname in globals():
+    qualname += "_"
+  dependent.__qualname__ = qualname
+  globals()[qualname] = dependent
+  _dependent_classes[cls] = _dependent_classes[dependent] = dependent
+  return dependent
+
+
+def _dependent_shape(cls):
+  """Returns an uninitialized instance of _dependent_class(cls), for
+  unpickling."""
+  dependent = _dependent_class(cls)
+  return dependent.__new__(dependent)
+
+
+def _assign(setter, *args):
+  """Calls a setter without recording formulas or recomputing
+  dependents for the attributes it sets."""
+  global _assigning
+  assigning, _assigning = _assigning, True
+  try:
+    setter(*args)
+  finally:
+    _assigning = assigning
+
+
+def _bind(shape, name, formula):
+  """Records that a dependent shape's value is computed by a formula,
+  unless that would make the value depend on itself."""
+  sources = set(formula.sources)
+  node = (shape, name)
+  if node in sources or sources & _dependents_of((node,)):
+    return
+  shape._bindings[name] = formula
+  for source, attr in sources:
+    source._dependents.setdefault(attr, set()).add(node)
+
+
+def _unbind(shape, name):
+  """Forgets the formula of a dependent shape's value, if it has one."""
+  formula = shape._bindings.pop(name, None)
+  if formula is not None:
+    for source, attr in set(formula.sources):
+      source._dependents[attr].discard((shape, name))
+
+
+def _dependents_of(nodes, ordered=False):
+  """Returns the (shape, attribute) pairs that depend, directly or not,
+  on any of `nodes`. If `ordered` is true, a list in an order in which
+  they can be recomputed is returned instead of a set."""
+  seen = set(nodes)
+  order = []
+  stack = [(node, iter(node[0]._dependents.get(node[1], ())))
+      for node in nodes]
+  while stack:
+    node, dependents = stack[-1]
+    for dependent in dependents:
+      if dependent not in seen:
+        seen.add(dependent)
+        stack.append((dependent,
+            iter(dependent[0]._dependents.get(dependent[1], ()))))
+        break
+    else:
+      stack.pop()
+      order.append(node)
+  if not ordered:
+    return seen - set(nodes)
+  order.reverse()
+  return [node for node in order if node not in nodes]
+
+
+def _recompute(nodes):
+  """Recomputes dependent values, given in dependency order, and tells
+  the owning footprints about the shapes that changed."""
+  changed = {}
+  for shape, attr in nodes:
+    value = shape._bindings[attr].compute()
+    _assign(setattr, shape, attr, value)
+    changed[shape] = None
+  for shape in changed:
+    if shape._owner is not None:
+      shape._owner._shape_changed(shape)
+
+
+# made up front, so that pickled footprints can be loaded in a process
+# that has not created them yet
+for _cls in (Pad, Pin, SilkLine, SilkPolyline, SilkArc, FixedPad, FixedPin,
+    FixedSilkLine, FixedSilkPolyline, FixedSilkArc):
+  _dependent_class(_cls)
+del _cls
+
+
+_geometry_getters = {}
+
+def _geometry_state(shape):
+  """Returns the values of the attributes that determine a shape's
+  extent (see Shape._geometry), read through a getter cached per class;
+  arrays give an empty tuple."""
+  cls = type(shape)
+  getter = _geometry_getters.get(cls)
+  if getter is None:
+    names = cls._geometry
+    if names is None:
+      getter = cls.bounds
+    elif names:
+      getter = operator.attrgetter(*names)
+    else:
+      getter = lambda shape: ()
+    _geometry_getters[cls] = getter
+  return getter(shape)
+
+
+def _numbers_of(shape):
+  """Returns the pin numbers of a pin, pad or array, or an empty tuple
+  for other shapes."""
+  if isinstance(shape, _ShapeArray):
+    return shape.number
+  if isinstance(shape, (Pin, Pad)):
+    return (shape.number,)
+  return ()
+
+
+class _SpatialGrid(object):
+  """A uniform grid hash over the bounding boxes of a footprint's pins,
+  pads and silkscreen shapes.
+
+  Entries are the lookup keys used by the footprint's pin number table
+  (see Footprint._resolve()), so array elements are indexed
+  individually. Each entry is listed in every square cell its bounding
+  box touches.
+  """
+
+  def __init__(self, cell):
+    self.cell = float(cell)
+    self.cells = {}  # (column, row) -> list of keys
+    self.entries = {}  # key -> (bounds, cell range)
+    self.span = None  # cell range covering every cell ever used
+
+  @classmethod
+  def build(cls, entries):
+    """Creates a grid from a list of (key, bounds) tuples, picking a cell
+    size about as large as a typical entry, but large enough that the
+    grid has no more cells than entries."""
+    sizes = sorted(max(b[2] - b[0], b[3] - b[1]) for key, b in entries)
+    cell = sizes[len(sizes) // 2] if sizes else 0
+    if entries:
+      width = max(b[2] for k, b in entries) - min(b[0] for k, b in entries)
+      height = max(b[3] for k, b in entries) - min(b[1] for k, b in entries)
+      cell = max(cell, math.sqrt(width * height / len(entries)))
+    grid = cls(cell if cell > 0 else 1)
+    for key, bounds in entries:
+      grid.insert(key, bounds)
+    return grid
+
+  def _range(self, bounds):
+    c = self.cell
+    return (int(math.floor(bounds[0] / c)), int(math.floor(bounds[1] / c)),
+        int(math.floor(bounds[2] / c)), int(math.floor(bounds[3] / c)))
+
+  def insert(self, key, bounds):
+    r = self._range(bounds)
+    self.entries[key] = (bounds, r)
+    cells = self.cells
+    for column in range(r[0], r[2] + 1):
+      for row in range(r[1], r[3] + 1):
+        cell = cells.get((column, row))
+        if cell is None:
+          cells[column, row] = [key]
+        else:
+          cell.append(key)
+    span = self.span
+    self.span = r if span is None else (min(span[0], r[0]),
+        min(span[1], r[1]), max(span[2], r[2]), max(span[3], r[3]))
+
+  def remove(self, key):
+    entry = self.entries.pop(key, None)
+    if entry is None:
+      return
+    r = entry[1]
+    for column in range(r[0], r[2] + 1):
+      for row in range(r[1], r[3] + 1):
+        cell = self.cells[column, row]
+        cell.remove(key)
+        if not cell:
+          del self.cells[column, row]
+
+  def update(self, key, bounds):
+    """Moves an entry to new bounds (or removes it if `bounds` is
+    None)."""
+    entry = self.entries.get(key)
+    if bounds is None:
+      self.remove(key)
+    elif entry is not None and entry[1] == self._range(bounds):
+      self.entries[key] = (bounds, entry[1])
+    else:
+      self.remove(key)
+      self.insert(key, bounds)
+
+  def search(self, rect):
+    """Yields (key, bounds) for each entry whose bounds intersect the
+    (left, top, right, bottom) rectangle `rect`."""
+    if self.span is None:
+      return
+    r, span = self._range(rect), self.span
+    r = (max(r[0], span[0]), max(r[1], span[1]),
+        min(r[2], span[2]), min(r[3], span[3]))
+    if (r[2] - r[0] + 1) * (r[3] - r[1] + 1) > len(self.cells):
+      candidates = self.entries
+    else:
+      candidates = {}
+      for column in range(r[0], r[2] + 1):
+        for row in range(r[1], r[3] + 1):
+          for key in self.cells.get((column, row), ()):
+            candidates[key] = None
+    left, top, right, bottom = rect
+    for key in candidates:
+      b = self.entries[key][0]
+      if b[0] <= right and b[2] >= left and b[1] <= bottom and b[3] >= top:
+        yield key, b
+
+  def nearest(self, x, y, accept=None):
+    """Returns the key of the entry whose bounds are closest to the point
+    (x, y) and for which `accept(key)` is true, or None. Ties go to the
+    lowest key."""
+    if self.span is None:
+      return None
+    c, span = self.cell, self.span
+    column, row = int(math.floor(x / c)), int(math.floor(y / c))
+    # rings closer than this contain no cells in use
+    first = max(0, span[0] - column, column - span[2],
+        span[1] - row, row - span[3])
+    last = max(column - span[0], span[2] - column,
+        row - span[1], span[3] - row)
+    best, best_distance, seen = None, None, set()
+    for radius in range(first, last + 1):
+      # everything not yet seen is at least this far away
+      if best is not None and best_distance <= ((radius - 1) * c) ** 2:
+        break
+      for cell in self._ring(column, row, radius):
+        for key in self.cells.get(cell, ()):
+          if key in seen:
+            continue
+          seen.add(key)
+          b = self.entries[key][0]
+          dx = max(b[0] - x, 0, x - b[2])
+          dy = max(b[1] - y, 0, y - b[3])
+          distance = dx*dx + dy*dy
+          if (best is None or distance < best_distance or
+              distance == best_distance and key < best) and (
+              accept is None or accept(key)):
+            best, best_distance = key, distance
+    return best
+
+  @staticmethod
+  def _ring(column, row, radius):
+    """Yields the cells at a Chebyshev distance of `radius` from a
+    cell."""
+    if radius == 0:
+      yield column, row
+      return
+    for c in range(column - radius, column + radius + 1):
+      yield c, row - radius
+      yield c, row + radius
+    for r in range(row - radius + 1, row + radius):
+      yield column - radius, r
+      yield column + radius, r
+
+
+
+class Footprint(object):
+  """A footprint definition. (an "element" in pcb terms)
+
+  A footprint is composed of multiple shapes, defined in the classes
+  above.
+  """
+
+  # If set to an OutputCache, write() leaves files whose contents would
+  # not change untouched.
+  output_cache = None
+
+  # If set to a FootprintIndex, write() records each footprint's
+  # metadata in it.
+  metadata_index = None
+
+  # The classes of the shapes created by the add_* methods. Footprints
+  # created with fixed_point=True use the Fixed* classes instead.
+  pad_class = Pad
+  pin_class = Pin
+  pad_array_class = PadArray
+  pin_array_class = PinArray
+  line_class = SilkLine
+  polyline_class = SilkPolyline
+  arc_class = SilkArc
+
+  # If set to a PackWriter, write() adds footprints to it rather than
+  # writing files.
+  pack = None
+
+  # If set to an AsyncWriter, footprints are written by it at the end of
+  # a `with` statement.
+  async_writer = None
+
+  # If set to a Profiler, footprints record how long they take to build
+  # and write in it.
+  profiler = None
+
+  # The formats write() produces, as names of emitters (see `emitters`).
+  # Formats other than "geda" go to files named after the one passed to
+  # write(), with the emitter's extension.
+  formats = ("geda",)
+
+  # Design rules used by check(), as minimums in mils.
+  design_rules = {"clearance": 6, "annular_ring": 5, "silk_clearance": 0}
+
+  def __init__(self, name, **kwargs):
+    """Footprint initializer.
+
+    Arguments:
+    name -- name of the component
+
+    Keyword arguments:
+    description -- text description of the component
+    mark_x -- x coordinate of the element's "diamond" marker
+      (optional; defaults to 0)
+    mark_y -- y coordinate of the element's "diamond" marker
+      (optional; defaults to 0)
+    text_x -- x coordinate of the left edge of the text
+      (optional; defaults to 0)
+    text_y -- y coordinate of the top edge of the text
+      (optional; defaults to 0)
+    text_direction -- rotation of the text
+      (optional; 0=normal, 1=rotated 90 degrees left, 2=upside down,
+      3=rotated 270 degrees left; defaults to 0)
+    fixed_point -- if True, shapes added to the footprint store their
+      geometry as integers in pcb's native 1/100 mil units, rounding
+      each value once when it is set (see FixedPad)
+      (optional; defaults to False)
+    track_dependencies -- if True, values of single pins, pads and
+      silkscreen shapes that are computed from those of other shapes
+      (including ones inherited with `base`) are updated when those
+      shapes change (see _dependent_class())
+      (optional; defaults to False)
+    """
+    self.name = name
+    self.description = kwargs.get("description", "")
+    self.mark_x = 0
+    self.mark_y = 0
+    self.text_x = 0
+    self.text_y = 0
+    self.text_direction = 0
+    self.text_scale = 100
+    self.shapes = []
+    self.pinpadcounter = 1  # for pin/pad auto-numbering
+    self._numbers = {}  # pin number -> lookup key(s); see _resolve()
+    self._spatial = None  # _SpatialGrid, built by the first region query
+    self._spatial_states = []  # see _refresh_spatial()
+    if kwargs.get("fixed_point"):
+      self.pad_class = FixedPad
+      self.pin_class = FixedPin
+      self.pad_array_class = FixedPadArray
+      self.pin_array_class = FixedPinArray
+      self.line_class = FixedSilkLine
+      self.polyline_class = FixedSilkPolyline
+      self.arc_class = FixedSilkArc
+    if kwargs.get("track_dependencies"):
+      self.pad_class = _dependent_class(self.pad_class)
+      self.pin_class = _dependent_class(self.pin_class)
+      self.line_class = _dependent_class(self.line_class)
+      self.polyline_class = _dependent_class(self.polyline_class)
+      self.arc_class = _dependent_class(self.arc_class)
+    if self.profiler is not None:
+      self.profiler.created(self)
+
+  def __enter__(self):
+    """Convenience to allow use of the `with` statement.
+
+    At the end of a `with` statement, the footprint is written to disk
+    if no exceptions are raised."""
+    return self
+
+  def __exit__(self, type, value, traceback):
+    """Ends a `with` statement.
+
+    If no exceptions were raised, the footprint is written to a file in
+    the current directoryl the `name` property is used as the filename,
+    and the `.fp` extension is appended. If `async_writer` is set, the
+    footprint is serialized and handed to it to write instead.
+    """
+    if type is None and self.name:
+      if self.async_writer is not None and self.pack is None:
+        self.async_writer.submit(self, self.name + ".fp")
+      else:
+        self.write(self.name + ".fp")
+    elif type is not None and _run_log is not None:
+      _run_log.append((self.name, None,
+          "".join(format_exception_only(type, value)).strip()))
+
+  def __getitem__(self, number):
+    """Returns the pin or pad with the given number attribute.
+
+    This may not correspond to the actual index of the pin or pad in the
+    shapes array. Returns None if there is no matching pin or pad.
+
+    If more than one pin or pad has the given number, the one added
+    first is returned; use find_all() to get all of them."""
+    entry = self._numbers.get(number)
+    if entry is not None and not self._stale():
+      shape = self._current(entry if isinstance(entry, int) else entry[0],
+          number)
+      if shape is not None:
+        return shape
+    found = self._lookup(number)
+    return found[0] if found else None
+
+  def find_all(self, number):
+    """Returns a list of all pins and pads with the given number
+    attribute, in the order they were added.
+
+    pcb allows several pins or pads to share a number (e.g. the two
+    halves of a split pad, or unnumbered mounting holes)."""
+    return self._lookup(number)
+
+  # The lookup table maps each number to a key, or to a sorted list of
+  # keys if several shapes share the number. A key packs a shape's
+  # position in the shapes array and, for arrays, the element index plus
+  # one into a single int; this is far smaller than a tuple per entry,
+  # and sorting the keys puts them in the order the shapes were added.
+  #
+  # The shapes array is a plain list, so shapes may be added, removed or
+  # reordered without the footprint knowing. Lookups therefore check
+  # that the shapes they find are still where the table says and still
+  # have the number asked for, and rebuild the table if not.
+
+  def _lookup(self, number):
+    """Returns the shapes (or array element views) with the given
+    number, in the order they were added, rebuilding the lookup table
+    first if the shapes array has been changed directly."""
+    if not self._stale():
+      entry = self._numbers.get(number)
+      keys = () if entry is None else (
+          (entry,) if isinstance(entry, int) else entry)
+      if not keys:
+        return []
+      found = [self._current(key, number) for key in keys]
+      if not any(shape is None for shape in found):
+        return found
+    self._reindex()
+    entry = self._numbers.get(number)
+    if entry is None:
+      return []
+    if isinstance(entry, int):
+      return [self._resolve(entry)]
+    return [self._resolve(key) for key in entry]
+
+  def _stale(self):
+    """Returns True if shapes have evidently been appended to, inserted
+    into or removed from the shapes array directly, judging by its last
+    shape. Shapes whose class did not call Shape.__init__() have no
+    owner, and count as appended directly."""
+    shapes = self.shapes
+    return bool(shapes) and (getattr(shapes[-1], "_owner", None) is not self
+        or shapes[-1]._position != len(shapes) - 1)
+
+  def _current(self, key, number):
+    """Returns the shape (or array element view) a lookup key refers to
+    if it is still at that place in the shapes array and has the given
+    number, or None."""
+    position, index = key >> 32, key & 0xffffffff
+    if position >= len(self.shapes):
+      return None
+    shape = self.shapes[position]
+    if (getattr(shape, "_owner", None) is not self or
+        shape._position != position):
+      return None
+    if index:
+      numbers = shape.number
+      if index > len(numbers) or numbers[index - 1] != number:
+        return None
+      return shape.element_class(shape, index - 1)
+    return shape if shape.number == number else None
+
+  def _reindex(self):
+    """Rebuilds the lookup table from the shapes array, and drops the
+    spatial index, after the array has been changed directly."""
+    shapes = list(self.shapes)
+    del self.shapes[:]
+    self._numbers = {}
+    self._spatial = None
+    self._add_shapes(shapes)
+
+  def _resolve(self, key):
+    """Returns the shape (or array element view) a lookup key refers
+    to."""
+    shape = self.shapes[key >> 32]
+    index = key & 0xffffffff
+    return shape if index == 0 else shape[index - 1]
+
+  def _insert_key(self, number, key):
+    numbers = self._numbers
+    entry = numbers.get(number)
+    if entry is None:
+      numbers[number] = key
+    elif isinstance(entry, int):
+      numbers[number] = [entry, key] if entry < key else [key, entry]
+    else:
+      insort(entry, key)
+
+  def _add_shape(self, shape):
+    """Appends a shape to the shapes array, and adds it to the spatial
+    index if one has been built."""
+    shape._owner = self
+    shape._position = len(self.shapes)
+    self.shapes.append(shape)
+    if self._spatial is not None:
+      self._index_shape(shape)
+
+  def _add_numbered(self, shape):
+    """Appends a pin, pad or array to the shapes array and records its
+    number(s) in the lookup table."""
+    self._add_shape(shape)
+    base = shape._position << 32
+    if isinstance(shape, _ShapeArray):
+      numbers = self._numbers
+      for key, number in enumerate(shape.number, base + 1):
+        if number in numbers:
+          self._insert_key(number, key)
+        else:
+          numbers[number] = key
+    else:
+      self._insert_key(shape.number, base)
+
+  def _add_shapes(self, shapes):
+    """Appends shapes of any kind to the shapes array, recording the
+    numbers of the pins, pads and arrays among them."""
+    for shape in shapes:
+      if isinstance(shape, (Pin, Pad, _ShapeArray)):
+        self._add_numbered(shape)
+      else:
+        self._add_shape(shape)
+
+  def _renumber(self, shape, index, old, new):
+    """Moves a pin or pad (or an element of an array) from one entry
+    of the lookup table to another after its number changes."""
+    key = (shape._position << 32) + index + 1
+    entry = self._numbers.get(old)
+    if entry == key:
+      del self._numbers[old]
+    elif isinstance(entry, list):
+      i = bisect_left(entry, key)
+      if i < len(entry) and entry[i] == key:
+        del entry[i]
+        if len(entry) == 1:
+          self._numbers[old] = entry[0]
+    self._insert_key(new, key)
+
+  def add_pad(self, **kwargs):
+    """Adds a pad to the footprint.
+
+    Keyword arguments:
+    same as those for Pad.__init__()
+
+    Return value:
+    the added pad
+
+    If `base` and `number` are not specified, the current pin/pad number
+    is assigned to the `number` attribute and incremented.
+    """
+    if not "base" in kwargs:
+      kwargs["number"] = kwargs.get("number", self.pinpadcounter)
+    pad = self.pad_class(**kwargs)
+    self._add_numbered(pad)
+    self.pinpadcounter += 1
+    return pad
+
+  def add_pin(self, **kwargs):
+    """Adds a pin to the footprint.
+
+    Keyword arguments:
+    same as those for Pin.__init__()
+
+    Return value:
+    the added pin
+
+    If `base` and `number` are not specified, the current pin/pad number
+    is assigned to the `number` attribute and incremented.
+    """
+    if not "base" in kwargs:
+      kwargs["number"] = kwargs.get("number", self.pinpadcounter)
+    pin = self.pin_class(**kwargs)
+    self._add_numbered(pin)
+    self.pinpadcounter += 1
+    return pin
+
+  def add_pads(self, count, **kwargs):
+    """Adds multiple pads at given intervals.
+
+    Arguments:
+    count -- number of pads to add
+
+    Keyword arguments:
+    x -- x coordinate of the center of the first pad
+    y -- y coordinate of the center of the first pad
+    dx -- amount to step in the x direction after placing a pad
+    dy -- amount to step in the y direction after placing a pad
+    width -- width of each pad
+    height -- height of each pad
+
+    Return value:
+    a PadArray holding the added pads; it can be indexed like a list
+
+    To place staggered pads, a tuple of length >= 2 may be specified for
+    `dx` and/or `dy`. In the case of a 2-element tuple, the first
+    element is used as the step value after placing every odd pad, and
+    the second element is used as the step value after placing every
+    even pad.
+    """
+    return self.__add_array(self.pad_array_class, count, kwargs)
+
+  def add_pins(self, count, **kwargs):
+    """Adds multiple pins at given intervals.
+
+    Arguments:
+    count -- number of pins to add
+
+    Keyword arguments:
+    x -- x coordinate of the center of the first pin
+    y -- y coordinate of the center of the first pin
+    dx -- amount to step in the x direction after placing a pin
+    dy -- amount to step in the y direction after placing a pin
+    hole -- diameter of each pin's drill hole
+    diameter -- outer diameter of each pin's copper annulus
+
+    Return value:
+    a PinArray holding the added pins; it can be indexed like a list
+
+    To place staggered pins, a tuple of length >= 2 may be specified for
+    `dx` and/or `dy`. In the case of a 2-element tuple, the first
+    element is used as the step value after placing every odd pin, and
+    the second element is used as the step value after placing every
+    even pin.
+    """
+    return self.__add_array(self.pin_array_class, count, kwargs)
+
+  def add_pad_grid(self, rows, cols, pitch, **kwargs):
+    """Adds a rectangular grid of pads, such as a ball grid array.
+
+    Arguments:
+    rows -- number of rows
+    cols -- number of columns
+    pitch -- distance between neighbouring pad centers, or an (x pitch,
+      y pitch) tuple
+
+    Keyword arguments:
+    x -- x coordinate of the center of the first (A1) pad
+    y -- y coordinate of the center of the first (A1) pad
+    depopulate -- (optional) a boolean mask of `rows` sequences of `cols`
+      values; pads whose value is True are left out
+    omit -- (optional) a list of pads to leave out, given as names
+      ("C3") or zero-based (row, column) tuples
+    other keyword arguments are the same as those for Pad.__init__(),
+    and apply to every pad
+
+    Return value:
+    a PadArray holding the added pads
+
+    Pads are numbered JEDEC-style by row letter and column number: A1,
+    A2, ... then B1, ... Row letters skip I, O, Q, S, X and Z, and
+    continue AA, AB, ... after Y. Rows run in the positive y direction
+    and columns in the positive x direction.
+    """
+    shape_array = self.pad_array_class.grid(rows, cols, pitch, **kwargs)
+    self._add_numbered(shape_array)
+    return shape_array
+
+  def add_pin_grid(self, rows, cols, pitch, **kwargs):
+    """Adds a rectangular grid of pins, such as a pin grid array.
+
+    Arguments and keyword arguments are the same as those for
+    add_pad_grid(), except that the remaining keyword arguments are those
+    for Pin.__init__().
+
+    Return value:
+    a PinArray holding the added pins
+    """
+    shape_array = self.pin_array_class.grid(rows, cols, pitch, **kwargs)
+    self._add_numbered(shape_array)
+    return shape_array
+
+  def __add_array(self, cls, count, kwargs):
+    kwargs["number"] = kwargs.get("number", self.pinpadcounter)
+    shape_array = cls(count, **kwargs)
+    self._add_numbered(shape_array)
+    self.pinpadcounter += count
+    return shape_array
+
+  def add_line(self, *args, **kwargs):
+    """Adds a line to the silkscreen layer.
+
+    Arguments:
+    same as those for SilkLine.__init__()
+
+    Keyword arguments:
+    same as those for SilkLine.__init__()
+
+    Return value:
+    the added line
+    """
+    line = self.line_class(*args, **kwargs)
+    self._add_shape(line)
+    return line
+
+  def add_polyline(self, *args, **kwargs):
+    """Adds a polyline to the silkscreen layer.
+
+    Arguments:
+    same as those for SilkPolyline.__init__()
+
+    Keyword arguments:
+    same as those for SilkPolyline.__init__()
+
+    Return value:
+    the added polyline
+    """
+    pline = self.polyline_class(*args, **kwargs)
+    self._add_shape(pline)
+    return pline
+
+  def add_arc(self, *args, **kwargs):
+    """Adds an arc to the silkscreen layer.
+
+    Arguments:
+    same as those for SilkArc.__init__()
+
+    Keyword arguments:
+    same as those for SilkArc.__init__()
+
+    Return value:
+    the added arc
+    """
+    arc = self.arc_class(*args, **kwargs)
+    self._add_shape(arc)
+    return arc
+
+  def bounds(self):
+    """Returns the (left, top, right, bottom) extents of all shapes in
+    the footprint, or None if it has no shapes."""
+    bounds = [b for b in (s.bounds() for s in self.shapes) if b is not None]
+    if not bounds:
+      return None
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+        max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+  # Region queries use a grid hash over the shapes' bounding boxes. It
+  # is built the first time it is needed and then kept up to date as
+  # shapes are added, moved or resized; see _refresh_spatial().
+
+  def shapes_in(self, rect, touching=False):
+    """Returns the shapes whose bounding boxes lie inside a rectangle.
+
+    Arguments:
+    rect -- (left, top, right, bottom) of the rectangle
+
+    Keyword arguments:
+    touching -- if True, shapes that only partly overlap the rectangle
+      are included too (optional; defaults to False)
+
+    Return value:
+    a list of shapes in the order they were added; pins and pads in a
+    PinArray/PadArray are returned individually, as views
+
+    Bounding boxes are those given by each shape's left/top/right/bottom
+    properties, and include line thickness and pin annuli.
+    """
+    left, top, right, bottom = rect
+    keys = sorted(key for key, b in self._spatial_grid().search(rect)
+        if touching or (b[0] >= left and b[1] >= top and
+            b[2] <= right and b[3] <= bottom))
+    return [self._resolve(key) for key in keys]
+
+  def nearest(self, x, y, kind=None):
+    """Returns the shape closest to a point.
+
+    Arguments:
+    x -- x coordinate of the point
+    y -- y coordinate of the point
+
+    Keyword arguments:
+    kind -- (optional) a shape class such as Pin or Pad; if given, only
+      shapes of that class are considered
+
+    Return value:
+    the shape (or array element) whose bounding box is closest to the
+    point, or None if there is none; of several equally close shapes,
+    the one added first is returned
+    """
+    accept = None
+    if kind is not None:
+      accept = lambda key: isinstance(self._resolve(key), kind)
+    key = self._spatial_grid().nearest(x, y, accept)
+    return None if key is None else self._resolve(key)
+
+  def overlapping(self, shape):
+    """Returns the shapes whose bounding boxes overlap that of a shape.
+
+    Arguments:
+    shape -- a shape in this footprint (or an element of a PinArray or
+      PadArray), or any object with left/top/right/bottom properties
+
+    Return value:
+    a list of shapes in the order they were added, not including
+    `shape` itself (or, for an array, any of its elements)
+
+    Boxes that only touch along an edge count as overlapping.
+    """
+    own = set(shape.elements()) if isinstance(shape, Shape) else ()
+    keys = sorted(key for key, b in self._spatial_grid().search(
+        (shape.left, shape.top, shape.right, shape.bottom)))
+    return [s for s in (self._resolve(key) for key in keys)
+        if s not in own and s is not shape]
+
+  def transform(self, matrix):
+    """Applies an affine transform to every shape in the footprint, and
+    to the mark and text position.
+
+    Arguments:
+    matrix -- ((a, b, dx), (c, d, dy)), which moves each point (x, y) to
+      (a*x + b*y + dx, c*x + d*y + dy); the translation column may be
+      left out. a, b, c and d must each be 0, 1 or -1, i.e. the
+      transform may rotate by multiples of 90 degrees and mirror, but
+      not scale or skew, so that pads stay axis-aligned.
+
+    Pads have their width and height swapped when turned by 90 degrees,
+    and arcs their radii and angles adjusted. Pins and pads in arrays
+    are transformed a column at a time. The text is turned with the
+    footprint, but cannot be mirrored. Formulas recorded for shapes in
+    a footprint created with track_dependencies=True are forgotten.
+
+    Raises ValueError if the matrix is not of the form described above.
+    """
+    (a, b, dx), (c, d, dy) = [tuple(row) + (0,) * (3 - len(row))
+        for row in matrix]
+    m = (a, b, c, d)
+    if not all(v in (0, 1, -1) for v in m) or abs(a*d - b*c) != 1:
+      raise ValueError("transform must rotate by a multiple of 90 "
+          "degrees and/or mirror: %r" % (matrix,))
+    for shape in self.shapes:
+      for name in list(getattr(shape, "_bindings", ())):
+        _unbind(shape, name)
+    self._spatial = None
+    shapes, replaced = [], False
+    for shape in self.shapes:
+      replacement = shape._transform(m, dx, dy)
+      if replacement is None:
+        shapes.append(shape)
+      else:
+        shapes.extend(replacement)
+        replaced = True
+    if replaced:
+      self.shapes[:] = shapes
+      self._reindex()
+    x, y = self.mark_x, self.mark_y
+    self.mark_x, self.mark_y = a*x + b*y + dx, c*x + d*y + dy
+    x, y = self.text_x, self.text_y
+    self.text_x, self.text_y = a*x + b*y + dx, c*x + d*y + dy
+    self.text_direction = (self.text_direction + _rotation_angle(m) // 90) % 4
+
+  def copy(self, name=None):
+    """Returns a copy of the footprint and its shapes, e.g. to make a
+    rotated or mirrored variant of it.
+
+    Keyword arguments:
+    name -- (optional) name of the copy; defaults to the same name
+
+    Formulas recorded for shapes in a footprint created with
+    track_dependencies=True are not copied.
+    """
+    memo = {id(getattr(self, "_profile", None)): None}
+    for shape in self.shapes:
+      if hasattr(shape, "_bindings"):
+        memo[id(shape._bindings)] = {}
+        memo[id(shape._dependents)] = {}
+    footprint = copy.deepcopy(self, memo)
+    # the copy gets a profiler entry of its own, if any
+    footprint.__dict__.pop("_profile", None)
+    if name is not None:
+      footprint.name = name
+    if self.profiler is not None:
+      self.profiler.created(footprint)
+    return footprint
+
+  def rotate(self, degrees, x=0, y=0):
+    """Rotates the footprint counterclockwise (as seen in pcb, whose y
+    axis points down) by a multiple of 90 degrees about the point
+    (x, y). See transform()."""
+    if degrees % 90:
+      raise ValueError("can only rotate by multiples of 90 degrees")
+    a, b, c, d = _ROTATIONS[degrees % 360]
+    self.transform(((a, b, x - a*x - b*y), (c, d, y - c*x - d*y)))
+
+  def mirror(self, axis="x", offset=0):
+    """Mirrors the footprint, e.g. for placement on the bottom side.
+
+    Arguments:
+    axis -- "x" to negate x coordinates, flipping left and right, or "y"
+      to negate y coordinates, flipping top and bottom
+    offset -- coordinate of the line to mirror about (optional; defaults
+      to 0)
+
+    See transform().
+    """
+    if axis == "x":
+      self.transform(((-1, 0, 2*offset), (0, 1, 0)))
+    elif axis == "y":
+      self.transform(((1, 0, 0), (0, -1, 2*offset)))
+    else:
+      raise ValueError("axis must be \"x\" or \"y\"")
+
+  def translate(self, dx, dy):
+    """Moves every shape in the footprint, and the mark and text
+    position, by (dx, dy). See transform()."""
+    self.transform(((1, 0, dx), (0, 1, dy)))
+
+  def optimize(self, tolerance=0.01):
+    """Reduces the number of silkscreen segments written, without
+    changing what is drawn.
+
+    Runs of silkscreen lines of the same thickness, each starting where
+    the previous one ends, are joined into polylines (closed if the run
+    ends where it started), and every polyline is then simplified: see
+    SilkPolyline.simplify(). Lines with formulas recorded, in a
+    footprint created with track_dependencies=True, are left alone.
+
+    Keyword arguments:
+    tolerance -- (optional) distance in mils a vertex may lie off the
+      straight line between its neighbours and still be removed;
+      defaults to 0.01, half a 1/100 mil output unit
+
+    Return value:
+    the number of ElementLine records saved
+
+    Lines that are joined are removed from the shapes array, so
+    references to them no longer refer to shapes in the footprint.
+    """
+    def joinable(shape):
+      return isinstance(shape, SilkLine) and not getattr(shape,
+          "_bindings", None) and not getattr(shape, "_dependents", None)
+
+    def join(run):
+      if len(run) < 2:
+        shapes.extend(run)
+        return
+      points = [(run[0].x1, run[0].y1)]
+      points.extend((line.x2, line.y2) for line in run)
+      closed = points[-1] == points[0]
+      if closed:
+        points.pop()
+      shapes.append(self.polyline_class(*points,
+          thickness=run[0].thickness, closed=closed))
+
+    before = _silk_segment_count(self.shapes)
+    shapes, run = [], []
+    for shape in self.shapes:
+      if run and joinable(shape) and (run[-1].x2, run[-1].y2,
+          run[-1].thickness) == (shape.x1, shape.y1, shape.thickness):
+        run.append(shape)
+        continue
+      join(run)
+      run = []
+      if joinable(shape):
+        run.append(shape)
+      else:
+        shapes.append(shape)
+    join(run)
+    for shape in shapes:
+      if isinstance(shape, SilkPolyline):
+        shape.simplify(tolerance)
+    if len(shapes) < len(self.shapes):
+      self.shapes[:] = shapes
+      self._reindex()
+    return before - _silk_segment_count(self.shapes)
+
+  def _spatial_grid(self):
+    """Returns the spatial index, building it if necessary."""
+    if self._stale():
+      self._reindex()
+    if self._spatial is None:
+      entries = []
+      for position, shape in enumerate(self.shapes):
+        if getattr(shape, "_owner", None) is not self:
+          # appended to the shapes array directly
+          shape._owner, shape._position = self, position
+        entries.extend(self._shape_entries(shape))
+      self._spatial = _SpatialGrid.build(entries)
+      self._spatial_states = list(map(_geometry_state, self.shapes))
+    else:
+      self._refresh_spatial()
+    return self._spatial
+
+  def _refresh_spatial(self):
+    """Updates the spatial index for the shapes that have been moved or
+    resized since it was last used.
+
+    Shapes do not report changes to their attributes, which would slow
+    down every assignment; instead, the values that determine each
+    shape's extent are compared with those recorded the last time."""
+    states = list(map(_geometry_state, self.shapes))
+    old = self._spatial_states
+    if states == old:
+      return
+    for position, (state, previous) in enumerate(zip(states, old)):
+      if state != previous:
+        shape = self.shapes[position]
+        self._spatial.update(shape._position << 32, shape.bounds())
+    self._spatial_states = states
+
+  def _shape_entries(self, shape):
+    """Returns (lookup key, bounds) for each element of a shape that
+    has any extent."""
+    base = shape._position << 32
+    if isinstance(shape, _ShapeArray):
+      return [(key, b) for key, b in
+          enumerate(shape.element_bounds(), base + 1) if b is not None]
+    bounds = shape.bounds()
+    return [] if bounds is None else [(base, bounds)]
+
+  def _index_shape(self, shape):
+    for key, bounds in self._shape_entries(shape):
+      self._spatial.insert(key, bounds)
+    self._spatial_states.append(_geometry_state(shape))
+
+  def _shape_changed(self, shape, index=-1):
+    """Updates the spatial index after a shape (or the element at
+    `index` of an array) has changed."""
+    if self._spatial is not None:
+      key = (shape._position << 32) + index + 1
+      self._spatial.update(key,
+          shape.bounds() if index < 0 else shape[index].bounds())
+
+  def check(self, rules=None):
+    """Checks the footprint against design rules.
+
+    Arguments:
+    rules -- (optional) a dict of rules overriding those in
+      `design_rules`; a rule set to None is not checked. Rules are
+      minimums, in mils:
+      clearance -- gap between the copper of pins and pads with
+        different numbers
+      annular_ring -- width of the copper ring around a pin's hole, i.e.
+        half of (diameter - hole)
+      silk_clearance -- gap between silkscreen lines and arcs (allowing
+        for their thickness) and copper
+
+    Return value:
+    a list of Violations, ordered by rule and then by the order the
+    shapes were added
+
+    Pins and pads are checked against their neighbours found through the
+    spatial index, so the time taken grows roughly linearly with the
+    number of shapes. Pins and pads that share a number (such as the
+    halves of a split pad) may touch. Solder mask and the clearance to
+    copper outside the footprint are not checked.
+    """
+    limits = dict(self.design_rules)
+    limits.update(rules or {})
+    grid = self._spatial_grid()
+    copper, silk = {}, []
+    for shape in self.shapes:
+      base = shape._position << 32
+      if isinstance(shape, _ShapeArray):
+        for key, element in enumerate(shape, base + 1):
+          copper[key] = element
+      elif isinstance(shape, (Pin, Pad)):
+        copper[base] = shape
+      elif isinstance(shape, (SilkLine, SilkPolyline, SilkArc)):
+        silk.append(shape)
+    violations = []
+
+    limit = limits.get("annular_ring")
+    if limit is not None:
+      for key in sorted(copper):
+        pin = copper[key]
+        if isinstance(pin, Pin):
+          ring = (pin.diameter - pin.hole) / 2.
+          if ring < limit - 1e-6:
+            violations.append(Violation("annular_ring", (pin,), ring, limit))
+
+    limit = limits.get("clearance")
+    if limit is not None:
+      outlines = dict((key, _copper_outline(s)) for key, s in copper.items())
+      for key in sorted(copper):
+        l, t, r, b, radius = outline = outlines[key]
+        margin = radius + limit
+        number = copper[key].number
+        for other, bounds in sorted(grid.search(
+            (l - margin, t - margin, r + margin, b + margin))):
+          if other <= key or other not in copper:
+            continue
+          if number != "" and copper[other].number == number:
+            continue
+          o = outlines[other]
+          gap = _box_distance(outline, o) - radius - o[4]
+          if gap < limit - 1e-6:
+            violations.append(Violation("clearance",
+                (copper[key], copper[other]), gap, limit))
+
+    limit = limits.get("silk_clearance")
+    if limit is not None:
+      for shape in silk:
+        half = shape.thickness / 2.
+        gaps = {}
+        for x1, y1, x2, y2 in _silk_segments(shape):
+          margin = half + limit
+          rect = (min(x1, x2) - margin, min(y1, y2) - margin,
+              max(x1, x2) + margin, max(y1, y2) + margin)
+          for key, bounds in grid.search(rect):
+            if key in copper:
+              o = _copper_outline(copper[key])
+              gap = _segment_box_distance(x1, y1, x2, y2, o[:4]) - o[4] - half
+              gaps[key] = min(gap, gaps.get(key, gap))
+        for key in sorted(gaps):
+          if gaps[key] < limit - 1e-6:
+            violations.append(Violation("silk_clearance",
+                (copper[key], shape), gaps[key], limit))
+    return violations
+
+  def metadata(self):
+    """Returns a dict of summary information about the footprint, as
+    recorded by FootprintIndex.
+
+    Lengths are in mils, and extents are relative to the mark. `rows` is
+    the number of rows (or columns, whichever there are fewer of) that
+    the pin and pad centers fall into, and `pitch` is the most common
+    spacing between neighbouring centers within a row; `pitch_min` and
+    `pitch_max` give its range. `pad_width`, `pad_height` and `hole` are
+    the most common pad size and drill diameter.
+    """
+    pins, pads = [], []
+    for shape in self.shapes:
+      for element in shape.elements():
+        if isinstance(element, Pin):
+          pins.append(element)
+        elif isinstance(element, Pad):
+          pads.append(element)
+    meta = {"name": self.name, "description": self.description,
+        "pins": len(pins), "pads": len(pads), "rows": 0,
+        "pitch": None, "pitch_min": None, "pitch_max": None,
+        "pad_width": _mode(p.width for p in pads),
+        "pad_height": _mode(p.height for p in pads),
+        "hole": _mode(p.hole for p in pins)}
+    bounds = self.bounds()
+    if bounds is not None:
+      left, top, right, bottom = bounds
+      meta.update(left=left-self.mark_x, top=top-self.mark_y,
+          right=right-self.mark_x, bottom=bottom-self.mark_y,
+          width=right-left, height=bottom-top)
+    else:
+      meta.update(left=None, top=None, right=None, bottom=None,
+          width=None, height=None)
+    centers = [(round(s.x, 2), round(s.y, 2)) for s in pins + pads]
+    if centers:
+      by_y, by_x = {}, {}
+      for x, y in centers:
+        by_y.setdefault(y, []).append(x)
+        by_x.setdefault(x, []).append(y)
+      rows = by_y if len(by_y) <= len(by_x) else by_x
+      steps = []
+      for row in rows.values():
+        row.sort()
+        steps.extend(round(b - a, 2) for a, b in zip(row, row[1:]) if b > a)
+      meta["rows"] = len(rows)
+      if steps:
+        meta.update(pitch=_mode(steps), pitch_min=min(steps),
+            pitch_max=max(steps))
+    return meta
+
+  def mark(self, pin_or_pad):
+    """Sets the mark position to the center of the given pin or pad."""
+    self.mark_x = pin_or_pad.x
+    self.mark_y = pin_or_pad.y
+
+  @classmethod
+  def load(cls, path):
+    """Reads a footprint from a pcb element file (e.g. one written by
+    write()).
+
+    Arguments:
+    path -- name of the file to read
+
+    Return value:
+    a new Footprint holding the file's first element
+
+    Pins, pads, silkscreen lines and arcs are rebuilt as Pin, Pad,
+    SilkLine and SilkArc objects with coordinates in mils, relative to
+    the same origin the element was laid out in (the mark translation
+    is undone, and mark_x/mark_y are restored). Clearances and solder
+    mask sizes are not read; the class defaults are used when the
+    footprint is written again. The footprint's name is taken from the
+    element's value field (where write() puts it), or failing that from
+    the file name without its extension.
+
+    Raises ValueError if the file contains no element, or a pad that
+    is not horizontal or vertical.
+    """
+    for footprint in _load_elements(path):
+      return footprint
+    raise ValueError("%s: no Element found" % path)
+
+  def save_snapshot(self, path, key=None):
+    """Saves the footprint, with its shapes as they are in memory, to a
+    binary snapshot file that load_snapshot() can read back far more
+    quickly than the footprint can be built again.
+
+    Arguments:
+    path -- name of the snapshot file
+    key -- (optional) string identifying the inputs the footprint was
+      built from, e.g. from snapshot_key(); load_snapshot() only returns
+      the footprint when asked for the same key
+
+    The snapshot is written to a temporary file that then replaces
+    `path`. Formulas recorded for shapes in a footprint created with
+    track_dependencies=True are not saved.
+
+    Raises TypeError if a shape is of a type that cannot be saved, or
+    has a number or name that is not a string or an integer.
+    """
+    data = b"".join(_snapshot_records(self, key))
+    with open(path + ".tmp", "wb") as f:
+      f.write(data)
+    os.replace(path + ".tmp", path)
+
+  @classmethod
+  def load_snapshot(cls, path, key=None):
+    """Loads a footprint saved by save_snapshot().
+
+    Arguments:
+    path -- name of the snapshot file
+    key -- (optional) the key the footprint must have been saved under
+
+    Return value:
+    the footprint; or, if a key is given, None if there is no snapshot
+    file, or it was saved under a different key or by a different
+    version of the snapshot format
+
+    Raises ValueError if the file is not a snapshot, or is damaged.
+    """
+    if key is None:
+      with open(path, "rb") as f:
+        data = f.read()
+    else:
+      try:
+        with open(path, "rb") as f:
+          data = f.read()
+      except (IOError, OSError):
+        return None
+    return _read_snapshot(cls, data, path, key)
+
+  def iter_lines(self):
+    """Generates the pcb representation of the footprint piece by piece.
+
+    Each item is one line of output, including its trailing newline;
+    joining them gives the same text as str(). Shapes are serialized as
+    they are reached, so the whole element is never held in memory.
+    """
+    yield _PCB_FORMATS["Element"] % self._element_fields() + "\n"
+    tx, ty = -self.mark_x, -self.mark_y
+    empty = True
+    for shape in self.shapes:
+      for line in shape.pcb_lines(tx, ty):
+        empty = False
+        yield line + "\n"
+    if empty:
+      yield "\n"
+    yield ")\n"
+
+  def _element_fields(self):
+    """Returns the fields of the footprint's "Element" record."""
+    return (self.description, self.name,
+        _mil_to_unit(self.mark_x), _mil_to_unit(self.mark_y),
+        _mil_to_unit(self.text_x), _mil_to_unit(self.text_y),
+        self.text_direction, self.text_scale)
+
+  def records(self):
+    """Generates the footprint in a format-neutral intermediate form.
+
+    The first item is ("Element", fields), where `fields` are the
+    footprint's description, name, mark_x, mark_y, text_x, text_y,
+    text_direction and text_scale. It is followed by the records of each
+    shape in turn (see Shape.records()). Lengths are integers in 1/100
+    mils, and the coordinates of shapes are relative to the mark.
+
+    Emitters (see `emitters`) turn these records into files; export()
+    uses one pass over them to write any number of formats.
+    """
+    yield "Element", self._element_fields()
+    tx, ty = -self.mark_x, -self.mark_y
+    for shape in self.shapes:
+      for record in shape.records(tx, ty):
+        yield record
+
+  def export(self, outputs):
+    """Writes the footprint in several formats at once.
+
+    Arguments:
+    outputs -- dict of format name (a key of `emitters`) -> filename or
+      open text file object; or a list of format names, in which case
+      each format is written to a file named after the footprint with
+      the emitter's extension
+
+    The shapes are traversed once, and each record is passed to every
+    format's emitter in turn, so the geometry is computed only once
+    however many formats are written.
+    """
+    if not isinstance(outputs, dict):
+      outputs = dict((format, self.name + emitters[format].extension)
+          for format in outputs)
+    targets, opened = [], []
+    try:
+      for format, output in sorted(outputs.items()):
+        if not hasattr(output, "write"):
+          output = open(output, "w")
+          opened.append(output)
+        targets.append((emitters[format](), output))
+      for kind, fields in self.records():
+        for emitter, output in targets:
+          output.write(emitter.emit(kind, fields))
+      for emitter, output in targets:
+        output.write(emitter.end())
+    finally:
+      for f in opened:
+        f.close()
+
+  def write_to(self, fileobj):
+    """Writes the footprint in pcb format to an open file object.
+
+    Arguments:
+    fileobj -- any object with a write() method; text files (including
+      sys.stdout) receive str, binary files and buffers (e.g. io.BytesIO
+      or a pipe opened in binary mode) receive UTF-8 encoded bytes
+
+    Return value:
+    the number of characters written
+    """
+    written = 0
+    if _is_binary(fileobj):
+      for line in self.iter_lines():
+        fileobj.write(line.encode("utf-8"))
+        written += len(line)
+    else:
+      for line in self.iter_lines():
+        fileobj.write(line)
+        written += len(line)
+    return written
+
+  def digest(self):
+    """Returns the SHA-1 hex digest of the footprint's UTF-8 encoded pcb
+    representation."""
+    h = hashlib.sha1()
+    for line in self.iter_lines():
+      h.update(line.encode("utf-8"))
+    return h.hexdigest()
+
+  def geometry_digest(self):
+    """Returns the SHA-1 hex digest of the footprint's geometry.
+
+    Footprints that differ only in their name and description, the order
+    their shapes were added in, the direction silkscreen lines are drawn
+    in, or whether pins and pads were added one by one or as arrays, have
+    the same geometry digest. Coordinates are taken relative to the mark
+    and rounded to 1/100 mil, so a footprint read back with load() has
+    the digest of the one that was written.
+    """
+    lines = []
+    for kind, fields in self.records():
+      if kind == "Element":
+        fields = fields[4:]
+        line = "%d %d %d %d" % fields
+      else:
+        if kind == "ElementLine" and fields[2:4] < fields[:2]:
+          fields = fields[2:4] + fields[:2] + fields[4:]
+        line = _PCB_FORMATS[kind] % fields
+      lines.append(line)
+    lines[1:] = sorted(lines[1:])
+    h = hashlib.sha1()
+    for line in lines:
+      h.update(line.encode("utf-8") + b"\n")
+    return h.hexdigest()
+
+  def __str__(self):
+    """Returns a string representation of the footprint in pcb format."""
+    if self.profiler is None:
+      return "".join(self.iter_lines())
+    start = time.perf_counter()
+    text = "".join(self.iter_lines())
+    self.profiler.serialized(self, start, time.perf_counter() - start)
+    return text
+
+  def write(self, filename=None):
+    """Writes the footprint to a file with the given name (or, if `pack`
+    is set, adds it to the pack).
+
+    If `formats` names formats other than "geda", the footprint is also
+    (or instead) written in those, to files with the same name but the
+    emitter's extension; see export().
+    """
+    if filename is None:
+      filename = os.path.splitext(sys.argv[0])[0] + ".fp"
+    if self.profiler is None:
+      self._write(filename)
+      return
+    # serialize first, so that the profiler times it apart from writing
+    files = None if self.pack is not None else self._render(filename)
+    start = time.perf_counter()
+    written = self._write(filename, files)
+    self.profiler.written(self, start, time.perf_counter() - start,
+        sum(os.path.getsize(name) for name in written))
+
+  def _write(self, filename, files=None):
+    """Implements write(). `files` is the result of _render(), if the
+    footprint has been serialized already. Returns the names of the files
+    written (files left untouched by the output cache are not
+    included)."""
+    if self.pack is not None:
+      self.pack.add(self)
+      return []
+    if files is not None or tuple(self.formats) != ("geda",):
+      if files is None:
+        files = self._render(filename)
+      if "geda" in self.formats and self.metadata_index is not None:
+        self.metadata_index.record(self, filename)
+      return [name for name, text in files if self._store(name, text)]
+    cache = self.output_cache
+    if cache is not None:
+      digest = self.digest()
+      if cache.check(filename, digest):
+        if self.metadata_index is not None:
+          self.metadata_index.record(self, filename)
+        return []
+    with open(filename, "w") as f:
+      self.write_to(f)
+    if cache is not None:
+      cache.update(filename, digest)
+    if self.metadata_index is not None:
+      self.metadata_index.record(self, filename)
+    if _run_log is not None:
+      _run_log.append((self.name, filename, None))
+    return [filename]
+
+  def _render(self, filename):
+    """Returns a list of (filename, text) tuples, one for each of the
+    files write() produces for `filename`. The time taken is recorded
+    in the profiler, if one is set."""
+    start = time.perf_counter()
+    if tuple(self.formats) == ("geda",):
+      files = [(filename, "".join(self.iter_lines()))]
+    else:
+      base = os.path.splitext(filename)[0]
+      buffers = dict((format, io.StringIO()) for format in self.formats)
+      self.export(buffers)
+      files = [(filename if format == "geda" else
+          base + emitters[format].extension, buffers[format].getvalue())
+          for format in self.formats]
+    if self.profiler is not None:
+      self.profiler.serialized(self, start, time.perf_counter() - start)
+    return files
+
+  def _store(self, filename, text):
+    """Writes text rendered by _render() to a file, unless the output
+    cache knows the file already holds it. Returns True if the file was
+    written."""
+    cache = self.output_cache
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    if cache is not None and cache.check(filename, digest):
+      return False
+    with open(filename, "w") as f:
+      f.write(text)
+    if cache is not None:
+      cache.update(filename, digest)
+    if _run_log is not None:
+      _run_log.append((self.name, filename, None))
+    return True
+
+
+
+class GedaEmitter(object):
+  """Writes the records of Footprint.records() as a gEDA pcb element, the
+  same text str() returns.
+
+  An emitter is created for each footprint written. emit() is called
+  with each record in turn and end() after the last one; both return the
+  text to write.
+  """
+
+  extension = ".fp"
+
+  def __init__(self):
+    self.empty = True
+
+  def emit(self, kind, fields):
+    if kind != "Element":
+      self.empty = False
+    return _PCB_FORMATS[kind] % fields + "\n"
+
+  def end(self):
+    return ("\n" if self.empty else "") + ")\n"
+
+
+def _kicad_mm(value):
+  """Formats a length in 1/100 mils as millimeters for a KiCad file."""
+  text = ("%.6f" % (value * 0.000254)).rstrip("0").rstrip(".")
+  return "0" if text == "-0" else text
+
+
+def _kicad_string(text):
+  """Quotes a string for a KiCad file."""
+  return '"%s"' % str(text).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class KicadEmitter(object):
+  """Writes the records of Footprint.records() as a KiCad footprint (the
+  .kicad_mod S-expression format of KiCad 6 and later). See GedaEmitter.
+
+  Pads become SMD pads on the front copper, paste and mask layers; pins
+  become plated through-hole pads; lines and arcs go on the front
+  silkscreen. pcb's clearance and mask sizes are converted to KiCad's
+  per-pad clearance and solder mask margin. KiCad has no elliptical
+  arcs, so arcs with different x and y radii are written as line
+  segments.
+  """
+
+  extension = ".kicad_mod"
+
+  def emit(self, kind, fields):
+    return getattr(self, "_" + kind)(*fields)
+
+  def end(self):
+    return ")\n"
+
+  def _Element(self, description, name, mark_x, mark_y, text_x, text_y,
+      text_direction, text_scale):
+    at = "%s %s" % (_kicad_mm(text_x), _kicad_mm(text_y))
+    if text_direction % 4:
+      at += " %d" % (text_direction % 4 * 90)
+    # KiCad's default 1 mm text for pcb's 100% scale
+    size = "%g" % (text_scale / 100.)
+    effects = "(effects (font (size %s %s) (thickness 0.15)))" % (size, size)
+    lines = ["(footprint %s (version 20211014) (generator footprint)" %
+        _kicad_string(name), '  (layer "F.Cu")']
+    if description:
+      lines.append("  (descr %s)" % _kicad_string(description))
+    lines.append('  (fp_text reference "REF**" (at %s) (layer "F.SilkS") %s)'
+        % (at, effects))
+    lines.append('  (fp_text value %s (at %s) (layer "F.Fab") %s)'
+        % (_kicad_string(name), at, effects))
+    return "\n".join(lines) + "\n"
+
+  @staticmethod
+  def _margins(size, clearance, mask):
+    margins = ""
+    if mask != size:
+      margins += " (solder_mask_margin %s)" % _kicad_mm((mask - size) / 2.)
+    if clearance:
+      margins += " (clearance %s)" % _kicad_mm(clearance / 2.)
+    return margins
+
+  def _Pad(self, x1, y1, x2, y2, thickness, clearance, mask, name, number,
+      flags):
+    width = abs(x2 - x1) + thickness
+    height = abs(y2 - y1) + thickness
+    if flags & 0x100:
+      shape = "rect"
+    else:
+      shape = "circle" if width == height else "oval"
+    return ('  (pad %s smd %s (at %s %s) (size %s %s) '
+        '(layers "F.Cu" "F.Paste" "F.Mask")%s)\n' % (
+        _kicad_string(number), shape, _kicad_mm((x1 + x2) / 2.),
+        _kicad_mm((y1 + y2) / 2.), _kicad_mm(width), _kicad_mm(height),
+        self._margins(thickness, clearance, mask)))
+
+  def _Pin(self, x, y, diameter, clearance, mask, hole, name, number,
+      flags):
+    return ('  (pad %s thru_hole %s (at %s %s) (size %s %s) (drill %s) '
+        '(layers "*.Cu" "*.Mask")%s)\n' % (
+        _kicad_string(number), "rect" if flags & 0x100 else "circle",
+        _kicad_mm(x), _kicad_mm(y), _kicad_mm(diameter), _kicad_mm(diameter),
+        _kicad_mm(hole), self._margins(diameter, clearance, mask)))
+
+  def _ElementLine(self, x1, y1, x2, y2, thickness):
+    return ('  (fp_line (start %s %s) (end %s %s) (layer "F.SilkS") '
+        '(width %s))\n' % (_kicad_mm(x1), _kicad_mm(y1), _kicad_mm(x2),
+        _kicad_mm(y2), _kicad_mm(thickness)))
+
+  def _ElementArc(self, x, y, x_radius, y_radius, start_angle, delta_angle,
+      thickness):
+    def point(angle):
+      # pcb measures angles from the -x axis, counterclockwise on screen
+      a = math.radians(angle)
+      return (_kicad_mm(x - x_radius * math.cos(a)),
+          _kicad_mm(y + y_radius * math.sin(a)))
+    width = _kicad_mm(thickness)
+    if x_radius == y_radius and abs(delta_angle) >= 360:
+      return ('  (fp_circle (center %s %s) (end %s %s) (layer "F.SilkS") '
+          '(width %s))\n' % (_kicad_mm(x), _kicad_mm(y),
+          _kicad_mm(x + x_radius), _kicad_mm(y), width))
+    if x_radius == y_radius:
+      return ('  (fp_arc (start %s %s) (mid %s %s) (end %s %s) '
+          '(layer "F.SilkS") (width %s))\n' % (point(start_angle) +
+          point(start_angle + delta_angle / 2.) +
+          point(start_angle + delta_angle) + (width,)))
+    steps = max(1, int(math.ceil(abs(delta_angle) / 5.625)))
+    points = [point(start_angle + delta_angle * i / float(steps))
+        for i in range(steps + 1)]
+    return "".join('  (fp_line (start %s %s) (end %s %s) '
+        '(layer "F.SilkS") (width %s))\n' % (p + q + (width,))
+        for p, q in zip(points, points[1:]))
+
+
+# Emitters available to Footprint.export() and Footprint.formats, by
+# format name. Other formats can be added by registering a class with the
+# interface of GedaEmitter.
+emitters = {"geda": GedaEmitter, "kicad": KicadEmitter}
+
+
+def use_formats(*formats):
+  """Makes Footprint.write() produce the given formats (names of
+  `emitters`, e.g. use_formats("geda", "kicad")) for every footprint.
+
+  This is also done when the module is imported if the FOOTPRINT_FORMATS
+  environment variable is set to a comma-separated list of formats.
+  """
+  for format in formats:
+    if format not in emitters:
+      raise ValueError("unknown format %r (known formats: %s)" % (
+          format, ", ".join(sorted(emitters))))
+  Footprint.formats = tuple(formats)
+
+
+
+class Violation(object):
+  """A design rule violation found by Footprint.check().
+
+  Attributes:
+  rule -- the rule that was broken: "clearance", "annular_ring" or
+    "silk_clearance"
+  shapes -- the shapes involved: the pin for annular_ring, otherwise the
+    two shapes (copper first for silk_clearance)
+  value -- the measured gap or ring width, in mils; a negative gap means
+    the shapes overlap
+  limit -- the minimum the rule allows, in mils
+  """
+
+  __slots__ = ("rule", "shapes", "value", "limit")
+
+  def __init__(self, rule, shapes, value, limit):
+    self.rule = rule
+    self.shapes = shapes
+    self.value = value
+    self.limit = limit
 
   def __str__(self):
-    """Returns a string representation of the footprint in pcb format."""
-    s = "Element[\"\" \"%s\" \"\" \"%s\" %d %d %d %d %d %d \"\"] (\n" % (
-        self.description, self.name,
-        _mil_to_unit(self.mark_x), _mil_to_unit(self.mark_y),
-        _mil_to_unit(self.text_x), _mil_to_unit(self.text_y),
-        self.text_direction, self.text_scale)
-    s += "\n".join(s.pcb_repr(-self.mark_x, -self.mark_y) for s in self.shapes)
-    s += "\n)\n"
-    return s
+    names = " and ".join(_shape_label(s) for s in self.shapes)
+    if self.rule == "annular_ring":
+      what = "%s has a %.2f mil ring" % (names, self.value)
+    elif self.value < 0:
+      what = "%s overlap" % names
+    else:
+      what = "%s are %.2f mil apart" % (names, self.value)
+    return "%s: %s (minimum %.2f mil)" % (self.rule, what, self.limit)
 
-  def write(self, filename=None):
-    """Writes the footprint to a file with the given name."""
+  def __repr__(self):
+    return "<Violation %s>" % self
+
+
+def _shape_label(shape):
+  if isinstance(shape, (Pin, Pad)):
+    kind = "pin" if isinstance(shape, Pin) else "pad"
+    if shape.number == "":
+      return "unnumbered " + kind
+    return "%s %s" % (kind, shape.number)
+  for cls, label in ((SilkLine, "silk line"),
+      (SilkPolyline, "silk polyline"), (SilkArc, "silk arc")):
+    if isinstance(shape, cls):
+      return label
+  return type(shape).__name__
+
+
+def _copper_outline(shape):
+  """Returns the copper of a pin or pad as (left, top, right, bottom,
+  radius): an axis-aligned box, possibly flattened to a line or a point,
+  grown by a radius. This describes square and round pins, and square
+  and round-ended pads, exactly."""
+  if isinstance(shape, Pin):
+    r = shape.diameter / 2.
+    if shape.round:
+      return shape.x, shape.y, shape.x, shape.y, r
+    return shape.x - r, shape.y - r, shape.x + r, shape.y + r, 0
+  if not shape.round:
+    return shape.left, shape.top, shape.right, shape.bottom, 0
+  r = min(shape.width, shape.height) / 2.
+  return (shape.left + r, shape.top + r,
+      shape.right - r, shape.bottom - r, r)
+
+
+def _box_distance(a, b):
+  """Returns the distance between two (left, top, right, bottom) boxes."""
+  dx = max(0, b[0] - a[2], a[0] - b[2])
+  dy = max(0, b[1] - a[3], a[1] - b[3])
+  return math.hypot(dx, dy)
+
+
+def _point_segment_distance(x, y, x1, y1, x2, y2):
+  dx, dy = x2 - x1, y2 - y1
+  length = dx*dx + dy*dy
+  t = 0 if length == 0 else max(0, min(1, ((x-x1)*dx + (y-y1)*dy) / length))
+  return math.hypot(x - x1 - t*dx, y - y1 - t*dy)
+
+
+def _segment_box_distance(x1, y1, x2, y2, box):
+  """Returns the distance between a line segment and a (left, top,
+  right, bottom) box; 0 if they intersect."""
+  left, top, right, bottom = box
+  # clip the segment to the box (Liang-Barsky); anything left means the
+  # two intersect
+  dx, dy = x2 - x1, y2 - y1
+  t0, t1 = 0., 1.
+  for p, q in ((-dx, x1 - left), (dx, right - x1),
+      (-dy, y1 - top), (dy, bottom - y1)):
+    if p == 0:
+      if q < 0:
+        break
+    elif p < 0:
+      t0 = max(t0, q / p)
+    else:
+      t1 = min(t1, q / p)
+    if t0 > t1:
+      break
+  else:
+    return 0.
+  # otherwise the closest points include an end of the segment or a
+  # corner of the box
+  return min(_box_distance((x1, y1, x1, y1), box),
+      _box_distance((x2, y2, x2, y2), box),
+      *(_point_segment_distance(x, y, x1, y1, x2, y2)
+          for x in (left, right) for y in (top, bottom)))
+
+
+def _silk_segments(shape):
+  """Returns a list of the (x1, y1, x2, y2) center line segments of a
+  silkscreen shape. Arcs are flattened into segments of at most 5.625
+  degrees, which are within 0.5% of the radius of the true arc."""
+  if isinstance(shape, SilkLine):
+    return [(shape.x1, shape.y1, shape.x2, shape.y2)]
+  if isinstance(shape, SilkPolyline):
+    return list(shape.segment_coords())
+  if isinstance(shape, SilkArc):
+    start, delta = shape.start_angle, shape.delta_angle
+    count = max(1, int(math.ceil(abs(delta) / 5.625)))
+    points = [shape.point_at(start + delta * i / count)
+        for i in range(count + 1)]
+    return [p + q for p, q in zip(points, points[1:])]
+  return []
+
+
+def check_library(paths, rules=None, extension=".fp"):
+  """Checks every footprint in a library against design rules.
+
+  Arguments:
+  paths -- a footprint file or directory of footprint files, or a list
+    of them (subdirectories are not searched)
+  rules -- (optional) rules to check; see Footprint.check()
+  extension -- extension of the files to read in directories (defaults
+    to ".fp")
+
+  Return value:
+  a list of (footprint, list of Violations) tuples, one per footprint
+  read, in the order they were read
+  """
+  if isinstance(paths, str):
+    paths = [paths]
+  results = []
+  for path in paths:
+    if os.path.isdir(path):
+      footprints = load_library(path, extension)
+    else:
+      footprints = _load_elements(path)
+    results.extend((f, f.check(rules)) for f in footprints)
+  return results
+
+
+
+class FootprintTemplate(object):
+  """A function that builds a Footprint from parameters, with its
+  results cached. Created with the footprint_template() decorator.
+
+  Calling the template returns the footprint for the given arguments,
+  calling the underlying function only the first time they are seen.
+  text() also caches the footprint's pcb representation for the given
+  arguments. The `maxsize` most recently used parameter sets are kept.
+
+  Footprints returned by a template are shared between callers with
+  the same arguments, and must not be modified.
+  """
+
+  def __init__(self, function, maxsize=128):
+    self.function = function
+    self.maxsize = maxsize
+    self.__name__ = function.__name__
+    self.__doc__ = function.__doc__
+    self._cache = {}  # parameters -> Footprint, least recently used first
+    self._texts = {}  # parameters -> pcb representation
+    self.hits = self.misses = self.text_hits = self.text_misses = 0
+
+  @staticmethod
+  def _key(args, kwargs):
+    key = args
+    if kwargs:
+      key += (FootprintTemplate,) + tuple(sorted(kwargs.items()))
+    return key
+
+  def __call__(self, *args, **kwargs):
+    return self._get(self._key(args, kwargs), args, kwargs)
+
+  def _get(self, key, args, kwargs):
+    cache = self._cache
+    footprint = cache.pop(key, None)
+    if footprint is not None:
+      self.hits += 1
+    else:
+      self.misses += 1
+      footprint = self.function(*args, **kwargs)
+      if not isinstance(footprint, Footprint):
+        raise TypeError("template %s returned %s, not a Footprint" % (
+            self.__name__, type(footprint).__name__))
+      if self.maxsize is not None:
+        while cache and len(cache) >= self.maxsize:
+          oldest = next(iter(cache))
+          del cache[oldest]
+          self._texts.pop(oldest, None)
+    cache[key] = footprint
+    return footprint
+
+  def text(self, *args, **kwargs):
+    """Returns the pcb representation of the footprint for the given
+    arguments."""
+    key = self._key(args, kwargs)
+    footprint = self._get(key, args, kwargs)
+    text = self._texts.get(key)
+    if text is None:
+      self.text_misses += 1
+      text = self._texts[key] = str(footprint)
+    else:
+      self.text_hits += 1
+    return text
+
+  def cache_info(self):
+    """Returns a dict of cache statistics: hits and misses for
+    footprints and for their text, and the current and maximum number
+    of cached footprints."""
+    return {"hits": self.hits, "misses": self.misses,
+        "text_hits": self.text_hits, "text_misses": self.text_misses,
+        "size": len(self._cache), "maxsize": self.maxsize}
+
+  def cache_clear(self):
+    """Empties the cache and resets the statistics."""
+    self._cache.clear()
+    self._texts.clear()
+    self.hits = self.misses = self.text_hits = self.text_misses = 0
+
+
+# Every FootprintTemplate created by footprint_template(), by name.
+templates = {}
+
+def footprint_template(function=None, maxsize=128):
+  """Decorator that turns a function returning a Footprint into a
+  cached FootprintTemplate, e.g.
+
+    @footprint_template
+    def soic(pins, pitch=1.27*mm):
+      f = Footprint("SOIC-%d" % pins)
+      ...
+      return f
+
+  Arguments:
+  function -- the function to wrap; its arguments must be hashable
+
+  Keyword arguments:
+  maxsize -- number of parameter sets to keep footprints for, or None
+    for no limit (optional; defaults to 128); use as
+    @footprint_template(maxsize=...)
+
+  The function should return its footprint rather than writing it with
+  a `with` statement, which would only happen on a cache miss. The
+  template is also recorded in `templates` under the function's name;
+  see template_stats().
+  """
+  if function is None:
+    return lambda function: footprint_template(function, maxsize)
+  template = FootprintTemplate(function, maxsize)
+  templates[function.__name__] = template
+  return template
+
+
+def template_stats():
+  """Returns a dict mapping the name of each template to its
+  cache_info()."""
+  return dict((name, t.cache_info()) for name, t in sorted(templates.items()))
+
+
+
+def _mode(values):
+  """Returns the most common of the given values (the smallest, if
+  there is a tie), or None if there are none."""
+  counts = {}
+  for value in values:
+    counts[value] = counts.get(value, 0) + 1
+  if not counts:
+    return None
+  return min(counts, key=lambda v: (-counts[v], v))
+
+
+def _is_binary(fileobj):
+  """Returns True if `fileobj` expects bytes rather than str."""
+  if isinstance(fileobj, io.TextIOBase):
+    return False
+  if isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)):
+    return True
+  return "b" in getattr(fileobj, "mode", "")
+
+
+
+# One record of a pcb file: a keyword, an opening bracket (square for
+# 1/100 mil units, round for mils) and its fields. Quoted strings may
+# contain brackets.
+_RECORD_RE = re.compile(
+    rb'([A-Za-z]+)\s*([\[(])((?:"(?:[^"\\]|\\.)*"|[^"\[\]()])*)[\])]')
+_FIELD_RE = re.compile(rb'"((?:[^"\\]|\\.)*)"|([^\s"]+)')
+_NUMBER_RE = re.compile(r'([-+]?[0-9.]+(?:[eE][-+]?[0-9]+)?)([a-z]*)$')
+_UNITS = {"mil": 1.0, "mm": mm, "um": mm/1000., "nm": mm/1e6,
+    "cm": mm*10, "in": 1000.0, "inch": 1000.0}
+
+
+def _parse_fields(body):
+  """Splits the body of a record into a list of fields. Quoted strings
+  are returned as str, anything else as bytes."""
+  fields = []
+  for quoted, bare in _FIELD_RE.findall(body):
+    if bare:
+      fields.append(bare)
+    else:
+      fields.append(quoted.replace(b'\\"', b'"').decode("utf-8", "replace"))
+  return fields
+
+
+def _record_unit(bracket):
+  """Returns a function that converts a numeric field of a record opened
+  with `bracket` to mils."""
+  scale = 0.01 if bracket == b"[" else 1.0
+  def unit(value):
+    number, suffix = _NUMBER_RE.match(value.decode("ascii")).groups()
+    if suffix:
+      return float(number) * _UNITS[suffix]
+    return float(number) * scale
+  return unit
+
+
+def _pcb_records(text):
+  """Parses pcb text, such as a shape's pcb_repr(), into the (kind,
+  fields) records described in Shape.records()."""
+  records = []
+  for match in _RECORD_RE.finditer(text.encode("utf-8")):
+    kind = match.group(1).decode("ascii")
+    unit = _record_unit(match.group(2))
+    fields = _parse_fields(match.group(3))
+    values = []
+    for i, field in enumerate(fields):
+      if kind in ("Pad", "Pin") and i == len(fields) - 1:
+        # flags, as a number or a list of names
+        if isinstance(field, str):
+          field = ((0x1 if kind == "Pin" else 0) |
+              (0x100 if "square" in _parse_flags(field) else 0))
+        else:
+          field = int(field, 0)
+      elif kind == "ElementArc" and i in (4, 5):
+        field = _int_if_whole(float(field))
+      elif not isinstance(field, str):
+        field = _mil_to_unit(unit(field))
+      values.append(field)
+    records.append((kind, tuple(values)))
+  return records
+
+
+def _shapes_from_records(records):
+  """Returns built-in shapes equivalent to (kind, fields) records, as
+  given by Shape.records(). Pins and pads keep the clearance and mask
+  offset of their records."""
+  shapes = []
+  for kind, fields in records:
+    text = _PCB_FORMATS[kind] % fields
+    match = _RECORD_RE.match(text.encode("utf-8"))
+    shape = _SHAPE_PARSERS[match.group(1)](_parse_fields(match.group(3)),
+        _record_unit(match.group(2)), 0, 0)
+    if kind == "Pad":
+      settings = {"clearance": fields[5] / 100.}
+    elif kind == "Pin":
+      settings = {"clearance": fields[3] / 100.,
+          "mask_offset": (fields[4] - fields[2]) / 100.}
+    else:
+      settings = {}
+    for name, value in settings.items():
+      if value != getattr(shape, name):
+        setattr(shape, name, value)
+    shapes.append(shape)
+  return shapes
+
+
+def _parse_flags(field):
+  """Returns the flags field of a record as a set of flag names."""
+  if isinstance(field, str):
+    return set(field.split(","))
+  flags = int(field, 0)
+  return {"square"} if flags & 0x100 else set()
+
+
+def _load_elements(path):
+  """Generates a Footprint for each element in a pcb file.
+
+  The file is memory-mapped, and only the records that make up elements
+  (Element, Pin, Pad, ElementLine and ElementArc) are looked at.
+  """
+  with open(path, "rb") as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return
+    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      default_name = os.path.splitext(os.path.basename(path))[0]
+      for footprint in _parse_elements(buf, default_name):
+        yield footprint
+    finally:
+      buf.close()
+
+
+def _parse_elements(buf, default_name):
+  """Generates a Footprint for each element in a buffer (bytes or an
+  mmap) holding pcb file contents. See _load_elements()."""
+  footprint = None
+  for match in _RECORD_RE.finditer(buf):
+    keyword = match.group(1)
+    unit = _record_unit(match.group(2))
+    fields = _parse_fields(match.group(3))
+    if keyword == b"Element":
+      if footprint is not None:
+        yield footprint
+      footprint = _element_from_fields(fields, unit, default_name)
+    elif footprint is None:
+      continue
+    elif keyword in _SHAPE_PARSERS:
+      shape = _SHAPE_PARSERS[keyword](fields, unit,
+          footprint.mark_x, footprint.mark_y)
+      if isinstance(shape, (Pin, Pad)):
+        footprint._add_numbered(shape)
+      else:
+        footprint._add_shape(shape)
+  if footprint is not None:
+    yield footprint
+
+
+def _element_from_fields(fields, unit, default_name):
+  """Creates an empty Footprint from the fields of an Element record."""
+  strings = [f for f in fields if isinstance(f, str)]
+  numbers = [f for f in fields[1:] if not isinstance(f, str)]
+  # [SFlags "Desc" "Name" "Value" MX MY TX TY TDir TScale TSFlags];
+  # older formats have no value, no mark, or no flags
+  if isinstance(fields[0], str) and len(strings) >= 3:
+    strings = strings[1:]
+  description = strings[0] if strings else ""
+  # write() puts the footprint's name in the value field; the name field
+  # holds a reference designator
+  name = strings[2] if len(strings) > 2 and strings[2] else default_name
+  footprint = Footprint(name, description=description)
+  if len(numbers) >= 6:
+    footprint.mark_x, footprint.mark_y = unit(numbers[0]), unit(numbers[1])
+    numbers = numbers[2:]
+  if len(numbers) >= 4:
+    footprint.text_x, footprint.text_y = unit(numbers[0]), unit(numbers[1])
+    footprint.text_direction = int(numbers[2])
+    footprint.text_scale = int(numbers[3])
+  return footprint
+
+
+def _pin_number(strings):
+  """Returns the pin number from the strings of a Pin or Pad record,
+  as an int if it is one (as in footprints created by this module)."""
+  number = strings[1] if len(strings) > 1 else ""
+  return int(number) if number.isdigit() else number
+
+
+def _split_record(fields):
+  """Splits shape record fields into leading numbers, strings and the
+  trailing flags."""
+  numbers = []
+  for field in fields:
+    if isinstance(field, str):
+      break
+    numbers.append(field)
+  strings = [f for f in fields[len(numbers):-1] if isinstance(f, str)]
+  return numbers, strings, fields[-1]
+
+
+def _pin_from_fields(fields, unit, mx, my):
+  # [X Y Thickness Clearance Mask Drill "Name" "Number" SFlags], or
+  # (X Y Thickness Drill "Name" ["Number"] NFlags) in older files
+  numbers, strings, flags = _split_record(fields)
+  values = [unit(n) for n in numbers]
+  x, y, thickness = values[:3]
+  hole = values[5] if len(values) >= 6 else values[-1]
+  name = strings[0] if strings else ""
+  return Pin(x=x+mx, y=y+my, hole=hole, diameter=thickness, name=name,
+      number=_pin_number(strings), round="square" not in _parse_flags(flags))
+
+
+def _pad_from_fields(fields, unit, mx, my):
+  # [X1 Y1 X2 Y2 Thickness Clearance Mask "Name" "Number" SFlags], or
+  # (X1 Y1 X2 Y2 Thickness "Name" "Number" NFlags) in older files
+  numbers, strings, flags = _split_record(fields)
+  x1, y1, x2, y2, thickness = [unit(n) for n in numbers[:5]]
+  if x1 != x2 and y1 != y2:
+    raise ValueError("diagonal pads are not supported")
+  half = thickness/2.
+  name = strings[0] if strings else ""
+  return Pad(left=min(x1, x2)-half+mx, top=min(y1, y2)-half+my,
+      width=abs(x2-x1)+thickness, height=abs(y2-y1)+thickness,
+      name=name, number=_pin_number(strings),
+      round="square" not in _parse_flags(flags))
+
+
+def _line_from_fields(fields, unit, mx, my):
+  # [X1 Y1 X2 Y2 Thickness]
+  x1, y1, x2, y2, thickness = [unit(f) for f in fields[:5]]
+  return SilkLine(x1+mx, y1+my, x2+mx, y2+my, thickness=thickness)
+
+
+def _arc_from_fields(fields, unit, mx, my):
+  # [X Y Width Height StartAngle DeltaAngle Thickness]
+  x, y, x_radius, y_radius = [unit(f) for f in fields[:4]]
+  start_angle, delta_angle = [float(f) for f in fields[4:6]]
+  return SilkArc(x+mx, y+my, x_radius=x_radius, y_radius=y_radius,
+      start_angle=_int_if_whole(start_angle),
+      delta_angle=_int_if_whole(delta_angle),
+      thickness=unit(fields[6]))
+
+
+def _int_if_whole(value):
+  return int(value) if value == int(value) else value
+
+
+_SHAPE_PARSERS = {
+  b"Pin": _pin_from_fields,
+  b"Pad": _pad_from_fields,
+  b"ElementLine": _line_from_fields,
+  b"ElementArc": _arc_from_fields,
+}
+
+
+def load_library(directory, extension=".fp"):
+  """Reads every footprint file in a directory.
+
+  Arguments:
+  directory -- directory to read (subdirectories are not searched)
+  extension -- extension of the files to read (defaults to ".fp")
+
+  Return value:
+  a list of Footprints, in file name order; a file containing several
+  elements contributes one Footprint per element
+  """
+  footprints = []
+  for filename in sorted(os.listdir(directory)):
+    if filename.endswith(extension):
+      footprints.extend(_load_elements(os.path.join(directory, filename)))
+  return footprints
+
+
+def find_duplicates(paths, extension=".fp"):
+  """Finds footprint files with identical geometry.
+
+  Arguments:
+  paths -- a footprint file or directory of footprint files, or a list
+    of them (subdirectories are not searched)
+  extension -- extension of the files to read in directories (defaults
+    to ".fp")
+
+  Return value:
+  a list of groups of two or more files whose footprints have the same
+  geometry_digest(), each a sorted list of paths, in order of their
+  first path. The names and descriptions of the footprints are ignored.
+  A file containing several elements matches only a file with the same
+  elements in the same order.
+  """
+  if isinstance(paths, str):
+    paths = [paths]
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      files.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+          if f.endswith(extension))
+    else:
+      files.append(path)
+  groups = {}
+  for path in files:
+    key = tuple(f.geometry_digest() for f in _load_elements(path))
+    if key:
+      groups.setdefault(key, []).append(path)
+  return sorted(sorted(group) for group in groups.values() if len(group) > 1)
+
+
+def link_duplicates(groups, aliases=None):
+  """Stores one copy of each group of duplicate files.
+
+  Arguments:
+  groups -- groups of files, as returned by find_duplicates(); the first
+    file of each group is kept
+  aliases -- (optional) path of a JSON file to record the other files in,
+    as a map of removed file -> kept file (both relative to the directory
+    of the JSON file, which is updated if it exists). If not given, the
+    other files are replaced by hard links to the kept one.
+
+  Return value:
+  the number of bytes freed
+
+  Hard-linked files share their contents, so each of them contains the
+  name of the kept footprint. Writing to one of them in place (e.g. with
+  Footprint.write()) changes all of them; `build` replaces files rather
+  than writing to them, so it is safe to run on a linked library.
+  """
+  mapping = {}
+  if aliases is not None:
+    base = os.path.dirname(os.path.abspath(aliases))
+    if os.path.exists(aliases):
+      with open(aliases) as f:
+        mapping = json.load(f)
+  freed = 0
+  for group in groups:
+    keep = group[0]
+    for path in group[1:]:
+      stat = os.stat(path)
+      if aliases is None and os.path.samestat(stat, os.stat(keep)):
+        continue
+      if stat.st_nlink == 1:
+        freed += stat.st_size
+      if aliases is not None:
+        os.remove(path)
+        mapping[os.path.relpath(path, base)] = os.path.relpath(keep, base)
+      else:
+        temp = path + ".link"
+        os.link(keep, temp)
+        os.replace(temp, path)
+  if aliases is not None:
+    with open(aliases, "w") as f:
+      json.dump(mapping, f, indent=1, sort_keys=True)
+      f.write("\n")
+  return freed
+
+
+# A packed library is the pcb text of each footprint, one after another,
+# followed by a JSON index of name -> [offset, length] and a trailer
+# holding the offset of the index and the magic number.
+_PACK_MAGIC = b"FPPACK01"
+_PACK_TRAILER = struct.Struct("<Q8s")
+
+
+class PackWriter(object):
+  """Writes many footprints into a single packed library file, which is
+  quicker to create, copy and scan than a directory of small files. Use
+  PackReader to read footprints back, or `python -m footprint unpack` to
+  turn the pack back into .fp files.
+
+  The pack is written to a temporary file that replaces `path` when the
+  writer is closed, so readers never see a partly written pack. Can be
+  used in a `with` statement, which closes the writer at the end (or
+  discards the pack if an exception was raised).
+  """
+
+  def __init__(self, path):
+    """Initializer.
+
+    Arguments:
+    path -- path of the pack file
+    """
+    self.path = path
+    self.index = {}
+    self._temp = path + ".tmp"
+    self._file = open(self._temp, "wb")
+    self._offset = 0
+
+  def add_text(self, name, data):
+    """Adds a footprint's pcb text (str or UTF-8 encoded bytes) under
+    the given name. A footprint added under a name already in the pack
+    replaces the earlier one."""
+    if isinstance(data, str):
+      data = data.encode("utf-8")
+    self._file.write(data)
+    self.index[name] = [self._offset, len(data)]
+    self._offset += len(data)
+
+  def add(self, footprint, name=None):
+    """Adds a footprint, under its own name unless one is given."""
+    self.add_text(footprint.name if name is None else name,
+        "".join(footprint.iter_lines()))
+
+  def add_file(self, path, name=None):
+    """Adds the contents of a footprint file as they are, named after the
+    file (without its extension) unless a name is given."""
+    if name is None:
+      name = os.path.splitext(os.path.basename(path))[0]
+    with open(path, "rb") as f:
+      self.add_text(name, f.read())
+
+  def close(self):
+    """Writes the index and moves the pack into place."""
+    if self._file is None:
+      return
+    index = json.dumps(self.index, separators=(",", ":")).encode("utf-8")
+    self._file.write(index)
+    self._file.write(_PACK_TRAILER.pack(self._offset, _PACK_MAGIC))
+    self._file.close()
+    self._file = None
+    os.replace(self._temp, self.path)
+
+  def discard(self):
+    """Closes the writer without replacing the pack file."""
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+      os.remove(self._temp)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    if type is None:
+      self.close()
+    else:
+      self.discard()
+
+
+class PackReader(object):
+  """Reads footprints from a packed library written by PackWriter.
+
+  The pack is memory-mapped and its index loaded into a dict, so any
+  footprint can be found by name in constant time without reading the
+  rest of the pack. Supports `len()`, `in` and iteration over the names,
+  and can be used in a `with` statement, which closes it at the end.
+  """
+
+  def __init__(self, path):
+    """Initializer.
+
+    Arguments:
+    path -- path of the pack file
+
+    Raises ValueError if the file is not a pack.
+    """
+    self.path = path
+    with open(path, "rb") as f:
+      size = os.fstat(f.fileno()).st_size
+      if size < _PACK_TRAILER.size:
+        raise ValueError("%s: not a footprint pack" % path)
+      self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    end = size - _PACK_TRAILER.size
+    offset, magic = _PACK_TRAILER.unpack(self._buf[end:])
+    if magic != _PACK_MAGIC or offset > end:
+      self._buf.close()
+      raise ValueError("%s: not a footprint pack" % path)
+    self.index = json.loads(self._buf[offset:end].decode("utf-8"))
+
+  def __len__(self):
+    return len(self.index)
+
+  def __contains__(self, name):
+    return name in self.index
+
+  def __iter__(self):
+    return iter(self.index)
+
+  def data(self, name):
+    """Returns the pcb text of the named footprint as UTF-8 bytes.
+    Raises KeyError if there is no such footprint."""
+    offset, length = self.index[name]
+    return self._buf[offset:offset + length]
+
+  def text(self, name):
+    """Returns the pcb text of the named footprint."""
+    return self.data(name).decode("utf-8")
+
+  def load(self, name):
+    """Reads the named footprint back in, as Footprint.load() does."""
+    for footprint in _parse_elements(self.data(name), name):
+      return footprint
+    raise ValueError("%s: %s: no Element found" % (self.path, name))
+
+  def unpack(self, directory, names=None, extension=".fp"):
+    """Writes footprints out as ordinary files.
+
+    Arguments:
+    directory -- directory to write them to
+    names -- (optional) names of the footprints to write; defaults to all
+    extension -- extension of the files (defaults to ".fp")
+
+    Return value:
+    the paths of the files written
+    """
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    paths = []
+    for name in (self.index if names is None else names):
+      path = os.path.join(directory, name + extension)
+      with open(path, "wb") as f:
+        f.write(self.data(name))
+      paths.append(path)
+    return paths
+
+  def close(self):
+    self._buf.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+def use_pack(path):
+  """Makes Footprint.write() add every footprint written by this process
+  to a packed library instead of writing a file; the pack is completed
+  when the process exits.
+
+  Return value:
+  the PackWriter
+  """
+  import atexit
+  pack = PackWriter(path)
+  atexit.register(pack.close)
+  Footprint.pack = pack
+  return pack
+
+
+# A snapshot holds a footprint's shapes as they are in memory. It starts
+# with the magic number and format version, the key it was saved under
+# and the footprint's own fields. Then come the shapes: each array is one
+# record, and each run of consecutive shapes of the same class is another,
+# holding the shapes column-wise like an array. A record is a type code
+# and the number of elements, followed by the raw contents of each column
+# and the names and numbers (see _snapshot_values()). Numbers are
+# little-endian. Change _SNAPSHOT_VERSION whenever the layout changes, so
+# that old snapshots are treated as stale.
+_SNAPSHOT_MAGIC = b"FPSNAP"
+_SNAPSHOT_VERSION = 3
+_SNAPSHOT_HEADER = struct.Struct("<6sH")
+_SNAPSHOT_ELEMENT = struct.Struct("<4d3q?")
+_SNAPSHOT_RECORD = struct.Struct("<BI")
+_SNAPSHOT_LENGTH = struct.Struct("<I")
+_SNAPSHOT_INT = struct.Struct("<q")
+
+# (type code, shape class, array typecodes of the columns, attributes
+# they hold). "?" is a column of booleans. Polylines also have a column
+# of vertex counts and one of all their coordinates; arrays have columns
+# of their own, named in `attributes`, plus "round". Fixed-point classes
+# come before the classes they derive from, as a shape is saved under
+# the first entry it is an instance of. The clearance and mask offset of
+# pins and pads, including those in arrays, are saved as they read,
+# whether set on the shape or on its class.
+_SNAPSHOT_SHAPES = (
+  (1, FixedPad, "qqqq?d", ("_left", "_top", "_width", "_height", "round",
+      "clearance")),
+  (2, Pad, "dddd?d", ("left", "top", "width", "height", "round",
+      "clearance")),
+  (3, FixedPin, "qqqq?dd", ("_x", "_y", "_hole", "_diameter", "round",
+      "clearance", "mask_offset")),
+  (4, Pin, "dddd?dd", ("x", "y", "hole", "diameter", "round", "clearance",
+      "mask_offset")),
+  (5, FixedSilkLine, "qqqqq", ("_x1", "_y1", "_x2", "_y2", "_thickness")),
+  (6, SilkLine, "ddddd", ("x1", "y1", "x2", "y2", "thickness")),
+  (7, FixedSilkArc, "qqqqqdd", ("_x", "_y", "_x_radius", "_y_radius",
+      "_thickness", "start_angle", "delta_angle")),
+  (8, SilkArc, "ddddddd", ("x", "y", "x_radius", "y_radius", "thickness",
+      "start_angle", "delta_angle")),
+  (9, FixedSilkPolyline, "q?", ("_thickness", "closed")),
+  (10, SilkPolyline, "d?", ("thickness", "closed")),
+  (11, FixedPadArray, "qqqqd", ("left", "top", "width", "height",
+      "clearance")),
+  (12, PadArray, "ddddd", ("left", "top", "width", "height", "clearance")),
+  (13, FixedPinArray, "qqqqdd", ("x", "y", "hole", "diameter", "clearance",
+      "mask_offset")),
+  (14, PinArray, "dddddd", ("x", "y", "hole", "diameter", "clearance",
+      "mask_offset")),
+)
+_SNAPSHOT_CODES = dict((entry[0], entry) for entry in _SNAPSHOT_SHAPES)
+
+
+def snapshot_key(*inputs):
+  """Returns a key for Footprint.save_snapshot() and load_snapshot()
+  that changes whenever any of the inputs does.
+
+  Arguments:
+  the inputs a footprint is built from: bytes (e.g. the contents of a
+  vendor data file) are hashed as they are, strings as UTF-8, and
+  anything else by its repr()
+
+  To have the snapshot rebuilt when the code building the footprint
+  changes, include that code (or a version number) in the inputs.
+  """
+  digest = hashlib.sha256()
+  for value in inputs:
+    if isinstance(value, str):
+      value = value.encode("utf-8")
+    elif not isinstance(value, (bytes, bytearray)):
+      value = repr(value).encode("utf-8")
+    digest.update(_SNAPSHOT_INT.pack(len(value)))
+    digest.update(value)
+  return digest.hexdigest()
+
+
+def _snapshot_string(value):
+  data = value.encode("utf-8")
+  return _SNAPSHOT_LENGTH.pack(len(data)) + data
+
+
+def _snapshot_value(value):
+  """Returns the snapshot encoding of a pin number or name."""
+  if isinstance(value, str):
+    return b"s" + _snapshot_string(value)
+  if isinstance(value, int) and not isinstance(value, bool):
+    return b"i" + _SNAPSHOT_INT.pack(value)
+  raise TypeError("cannot save %r in a snapshot" % (value,))
+
+
+def _snapshot_values(values):
+  """Returns the snapshot encoding of a column of names or numbers: a
+  single value if they are all the same, the raw array if they are all
+  integers, or else each value in turn."""
+  first = values[0] if values else ""
+  if all(type(v) is type(first) and v == first for v in values):
+    return b"=" + _snapshot_value(first)
+  if all(type(v) is int for v in values):
+    return b"q" + _snapshot_column(values, "q")
+  return b"*" + b"".join(_snapshot_value(v) for v in values)
+
+
+def _snapshot_column(values, typecode):
+  """Returns the raw little-endian contents of a column of numbers."""
+  if typecode == "?":
+    typecode = "B"
+  if not isinstance(values, array) or values.typecode != typecode:
+    values = array(typecode, values)
+  if sys.byteorder != "little":
+    values = array(typecode, values)
+    values.byteswap()
+  return values.tobytes()
+
+
+def _snapshot_entry(shape):
+  for entry in _SNAPSHOT_SHAPES:
+    if isinstance(shape, entry[1]):
+      return entry
+  raise TypeError("cannot save %s in a snapshot" % type(shape).__name__)
+
+
+def _snapshot_records(footprint, key):
+  """Generates the parts of a footprint's snapshot, as bytes."""
+  yield _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_VERSION)
+  yield _snapshot_string(key or "")
+  yield _snapshot_string(footprint.name)
+  yield _snapshot_string(footprint.description)
+  yield _SNAPSHOT_ELEMENT.pack(footprint.mark_x, footprint.mark_y,
+      footprint.text_x, footprint.text_y, footprint.text_direction,
+      footprint.text_scale, footprint.pinpadcounter,
+      issubclass(footprint.pad_class, FixedPad))
+  entries = {}
+  runs = []  # [entry, shapes] for each record
+  for shape in footprint.shapes:
+    entry = entries.get(type(shape))
+    if entry is None:
+      entry = entries[type(shape)] = _snapshot_entry(shape)
+    if isinstance(shape, _ShapeArray):
+      runs.append((entry, shape))
+    elif runs and runs[-1][0] is entry and isinstance(runs[-1][1], list):
+      runs[-1][1].append(shape)
+    else:
+      runs.append((entry, [shape]))
+  for (code, cls, typecodes, attrs), shapes in runs:
+    yield _SNAPSHOT_RECORD.pack(code, len(shapes))
+    if isinstance(shapes, _ShapeArray):
+      for typecode, attr in zip(typecodes, attrs):
+        if attr in shapes.settings:
+          yield _snapshot_column(shapes._setting(attr), typecode)
+        else:
+          yield _snapshot_column(getattr(shapes, attr), typecode)
+      yield _snapshot_column(shapes.round, "?")
+      yield _snapshot_values(shapes.name)
+      yield _snapshot_values(shapes.number)
+      continue
+    for typecode, attr in zip(typecodes, attrs):
+      yield _snapshot_column([getattr(s, attr) for s in shapes], typecode)
+    if issubclass(cls, SilkPolyline):
+      yield _snapshot_column([len(s) for s in shapes], "I")
+      yield b"".join(_snapshot_column(s.points, cls._typecode)
+          for s in shapes)
+    yield _snapshot_values([s.name for s in shapes])
+    yield _snapshot_values([s.number for s in shapes])
+
+
+class _SnapshotReader(object):
+  """Reads the parts of a snapshot in turn."""
+
+  def __init__(self, data):
+    self.data = data
+    self.pos = 0
+
+  def unpack(self, fields):
+    values = fields.unpack_from(self.data, self.pos)
+    self.pos += fields.size
+    return values
+
+  def take(self, size):
+    if self.pos + size > len(self.data):
+      raise ValueError("truncated")
+    self.pos += size
+    return self.data[self.pos - size:self.pos]
+
+  def string(self):
+    return self.take(self.unpack(_SNAPSHOT_LENGTH)[0]).decode("utf-8")
+
+  def value(self):
+    kind = self.take(1)
+    if kind == b"s":
+      return self.string()
+    if kind == b"i":
+      return self.unpack(_SNAPSHOT_INT)[0]
+    raise ValueError("bad value")
+
+  def column(self, typecode, count):
+    if typecode == "?":
+      return list(map(bool, self.column("B", count)))
+    values = array(typecode)
+    values.frombytes(self.take(values.itemsize * count))
+    if sys.byteorder != "little":
+      values.byteswap()
+    return values
+
+  def values(self, count):
+    kind = self.take(1)
+    if kind == b"=":
+      return [self.value()] * count
+    if kind == b"q":
+      return self.column("q", count).tolist()
+    if kind == b"*":
+      return [self.value() for i in range(count)]
+    raise ValueError("bad column")
+
+
+def _read_snapshot(cls, data, path, key):
+  """Implements Footprint.load_snapshot()."""
+  reader = _SnapshotReader(data)
+  try:
+    magic, version = reader.unpack(_SNAPSHOT_HEADER)
+  except struct.error:
+    magic = version = None
+  if magic != _SNAPSHOT_MAGIC:
+    raise ValueError("%s: not a footprint snapshot" % path)
+  if version != _SNAPSHOT_VERSION:
+    if key is not None:
+      return None
+    raise ValueError("%s: snapshot format version %d is not supported" %
+        (path, version))
+  try:
+    saved_key = reader.string()
+    if key is not None and saved_key != key:
+      return None
+    name = reader.string()
+    description = reader.string()
+    (mark_x, mark_y, text_x, text_y, text_direction, text_scale,
+        pinpadcounter, fixed_point) = reader.unpack(_SNAPSHOT_ELEMENT)
+    footprint = cls(name, description=description, fixed_point=fixed_point)
+    footprint.mark_x, footprint.mark_y = mark_x, mark_y
+    footprint.text_x, footprint.text_y = text_x, text_y
+    footprint.text_direction = text_direction
+    footprint.text_scale = text_scale
+    footprint.pinpadcounter = pinpadcounter
+    shapes = []
+    while reader.pos < len(data):
+      code, count = reader.unpack(_SNAPSHOT_RECORD)
+      code, shape_class, typecodes, attrs = _SNAPSHOT_CODES[code]
+      if issubclass(shape_class, _ShapeArray):
+        shape = shape_class.__new__(shape_class)
+        Shape.__init__(shape)
+        for typecode, attr in zip(typecodes, attrs):
+          values = reader.column(typecode, count)
+          if attr in shape_class.settings:
+            default = getattr(shape_class.shape_class, attr)
+            values = [None if value == default else value
+                for value in values]
+          setattr(shape, attr, values)
+        shape.round = reader.column("B", count)
+        shape.name = reader.values(count)
+        shape.number = reader.values(count)
+        shapes.append(shape)
+        continue
+      # the shapes' _owner and _position are set when they are added
+      run = [shape_class.__new__(shape_class) for i in range(count)]
+      for typecode, attr in zip(typecodes, attrs):
+        values = reader.column(typecode, count)
+        if attr in ("clearance", "mask_offset"):
+          # only set where it differs from the class default, which
+          # keeps the shapes from allocating a __dict__
+          default = getattr(shape_class, attr)
+          for shape, value in zip(run, values):
+            if value != default:
+              setattr(shape, attr, value)
+          continue
+        list(map(setattr, run, repeat(attr), values))
+      if issubclass(shape_class, SilkPolyline):
+        sizes = reader.column("I", count)
+        points = reader.column(shape_class._typecode, 2 * sum(sizes))
+        start = 0
+        for shape, size in zip(run, sizes):
+          shape.points = points[start:start + 2*size]
+          start += 2*size
+      list(map(setattr, run, repeat("name"), reader.values(count)))
+      list(map(setattr, run, repeat("_number"), reader.values(count)))
+      shapes.extend(run)
+  except (struct.error, KeyError, ValueError):
+    raise ValueError("%s: damaged footprint snapshot" % path)
+  footprint._add_shapes(shapes)
+  return footprint
+
+
+class OutputCache(object):
+  """Remembers the contents of previously written output files so that
+  unchanged ones are not rewritten.
+
+  The cache is a JSON manifest mapping each output file (relative to the
+  manifest's directory) to the SHA-1 digest, size and modification time
+  it had when it was last written. A file is skipped only if its new
+  digest matches and the file on disk still has the recorded size and
+  modification time, so files edited or deleted by hand are rewritten.
+  """
+
+  def __init__(self, manifest):
+    """OutputCache initializer.
+
+    Arguments:
+    manifest -- path of the manifest file; it is read if it exists and
+      written by save()
+    """
+    self.manifest = os.path.abspath(manifest)
+    self.root = os.path.dirname(self.manifest)
+    self.written = 0
+    self.skipped = 0
+    self._lock = threading.Lock()  # check() and update() may be threaded
+    try:
+      with open(self.manifest) as f:
+        self.entries = json.load(f)
+    except (IOError, OSError, ValueError):
+      self.entries = {}
+
+  def _key(self, filename):
+    return os.path.relpath(os.path.abspath(filename), self.root)
+
+  def check(self, filename, digest):
+    """Returns True (and counts the file as skipped) if `filename` is
+    known to already hold content with the given digest."""
+    entry = self.entries.get(self._key(filename))
+    if entry is None or entry["sha1"] != digest:
+      return False
+    try:
+      st = os.stat(filename)
+    except OSError:
+      return False
+    if st.st_size != entry["size"] or st.st_mtime_ns != entry["mtime"]:
+      return False
+    with self._lock:
+      self.skipped += 1
+    return True
+
+  def update(self, filename, digest):
+    """Records that `filename` has just been written with content that
+    has the given digest."""
+    st = os.stat(filename)
+    self.entries[self._key(filename)] = {
+        "sha1": digest, "size": st.st_size, "mtime": st.st_mtime_ns}
+    with self._lock:
+      self.written += 1
+
+  def remove(self, filename):
+    """Forgets a file that has been deleted."""
+    self.entries.pop(self._key(filename), None)
+
+  def save(self):
+    """Writes the manifest to disk."""
+    temp = self.manifest + ".tmp"
+    with open(temp, "w") as f:
+      json.dump(self.entries, f, sort_keys=True, indent=0)
+    os.replace(temp, self.manifest)
+
+  def summary(self):
+    """Returns a one-line description of the written/skipped counts."""
+    return "%d written, %d unchanged" % (self.written, self.skipped)
+
+
+def use_output_cache(manifest=".footprint-manifest.json"):
+  """Enables the output cache for all footprints written by this
+  process. The manifest is saved, and a summary printed to stderr, when
+  the process exits.
+
+  Return value:
+  the OutputCache
+  """
+  import atexit
+  cache = OutputCache(manifest)
+  def finish():
+    cache.save()
+    sys.stderr.write("footprint: %s\n" % cache.summary())
+  atexit.register(finish)
+  Footprint.output_cache = cache
+  return cache
+
+
+class FootprintIndex(object):
+  """A searchable SQLite index of footprint metadata.
+
+  Each footprint written while an index is in use (see
+  use_metadata_index()) gets one row, keyed by output path, holding the
+  fields returned by Footprint.metadata(). Lengths are stored in mils.
+
+  Example: all 2-row footprints with 0.65 mm pitch narrower than 8 mm
+
+    index = FootprintIndex("lib/index.sqlite")
+    for row in index.query(rows=2, pitch=0.65*mm, width_max=8*mm):
+      print(row["name"], row["path"])
+  """
+
+  # column name -> SQL type
+  columns = (("path", "TEXT PRIMARY KEY"), ("name", "TEXT"),
+      ("description", "TEXT"), ("pins", "INTEGER"), ("pads", "INTEGER"),
+      ("rows", "INTEGER"), ("pitch", "REAL"), ("pitch_min", "REAL"),
+      ("pitch_max", "REAL"), ("left", "REAL"), ("top", "REAL"),
+      ("right", "REAL"), ("bottom", "REAL"), ("width", "REAL"),
+      ("height", "REAL"), ("pad_width", "REAL"), ("pad_height", "REAL"),
+      ("hole", "REAL"))
+
+  # Default tolerance, in mils, for equality tests on lengths.
+  tolerance = 0.5
+
+  def __init__(self, path):
+    """FootprintIndex initializer.
+
+    Arguments:
+    path -- name of the SQLite database file; it is created if it does
+      not exist
+    """
+    import sqlite3
+    self.path = path
+    self.db = sqlite3.connect(path)
+    self.db.row_factory = sqlite3.Row
+    self.db.execute("CREATE TABLE IF NOT EXISTS footprints (%s)" %
+        ", ".join('"%s" %s' % c for c in self.columns))
+    self._types = dict(self.columns)
+
+  def record(self, footprint, path):
+    """Adds or replaces the row for the footprint written to `path`."""
+    meta = footprint.metadata()
+    meta["path"] = os.path.abspath(path)
+    names = [c for c, t in self.columns]
+    self.db.execute("INSERT OR REPLACE INTO footprints (%s) VALUES (%s)" % (
+        ", ".join('"%s"' % c for c in names), ", ".join("?" for c in names)),
+        [meta[c] for c in names])
+
+  def remove(self, path):
+    """Removes the row for the given output path, if there is one."""
+    self.db.execute("DELETE FROM footprints WHERE path = ?",
+        (os.path.abspath(path),))
+
+  def query(self, order="name", **criteria):
+    """Returns the rows matching all of the given criteria, as a list of
+    dicts.
+
+    Keyword arguments:
+    order -- column to sort the results by (defaults to "name")
+    <column> -- the column must equal the value; lengths match within
+      `tolerance` mils, and text columns may use * and ? wildcards
+    <column>_min -- the column must be at least the value
+    <column>_max -- the column must be at most the value
+
+    Raises ValueError for unknown columns.
+    """
+    clauses, params = [], []
+    for key, value in sorted(criteria.items()):
+      column, op = key, "="
+      if key.endswith("_min") and key not in self._types:
+        column, op = key[:-4], ">="
+      elif key.endswith("_max") and key not in self._types:
+        column, op = key[:-4], "<="
+      if column not in self._types:
+        raise ValueError("unknown index column: %s" % column)
+      kind = self._types[column]
+      if op != "=":
+        clauses.append('"%s" %s ?' % (column, op))
+        params.append(value)
+      elif kind.startswith("REAL"):
+        clauses.append('abs("%s" - ?) <= ?' % column)
+        params.extend((value, self.tolerance))
+      elif kind.startswith("TEXT"):
+        clauses.append('"%s" GLOB ?' % column)
+        params.append(value)
+      else:
+        clauses.append('"%s" = ?' % column)
+        params.append(value)
+    if order not in self._types:
+      raise ValueError("unknown index column: %s" % order)
+    sql = "SELECT * FROM footprints"
+    if clauses:
+      sql += " WHERE " + " AND ".join(clauses)
+    sql += ' ORDER BY "%s"' % order
+    return [dict(row) for row in self.db.execute(sql, params)]
+
+  def commit(self):
+    """Saves recorded rows to disk."""
+    self.db.commit()
+
+  def close(self):
+    """Saves recorded rows and closes the database."""
+    self.db.commit()
+    self.db.close()
+
+
+def use_metadata_index(path="footprints.sqlite"):
+  """Records the metadata of every footprint written by this process in
+  a FootprintIndex, which is committed when the process exits.
+
+  Return value:
+  the FootprintIndex
+  """
+  import atexit
+  index = FootprintIndex(path)
+  atexit.register(index.close)
+  Footprint.metadata_index = index
+  return index
+
+
+class AsyncWriter(object):
+  """Writes footprints in background threads, so that a script can build
+  the next footprint while the previous ones are written.
+
+  While an AsyncWriter is Footprint.async_writer, a footprint at the end
+  of its `with` statement is serialized straight away (so later changes
+  to it do not matter) and queued, and the writer's threads write its
+  files, with the output cache, metadata index and profiler used as by
+  Footprint.write(). Footprint.write() itself still writes synchronously.
+
+  The queue holds at most `maxsize` footprints; when it is full, the
+  `with` statement waits for the threads to catch up. Errors from the
+  threads are kept until flush() raises them or wait() reports them;
+  use_async_writer() makes sure the queue is waited for when the process
+  exits.
+  """
+
+  def __init__(self, threads=4, maxsize=64):
+    """Initializer.
+
+    Keyword arguments:
+    threads -- number of writer threads (defaults to 4)
+    maxsize -- maximum number of footprints waiting to be written
+      (defaults to 64)
+    """
+    self.threads = threads
+    self.maxsize = maxsize
+    self.errors = []
+    self._queue = None
+    self._pid = None
+
+  def _start(self):
+    """Starts the threads. Threads do not survive a fork, so this is also
+    done again in child processes (e.g. the workers of `build`)."""
+    import queue
+    self._queue = queue.Queue(self.maxsize)
+    self._pid = os.getpid()
+    self.errors = []
+    for i in range(self.threads):
+      thread = threading.Thread(target=self._run, args=(self._queue,),
+          name="footprint-writer-%d" % i)
+      thread.daemon = True
+      thread.start()
+
+  def submit(self, footprint, filename):
+    """Serializes a footprint and queues its files to be written,
+    waiting if the queue is full. See Footprint.write() for the
+    arguments."""
+    if self._pid != os.getpid():
+      self._start()
+    files = footprint._render(filename)
+    if "geda" in footprint.formats and footprint.metadata_index is not None:
+      footprint.metadata_index.record(footprint, filename)
+    self._queue.put((footprint, files))
+
+  def _run(self, queue):
+    while True:
+      footprint, files = queue.get()
+      filename = files[0][0]
+      try:
+        start = time.perf_counter()
+        size = 0
+        for filename, text in files:
+          if footprint._store(filename, text):
+            size += os.path.getsize(filename)
+        if footprint.profiler is not None:
+          footprint.profiler.written(footprint, start,
+              time.perf_counter() - start, size)
+      except Exception as e:
+        self.errors.append((footprint.name, filename, e))
+      finally:
+        queue.task_done()
+
+  def drain(self):
+    """Waits until every queued footprint has been written.
+
+    Return value:
+    a list of (footprint name, filename, exception) tuples for the files
+    that could not be written since the last drain() or flush()
+    """
+    if self._queue is not None and self._pid == os.getpid():
+      self._queue.join()
+    errors, self.errors = self.errors, []
+    return errors
+
+  def flush(self):
+    """Waits until every queued footprint has been written, then raises
+    the exception of the first file that could not be written, if any
+    (see drain() for all of them)."""
+    errors = self.drain()
+    if errors:
+      raise errors[0][2]
+
+  def wait(self):
+    """Waits until every queued footprint has been written, and reports
+    the files that could not be written on stderr.
+
+    Return value:
+    1 if any file could not be written, else 0; a script can end with
+    `sys.exit(Footprint.async_writer.wait())` to exit with that status
+    """
+    errors = self.drain()
+    for name, filename, e in errors:
+      sys.stderr.write("footprint: %s: cannot write %s: %s\n" % (
+          name, filename, e))
+    return 1 if errors else 0
+
+
+def use_async_writer(threads=4, maxsize=64):
+  """Makes the `with` statements of this process hand their footprints
+  to an AsyncWriter (see there for the arguments). The writer is waited
+  for when the process exits, and files that could not be written are
+  reported on stderr. The exit status is not changed at that point;
+  call flush() or wait() at the end of a script to fail when writes did.
+
+  This is also done when the module is imported if the
+  FOOTPRINT_ASYNC_WRITES environment variable is set to a number of
+  threads. `build` waits for each script's writes, and reports the files
+  that could not be written as failures.
+
+  Return value:
+  the AsyncWriter
+  """
+  import atexit
+  writer = AsyncWriter(threads, maxsize)
+  atexit.register(writer.wait)
+  Footprint.async_writer = writer
+  return writer
+
+
+class Profiler(object):
+  """Records where the time goes while footprints are generated.
+
+  While a Profiler is Footprint.profiler, it keeps an entry for every
+  footprint created, with:
+
+  name -- the footprint's name
+  construction -- seconds from its creation until it was first
+    serialized or written (None if it never was)
+  shapes -- number of shapes of each class; arrays count their pins or
+    pads
+  str_calls, str_time -- number of times the footprint was serialized
+    (by str(), write() or the end of a `with` statement), and total
+    seconds spent serializing it
+  writes, write_time, bytes -- number of times it was written, total
+    seconds spent writing its files (not counting serialization), and
+    bytes written (files left untouched by the output cache count as 0
+    bytes)
+
+  A Profiler can be used as a context manager, which makes it
+  Footprint.profiler for the duration of the `with` statement, then
+  closes it and prints its summary to stderr:
+
+    with Profiler("profile.jsonl"):
+      ...
+  """
+
+  def __init__(self, path=None):
+    """Initializer.
+
+    Arguments:
+    path -- (optional) file to append a JSON object per footprint to,
+      followed by {"summary": ...} when the profiler is closed; several
+      processes (e.g. the workers of `build`) may share one file
+    """
+    self.path = path
+    self.entries = []
+    self._start = 0
+    if path is not None and os.path.exists(path):
+      self._start = os.path.getsize(path)
+    self._previous = None
+
+  def created(self, footprint):
+    """Starts an entry for a newly created footprint."""
+    entry = {"name": footprint.name, "construction": None, "shapes": {},
+        "str_calls": 0, "str_time": 0.0, "writes": 0, "write_time": 0.0,
+        "bytes": 0, "_created": time.perf_counter()}
+    footprint._profile = (self, entry)
+    self.entries.append(entry)
+
+  def _entry(self, footprint, start):
+    """Returns the entry of a footprint that is being serialized or
+    written, updating its construction time and shape counts."""
+    owner, entry = getattr(footprint, "_profile", (None, None))
+    if owner is not self:
+      self.created(footprint)
+      owner, entry = footprint._profile
+      entry["_created"] = None
+    if entry["construction"] is None and entry["_created"] is not None:
+      entry["construction"] = start - entry["_created"]
+    entry["name"] = footprint.name
+    shapes = {}
+    for shape in footprint.shapes:
+      kind = type(shape).__name__
+      count = len(shape) if isinstance(shape, _ShapeArray) else 1
+      shapes[kind] = shapes.get(kind, 0) + count
+    entry["shapes"] = shapes
+    return entry
+
+  def serialized(self, footprint, start, seconds):
+    """Records a serialization (by str(), or for writing) that began at
+    `start` (a perf_counter() value) and took `seconds`."""
+    entry = self._entry(footprint, start)
+    entry["str_calls"] += 1
+    entry["str_time"] += seconds
+
+  def written(self, footprint, start, seconds, size):
+    """Records writing files that began at `start`, took `seconds` and
+    wrote `size` bytes."""
+    entry = self._entry(footprint, start)
+    entry["writes"] += 1
+    entry["write_time"] += seconds
+    entry["bytes"] += size
+
+  def save(self):
+    """Appends the entries recorded so far to the file, and forgets
+    them. Does nothing if the profiler has no file."""
+    if self.path is None:
+      return
+    _save_profile(self.path, self.entries)
+    self.entries = []
+
+  def close(self):
+    """Saves the remaining entries and appends the summary of every
+    entry written to the file since the profiler was created.
+
+    Return value:
+    the summary; see summarize_profile()
+    """
+    entries = self.entries
+    if self.path is not None:
+      self.save()
+      entries = []
+      if os.path.exists(self.path):
+        with open(self.path) as f:
+          f.seek(self._start)
+          entries = [e for e in map(json.loads, f) if "summary" not in e]
+    summary = summarize_profile(entries)
+    if self.path is not None and entries:
+      with open(self.path, "a") as f:
+        f.write(json.dumps({"summary": summary}, sort_keys=True) + "\n")
+    return summary
+
+  def __enter__(self):
+    self._previous = Footprint.profiler
+    Footprint.profiler = self
+    return self
+
+  def __exit__(self, type, value, traceback):
+    Footprint.profiler = self._previous
+    sys.stderr.write("footprint: %s\n" % _summary_text(self.close()))
+
+
+def _save_profile(path, entries):
+  """Appends profiler entries to a profiler's file, without the
+  bookkeeping keys that start with an underscore."""
+  if not entries:
+    return
+  lines = "".join(json.dumps(dict((k, v) for k, v in sorted(e.items())
+      if not k.startswith("_"))) + "\n" for e in entries)
+  with open(path, "a") as f:
+    f.write(lines)
+
+
+def summarize_profile(entries):
+  """Aggregates profiler entries (see Profiler).
+
+  Return value:
+  a dict with the number of footprints, the total construction,
+  serialization and writing seconds, bytes written, shapes of each class, and the names
+  of the five footprints that took longest to build, serialize and write
+  """
+  summary = {"footprints": len(entries), "construction": 0.0,
+      "str_time": 0.0, "write_time": 0.0, "bytes": 0, "shapes": {}}
+  for entry in entries:
+    summary["construction"] += entry["construction"] or 0.0
+    summary["str_time"] += entry["str_time"]
+    summary["write_time"] += entry["write_time"]
+    summary["bytes"] += entry["bytes"]
+    for kind, count in entry["shapes"].items():
+      summary["shapes"][kind] = summary["shapes"].get(kind, 0) + count
+  total = lambda e: (e["construction"] or 0.0) + e["str_time"] + e["write_time"]
+  summary["slowest"] = [e["name"] for e in
+      sorted(entries, key=total, reverse=True)[:5]]
+  return summary
+
+
+def _summary_text(summary):
+  """Returns a one-line description of a summary()."""
+  return ("%d footprints profiled: %.1f ms building, %.1f ms serializing, "
+      "%.1f ms writing %d bytes" % (summary["footprints"],
+      summary["construction"] * 1000, summary["str_time"] * 1000,
+      summary["write_time"] * 1000, summary["bytes"]))
+
+
+def use_profiler(path="footprint-profile.jsonl"):
+  """Profiles every footprint created by this process (see Profiler).
+  The report is completed, and a summary printed to stderr, when the
+  process exits.
+
+  This is also done when the module is imported if the FOOTPRINT_PROFILE
+  environment variable is set to a file name. `build` passes the setting
+  on to the scripts it runs, so their footprints are included.
+
+  Return value:
+  the Profiler
+  """
+  import atexit
+  profiler = Profiler(path)
+  def finish():
+    summary = profiler.close()
+    if summary["footprints"]:
+      sys.stderr.write("footprint: %s\n" % _summary_text(summary))
+  atexit.register(finish)
+  Footprint.profiler = profiler
+  return profiler
+
+
+def _parse_length(text):
+  """Parses a length such as "0.65mm", "25mil" or "25" (mils) into
+  mils."""
+  match = _NUMBER_RE.match(text.strip())
+  if match is None or match.group(2) not in _UNITS and match.group(2):
+    raise ValueError("invalid length: %s" % text)
+  number, suffix = match.groups()
+  return float(number) * _UNITS.get(suffix or "mil")
+
+
+def _index_directory(index, directory):
+  """Records every .fp file in a directory in a FootprintIndex.
+
+  Return value:
+  the number of footprints recorded
+  """
+  count = 0
+  for filename in sorted(os.listdir(directory)):
+    if filename.endswith(".fp"):
+      path = os.path.join(directory, filename)
+      for footprint in _load_elements(path):
+        index.record(footprint, path)
+        count += 1
+  return count
+
+
+def _file_digest(filename):
+  """Returns the SHA-1 hex digest of a file's contents."""
+  h = hashlib.sha1()
+  with open(filename, "rb") as f:
+    for block in iter(lambda: f.read(65536), b""):
+      h.update(block)
+  return h.hexdigest()
+
+
+def _find_scripts(paths):
+  """Expands a list of files and directories into a sorted list of
+  footprint scripts. Directories are searched recursively for .py files;
+  this module itself is skipped."""
+  this_module = os.path.splitext(os.path.abspath(__file__))[0]
+  scripts = []
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs
+            if not d.startswith(".") and d != "__pycache__")
+        scripts.extend(os.path.join(root, f) for f in sorted(files)
+            if f.endswith(".py"))
+    else:
+      scripts.append(path)
+  return [os.path.abspath(s) for s in scripts
+      if os.path.splitext(os.path.abspath(s))[0] != this_module]
+
+
+def _display_path(path):
+  """Returns `path` relative to the current directory if it is inside
+  it, and unchanged otherwise."""
+  relative = os.path.relpath(path)
+  return path if relative.startswith(os.pardir) else relative
+
+
+def _run_script(script, formats=None):
+  """Runs a footprint script in a new temporary directory.
+
+  Arguments:
+  script -- absolute path of the script
+  formats -- (optional) formats to write footprints in, overriding
+    Footprint.formats (see use_formats())
+
+  Return value:
+  a tuple (script, workdir, log, error, profile) where `workdir` is the
+  directory the script ran in (and where its output files are), `log` is
+  a list of (footprint name, filename or None, error message or None)
+  tuples, `error` describes an exception that escaped the script, if
+  any, and `profile` is None or the path of the profiler's file and the
+  entries the script's footprints added to it, which _collect() saves.
+  """
+  import runpy, tempfile, traceback
+  global _run_log
+  workdir = tempfile.mkdtemp(prefix="footprint-")
+  saved_cwd, saved_argv, saved_path = os.getcwd(), sys.argv, sys.path[:]
+  _run_log = log = []
+  # the parent process decides which outputs to keep, and indexes them
+  Footprint.output_cache = None
+  Footprint.metadata_index = None
+  if formats:
+    use_formats(*formats)
+  error = profile = None
+  try:
+    os.chdir(workdir)
+    sys.argv = [script]
+    sys.path.insert(0, os.path.dirname(script))
+    runpy.run_path(script, run_name="__main__")
+  except SystemExit as e:
+    if e.code not in (None, 0):
+      error = "exited with status %s" % (e.code,)
+  except Exception as e:
+    frames = [f for f in traceback.extract_tb(sys.exc_info()[2])
+        if f[0] == script]
+    where = "line %d: " % frames[-1][1] if frames else ""
+    error = where + "".join(format_exception_only(type(e), e)).strip()
+  finally:
+    if Footprint.async_writer is not None:
+      for name, filename, e in Footprint.async_writer.drain():
+        log.append((name, None, "cannot write %s: %s" % (filename, e)))
+    _run_log = None
+    if Footprint.profiler is not None and Footprint.profiler.path:
+      # workers exit without running atexit handlers, and the entries of
+      # footprints that build() rejects are left out of the file
+      profile = Footprint.profiler.path, Footprint.profiler.entries
+      Footprint.profiler.entries = []
+    os.chdir(saved_cwd)
+    sys.argv, sys.path[:] = saved_argv, saved_path
+  return script, workdir, log, error, profile
+
+
+def _collect(result, outdir, produced, cache=None):
+  """Moves the files written by one script into the output directory.
+
+  Arguments:
+  result -- a tuple returned by _run_script()
+  outdir -- destination directory
+  produced -- dict of output filename -> script that produced it; used
+    to detect two scripts writing the same footprint
+  cache -- (optional) an OutputCache; files whose contents are unchanged
+    are discarded rather than moved
+
+  Return value:
+  a tuple (outputs, failures): the output filenames, and a list of
+  (footprint name, message) tuples
+
+  Files the script wrote to absolute paths are left where they are. The
+  script's profiler entries are saved, except those of footprints whose
+  output was rejected.
+  """
+  import shutil
+  script, workdir, log, error, profile = result
+  outputs, failures = [], []
+  rejected = set()
+  for name, filename, message in log:
     if filename is None:
-      filename = os.path.splitext(sys.argv[0])[0] + ".fp"
-    with open(filename, "w") as f:
-      f.write(str(self))
+      failures.append((name, message))
+      continue
+    if os.path.isabs(filename):
+      continue
+    basename = os.path.basename(filename)
+    other = produced.get(basename)
+    if other is not None and other != script:
+      failures.append((name, "%s is also written by %s" % (basename, other)))
+      rejected.add(name)
+      continue
+    produced[basename] = script
+    source = os.path.join(workdir, filename)
+    if not os.path.exists(source):
+      continue
+    dest = os.path.join(outdir, basename)
+    if cache is not None:
+      digest = _file_digest(source)
+      if cache.check(dest, digest):
+        continue
+    shutil.move(source, dest)
+    if cache is not None:
+      cache.update(dest, digest)
+    outputs.append(basename)
+  if error is not None and not failures:
+    failures.append((None, error))
+  if profile is not None:
+    path, entries = profile
+    _save_profile(path, [e for e in entries if e["name"] not in rejected])
+  if workdir is not None:
+    shutil.rmtree(workdir, ignore_errors=True)
+  return outputs, failures
+
+
+def build(paths, outdir=".", jobs=None, out=None, cache=True, index=None,
+    formats=None):
+  """Runs many footprint scripts in parallel and gathers their output.
+
+  Arguments:
+  paths -- list of scripts and/or directories containing scripts
+  outdir -- directory to place the generated .fp files in
+  jobs -- number of worker processes (defaults to the number of CPUs)
+  out -- file object progress and failures are reported to (defaults to
+    sys.stdout)
+  cache -- if True, footprints whose output has not changed since the
+    last build are not rewritten (see OutputCache)
+  index -- (optional) path of a FootprintIndex database to record the
+    metadata of every footprint in
+  formats -- (optional) list of formats to write every footprint in
+    (see use_formats()); by default, scripts write Footprint.formats
+
+  Return value:
+  the number of footprints (or scripts) that failed
+
+  Each script runs in its own process and its own temporary working
+  directory, exactly as it would when run by hand. A failing script or
+  footprint is reported and the rest of the build carries on.
+  """
+  import multiprocessing, functools
+  out = sys.stdout if out is None else out
+  scripts = _find_scripts(paths)
+  if not os.path.isdir(outdir):
+    os.makedirs(outdir)
+  output_cache = None
+  if cache:
+    output_cache = OutputCache(
+        os.path.join(outdir, ".footprint-manifest.json"))
+  produced = {}
+  written = failed = 0
+  # a fresh process per script keeps changes that one script makes to
+  # module-level defaults (e.g. Pad.clearance) from leaking into another
+  pool = multiprocessing.Pool(jobs, maxtasksperchild=1)
+  try:
+    run = functools.partial(_run_script, formats=formats)
+    # results come back in sorted order, so when two scripts write the
+    # same footprint, the first script keeps it however fast each runs
+    for result in pool.imap(run, sorted(scripts)):
+      outputs, failures = _collect(result, outdir, produced, output_cache)
+      script = _display_path(result[0])
+      written += len(outputs)
+      failed += len(failures)
+      for name, message in failures:
+        if name is None:
+          out.write("FAILED %s: %s\n" % (script, message))
+        else:
+          out.write("FAILED %s: %s: %s\n" % (script, name, message))
+  finally:
+    pool.close()
+    pool.join()
+    if output_cache is not None:
+      output_cache.save()
+  if index is not None:
+    metadata_index = FootprintIndex(index)
+    other = set(e.extension for e in emitters.values()
+        if e is not GedaEmitter)
+    for basename in sorted(produced):
+      path = os.path.join(outdir, basename)
+      if os.path.splitext(basename)[1] in other:
+        continue
+      if os.path.exists(path):
+        for footprint in _load_elements(path):
+          metadata_index.record(footprint, path)
+    metadata_index.close()
+  skipped = output_cache.skipped if output_cache is not None else 0
+  out.write("%d footprints written, %d unchanged, from %d scripts, "
+      "%d failed\n" % (written, skipped, len(scripts), failed))
+  return failed
+
+
+def _script_mtimes(paths):
+  """Returns a dict of script -> modification time (in nanoseconds) of
+  the footprint scripts found in `paths` (see _find_scripts())."""
+  mtimes = {}
+  for script in _find_scripts(paths):
+    try:
+      mtimes[script] = os.stat(script).st_mtime_ns
+    except OSError:
+      pass  # deleted since it was listed
+  return mtimes
+
+
+def _ignore_interrupts():
+  """Pool initializer that makes a worker process ignore SIGINT."""
+  import signal
+  signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def watch(paths, outdir=".", jobs=None, out=None, interval=0.5,
+    formats=None):
+  """Rebuilds footprint scripts whenever they change, until interrupted
+  (e.g. by Ctrl-C).
+
+  Arguments:
+  paths -- list of scripts and/or directories containing scripts
+  outdir -- directory to place the generated .fp files in
+  jobs -- number of worker processes (defaults to the number of CPUs)
+  out -- file object progress and failures are reported to (defaults to
+    sys.stdout)
+  interval -- seconds between checks for changed scripts
+  formats -- (optional) list of formats to write every footprint in (see
+    use_formats())
+
+  Scripts are run as by build(), but only when their modification time
+  changes (or they are new). The files each script wrote are kept in
+  `.footprint-watch.json` in the output directory, so when a script
+  stops writing a footprint, or is deleted, its old output files are
+  deleted too; outputs are kept while a script is failing. The record
+  is kept across runs, so restarting watch only runs the scripts edited
+  in the meantime.
+  """
+  import multiprocessing, functools
+  out = sys.stdout if out is None else out
+  if not os.path.isdir(outdir):
+    os.makedirs(outdir)
+  record = os.path.join(outdir, ".footprint-watch.json")
+  try:
+    with open(record) as f:
+      scripts = json.load(f)
+  except (IOError, OSError, ValueError):
+    scripts = {}
+  output_cache = OutputCache(os.path.join(outdir, ".footprint-manifest.json"))
+  def remove(basenames):
+    for basename in basenames:
+      path = os.path.join(outdir, basename)
+      if os.path.exists(path):
+        os.remove(path)
+      output_cache.remove(path)
+  def save():
+    output_cache.save()
+    with open(record + ".tmp", "w") as f:
+      json.dump(scripts, f, indent=1, sort_keys=True)
+    os.replace(record + ".tmp", record)
+  run = functools.partial(_run_script, formats=formats)
+  # Ctrl-C reaches the workers too; let them finish the script they are
+  # running instead
+  pool = multiprocessing.Pool(jobs, _ignore_interrupts, maxtasksperchild=1)
+  out.write("watching %s; press Ctrl-C to stop\n" % ", ".join(paths))
+  out.flush()
+  try:
+    while True:
+      mtimes = _script_mtimes(paths)
+      changed = [s for s in sorted(mtimes)
+          if scripts.get(s, {}).get("mtime") != mtimes[s]]
+      deleted = [s for s in sorted(scripts) if s not in mtimes]
+      for script in deleted:
+        remove(scripts.pop(script)["outputs"])
+        out.write("removed %s\n" % _display_path(script))
+      produced = dict((basename, script) for script in scripts
+          if script not in changed for basename in scripts[script]["outputs"])
+      # in sorted order, as in build()
+      for result in pool.imap(run, changed):
+        script = result[0]
+        old = scripts.get(script, {}).get("outputs", [])
+        outputs, failures = _collect(result, outdir, produced, output_cache)
+        current = sorted(b for b, s in produced.items() if s == script)
+        if failures:
+          current = sorted(set(current).union(old))
+        stale = [b for b in old if b not in current]
+        remove(stale)
+        scripts[script] = {"mtime": mtimes[script], "outputs": current}
+        name = _display_path(script)
+        for footprint, message in failures:
+          if footprint is None:
+            out.write("FAILED %s: %s\n" % (name, message))
+          else:
+            out.write("FAILED %s: %s: %s\n" % (name, footprint, message))
+        if not failures:
+          out.write("%s: %d written, %d unchanged, %d removed\n" % (name,
+              len(outputs), len(current) - len(outputs), len(stale)))
+      if changed or deleted:
+        save()
+        out.flush()
+      time.sleep(interval)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    pool.close()
+    pool.join()
+    save()
+
+
+def _run_forked(scripts, jobs=None, formats=None):
+  """Runs footprint scripts, each with _run_script() in a child process
+  forked from this one, at most `jobs` (default: the number of CPUs) at
+  a time.
+
+  Forking directly skips the task queues and worker bookkeeping of a
+  multiprocessing.Pool that replaces its worker after every task, which
+  roughly halves the cost of running a small script.
+
+  Return value:
+  an iterator over the results of _run_script(), in the order of
+  `scripts`; a result that comes in early is held back until those of
+  the scripts before it have been yielded
+  """
+  import selectors
+  jobs = jobs or os.cpu_count() or 1
+  pending = list(reversed(list(enumerate(scripts))))
+  running = {}  # read end of the child's pipe -> (pid, index, script, data)
+  finished = {}  # index -> result, for results held back
+  next_index = 0
+  selector = selectors.DefaultSelector()
+  try:
+    while pending or running:
+      while pending and len(running) < jobs:
+        index, script = pending.pop()
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+          status = 1
+          try:
+            _ignore_interrupts()
+            os.close(r)
+            result = json.dumps(_run_script(script, formats))
+            with os.fdopen(w, "wb") as f:
+              f.write(result.encode("utf-8"))
+            status = 0
+          finally:
+            os._exit(status)
+        os.close(w)
+        running[r] = (pid, index, script, [])
+        selector.register(r, selectors.EVENT_READ)
+      for key, events in selector.select():
+        chunk = os.read(key.fd, 65536)
+        if chunk:
+          running[key.fd][3].append(chunk)
+          continue
+        selector.unregister(key.fd)
+        os.close(key.fd)
+        pid, index, script, data = running.pop(key.fd)
+        os.waitpid(pid, 0)
+        try:
+          finished[index] = tuple(json.loads(b"".join(data).decode("utf-8")))
+        except ValueError:
+          finished[index] = (script, None, [], "the worker process died",
+              None)
+        while next_index in finished:
+          yield finished.pop(next_index)
+          next_index += 1
+  finally:
+    selector.close()
+
+
+def _default_address():
+  """Returns the default path of the socket used by serve() and
+  submit()."""
+  import tempfile
+  return os.path.join(tempfile.gettempdir(),
+      "footprint-%d.sock" % os.getuid())
+
+
+def serve(address=None, jobs=None, out=None):
+  """Runs a build server, which runs footprint scripts sent to it by
+  submit(), until interrupted (e.g. by Ctrl-C).
+
+  Arguments:
+  address -- path of the Unix socket to listen on (defaults to
+    footprint-UID.sock in the temporary directory)
+  jobs -- number of worker processes (defaults to the number of CPUs)
+  out -- file object requests are logged to (defaults to sys.stdout)
+
+  Scripts run as they do in build(): each in a fresh process and
+  temporary working directory, so they cannot affect each other. The
+  processes are forked from the server, which has already imported this
+  module, so a script costs a fork (a few milliseconds) rather than
+  starting Python and importing `footprint`.
+
+  The protocol is JSON lines. A request is one object with "scripts" (a
+  list of absolute paths), "outdir" and optionally "formats" and "cache"
+  (see build()). The server replies with one object per script, holding
+  "script", "outputs" (paths of the files written) and "failures" (a
+  list of [footprint name or null, message]), and then a final object
+  with the "written", "unchanged" and "failed" counts, or with "error" if
+  the request could not be handled.
+  """
+  import socket, socketserver
+  out = sys.stdout if out is None else out
+  address = _default_address() if address is None else address
+  if os.path.exists(address):
+    probe = socket.socket(socket.AF_UNIX)
+    try:
+      probe.connect(address)
+    except OSError:
+      os.remove(address)  # left behind by a server that did not exit
+    else:
+      raise ValueError("a server is already listening on %s" % address)
+    finally:
+      probe.close()
+
+  class Handler(socketserver.StreamRequestHandler):
+    def send(self, reply):
+      self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+      self.wfile.flush()
+
+    def handle(self):
+      try:
+        request = json.loads(self.rfile.readline().decode("utf-8"))
+        scripts, outdir = request["scripts"], request["outdir"]
+        formats = request.get("formats")
+        if formats:
+          for format in formats:
+            if format not in emitters:
+              raise ValueError("unknown format %r" % format)
+        if not os.path.isdir(outdir):
+          os.makedirs(outdir)
+      except (ValueError, KeyError, TypeError, OSError) as e:
+        self.send({"error": "bad request: %s" % e})
+        return
+      output_cache = None
+      if request.get("cache", True):
+        output_cache = OutputCache(
+            os.path.join(outdir, ".footprint-manifest.json"))
+      produced = {}
+      written = failed = 0
+      try:
+        # in sorted order, as in build()
+        for result in _run_forked(sorted(scripts), jobs, formats):
+          outputs, failures = _collect(result, outdir, produced, output_cache)
+          written += len(outputs)
+          failed += len(failures)
+          self.send({"script": result[0],
+              "outputs": [os.path.join(outdir, b) for b in outputs],
+              "failures": failures})
+      finally:
+        if output_cache is not None:
+          output_cache.save()
+      skipped = output_cache.skipped if output_cache is not None else 0
+      self.send({"written": written, "unchanged": skipped, "failed": failed})
+      out.write("%d scripts: %d written, %d unchanged, %d failed\n" % (
+          len(scripts), written, skipped, failed))
+      out.flush()
+
+  server = socketserver.UnixStreamServer(address, Handler,
+      bind_and_activate=False)
+  try:
+    server.server_bind()
+  except BaseException:
+    server.server_close()
+    raise
+  try:
+    # only this user may submit scripts, which the server runs as them;
+    # connections are refused until server_activate() listens
+    os.chmod(address, 0o600)
+    server.server_activate()
+  except BaseException:
+    server.server_close()
+    os.remove(address)
+    raise
+  out.write("serving on %s; press Ctrl-C to stop\n" % address)
+  out.flush()
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.remove(address)
+
+
+def submit(paths, outdir=".", address=None, out=None, cache=True,
+    formats=None, verbose=False):
+  """Has a server started by serve() run footprint scripts, like build().
+
+  Arguments:
+  paths -- list of scripts and/or directories containing scripts
+  outdir -- directory to place the generated .fp files in
+  address -- path of the server's Unix socket (see serve())
+  out -- file object progress and failures are reported to (defaults to
+    sys.stdout)
+  cache -- if True, footprints whose output has not changed since the
+    last build are not rewritten (see OutputCache)
+  formats -- (optional) list of formats to write every footprint in
+  verbose -- if True, also report every file written
+
+  Return value:
+  the number of footprints (or scripts) that failed
+
+  Raises OSError if there is no server listening at `address`.
+  """
+  import socket
+  out = sys.stdout if out is None else out
+  address = _default_address() if address is None else address
+  scripts = _find_scripts(paths)
+  request = {"scripts": scripts, "outdir": os.path.abspath(outdir),
+      "cache": cache, "formats": formats}
+  connection = socket.socket(socket.AF_UNIX)
+  connection.connect(address)
+  with connection, connection.makefile("rwb") as stream:
+    stream.write(json.dumps(request).encode("utf-8") + b"\n")
+    stream.flush()
+    for line in stream:
+      reply = json.loads(line.decode("utf-8"))
+      if "error" in reply:
+        out.write("FAILED: %s\n" % reply["error"])
+        return 1
+      if "script" not in reply:
+        break
+      script = _display_path(reply["script"])
+      if verbose:
+        for path in reply["outputs"]:
+          out.write("wrote %s\n" % _display_path(path))
+      for name, message in reply["failures"]:
+        if name is None:
+          out.write("FAILED %s: %s\n" % (script, message))
+        else:
+          out.write("FAILED %s: %s: %s\n" % (script, name, message))
+    else:
+      out.write("FAILED: the server closed the connection\n")
+      return 1
+  out.write("%d footprints written, %d unchanged, from %d scripts, "
+      "%d failed\n" % (reply["written"], reply["unchanged"], len(scripts),
+      reply["failed"]))
+  return reply["failed"]
+
+
+def _pack_command(pack, paths):
+  """Implements `python -m footprint pack`."""
+  count = 0
+  with PackWriter(pack) as writer:
+    for path in paths:
+      if os.path.isdir(path):
+        files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+            if f.endswith(".fp")]
+      else:
+        files = [path]
+      for filename in files:
+        writer.add_file(filename)
+        count += 1
+  print("%d footprints packed into %s" % (count, pack))
+  return 0
+
+
+def _unpack_command(pack, outdir, names):
+  """Implements `python -m footprint unpack`."""
+  try:
+    with PackReader(pack) as reader:
+      missing = [name for name in names if name not in reader]
+      if missing:
+        sys.stderr.write("not in %s: %s\n" % (pack, ", ".join(missing)))
+        return 1
+      paths = reader.unpack(outdir, names or None)
+  except (IOError, OSError, ValueError) as e:
+    sys.stderr.write("%s\n" % e)
+    return 2
+  print("%d footprints unpacked into %s" % (len(paths), outdir))
+  return 0
+
+
+def _query_command(database, conditions):
+  """Implements `python -m footprint query`."""
+  index = FootprintIndex(database)
+  criteria = {}
+  for condition in conditions:
+    match = re.match(r"(\w+)\s*(<=|>=|<|>|=)\s*(.*)$", condition)
+    if match is None:
+      sys.stderr.write("invalid condition: %s\n" % condition)
+      return 2
+    column, op, value = match.groups()
+    if index._types.get(column, "").startswith("REAL"):
+      value = _parse_length(value)
+    elif index._types.get(column, "").startswith("INTEGER"):
+      value = int(value)
+    suffix = {"=": "", "<": "_max", "<=": "_max", ">": "_min", ">=": "_min"}
+    criteria[column + suffix[op]] = value
+  try:
+    rows = index.query(**criteria)
+  except ValueError as e:
+    sys.stderr.write("%s\n" % e)
+    return 2
+  for row in rows:
+    pitch = "-" if row["pitch"] is None else "%.3fmm" % (row["pitch"]/mm)
+    size = "-" if row["width"] is None else "%.2fx%.2fmm" % (
+        row["width"]/mm, row["height"]/mm)
+    print("%-24s %4d pins %4d pads %3d rows pitch %-9s %-14s %s" % (
+        row["name"], row["pins"], row["pads"], row["rows"], pitch, size,
+        _display_path(row["path"])))
+  return 0
+
+
+def _check_command(paths, rules, verbose=False):
+  """Implements `python -m footprint check`."""
+  try:
+    results = check_library(paths, rules)
+  except (IOError, OSError, ValueError) as e:
+    sys.stderr.write("%s\n" % e)
+    return 2
+  count = failed = 0
+  for footprint, violations in results:
+    if violations:
+      failed += 1
+    elif verbose:
+      print("%s: ok" % footprint.name)
+    for violation in violations:
+      print("%s: %s" % (footprint.name, violation))
+    count += len(violations)
+  print("%d violations in %d of %d footprints" % (count, failed,
+      len(results)))
+  return 1 if count else 0
+
+
+def _dedup_command(paths, link=False, aliases=None):
+  """Implements `python -m footprint dedup`."""
+  try:
+    groups = find_duplicates(paths)
+  except (IOError, OSError, ValueError) as e:
+    sys.stderr.write("%s\n" % e)
+    return 2
+  for group in groups:
+    print(" ".join(group))
+  duplicates = sum(len(group) - 1 for group in groups)
+  print("%d duplicate files in %d groups" % (duplicates, len(groups)))
+  if link or aliases is not None:
+    freed = link_duplicates(groups, aliases)
+    print("%d bytes freed" % freed)
+  return 0
+
+
+def main(argv=None):
+  """Command-line entry point; see `python -m footprint --help`."""
+  import argparse
+  parser = argparse.ArgumentParser(prog="python -m footprint",
+      description="Tools for building libraries of pcb footprints.")
+  commands = parser.add_subparsers(dest="command")
+  commands.required = True
+  p = commands.add_parser("build",
+      help="run footprint scripts in parallel and collect their output")
+  p.add_argument("paths", nargs="+", metavar="path",
+      help="footprint script, or directory of scripts")
+  p.add_argument("-o", "--output", default=".",
+      help="directory to write .fp files to (default: current directory)")
+  p.add_argument("-j", "--jobs", type=int, default=None,
+      help="number of worker processes (default: number of CPUs)")
+  p.add_argument("-f", "--force", action="store_true",
+      help="rewrite every output file, even if it has not changed")
+  p.add_argument("-i", "--index", metavar="DATABASE",
+      help="record footprint metadata in this index database")
+  p.add_argument("--format", dest="formats", action="append",
+      choices=sorted(emitters), metavar="FORMAT",
+      help="write footprints in this format; may be repeated (formats: "
+      "%s; default: geda)" % ", ".join(sorted(emitters)))
+  p = commands.add_parser("watch",
+      help="rebuild footprint scripts whenever they change")
+  p.add_argument("paths", nargs="+", metavar="path",
+      help="footprint script, or directory of scripts")
+  p.add_argument("-o", "--output", default=".",
+      help="directory to write .fp files to (default: current directory)")
+  p.add_argument("-j", "--jobs", type=int, default=None,
+      help="number of worker processes (default: number of CPUs)")
+  p.add_argument("--interval", type=float, default=0.5, metavar="SECONDS",
+      help="time between checks for changed scripts (default: 0.5)")
+  p.add_argument("--format", dest="formats", action="append",
+      choices=sorted(emitters), metavar="FORMAT",
+      help="write footprints in this format; may be repeated")
+  p = commands.add_parser("serve",
+      help="run a build server that keeps the footprint module loaded")
+  p.add_argument("-s", "--socket", metavar="PATH",
+      help="Unix socket to listen on (default: %s)" % _default_address())
+  p.add_argument("-j", "--jobs", type=int, default=None,
+      help="number of worker processes (default: number of CPUs)")
+  p = commands.add_parser("submit",
+      help="build footprint scripts using a running build server")
+  p.add_argument("paths", nargs="+", metavar="path",
+      help="footprint script, or directory of scripts")
+  p.add_argument("-s", "--socket", metavar="PATH",
+      help="Unix socket of the server (default: %s)" % _default_address())
+  p.add_argument("-o", "--output", default=".",
+      help="directory to write .fp files to (default: current directory)")
+  p.add_argument("-f", "--force", action="store_true",
+      help="rewrite every output file, even if it has not changed")
+  p.add_argument("--format", dest="formats", action="append",
+      choices=sorted(emitters), metavar="FORMAT",
+      help="write footprints in this format; may be repeated")
+  p.add_argument("-v", "--verbose", action="store_true",
+      help="list the files written")
+  p = commands.add_parser("pack",
+      help="pack .fp files into a single library file")
+  p.add_argument("pack", help="pack file to write")
+  p.add_argument("paths", nargs="+", metavar="path",
+      help=".fp file, or directory of .fp files")
+  p = commands.add_parser("unpack",
+      help="write the footprints in a pack out as .fp files")
+  p.add_argument("pack", help="pack file")
+  p.add_argument("names", nargs="*", metavar="name",
+      help="footprint to unpack (default: all)")
+  p.add_argument("-o", "--output", default=".",
+      help="directory to write .fp files to (default: current directory)")
+  p = commands.add_parser("index",
+      help="record the metadata of existing .fp files in an index")
+  p.add_argument("database", help="index database (created if missing)")
+  p.add_argument("directories", nargs="+", metavar="directory",
+      help="directory of .fp files")
+  p = commands.add_parser("query",
+      help="search a footprint index",
+      description="Conditions have the form COLUMN=VALUE, COLUMN<VALUE or "
+      "COLUMN>VALUE. Lengths may have a unit suffix (mm, mil; default "
+      "mil); text may use * and ? wildcards. Columns: " + ", ".join(
+      c for c, t in FootprintIndex.columns))
+  p.add_argument("database", help="index database")
+  p.add_argument("conditions", nargs="*", metavar="condition")
+  p = commands.add_parser("check",
+      help="check .fp files against design rules",
+      description="Lengths may have a unit suffix (mm, mil; default mil); "
+      "pass 'off' to skip a rule.")
+  p.add_argument("paths", nargs="+", metavar="path",
+      help=".fp file, or directory of .fp files")
+  for rule, text in (("clearance", "copper to copper clearance"),
+      ("annular_ring", "annular ring width"),
+      ("silk_clearance", "silkscreen to copper clearance")):
+    p.add_argument("--" + rule.replace("_", "-"), dest=rule, metavar="LENGTH",
+        help="minimum %s (default: %s mil)" % (text,
+            Footprint.design_rules[rule]))
+  p.add_argument("-v", "--verbose", action="store_true",
+      help="also list footprints without violations")
+  p = commands.add_parser("dedup",
+      help="find .fp files with identical geometry",
+      description="Lists groups of footprint files whose shapes are "
+      "identical, ignoring footprint names and descriptions. The first "
+      "file of each group is the one kept by --link and --aliases.")
+  p.add_argument("paths", nargs="+", metavar="path",
+      help=".fp file, or directory of .fp files")
+  p.add_argument("--link", action="store_true",
+      help="replace duplicates with hard links to the kept file")
+  p.add_argument("--aliases", metavar="FILE",
+      help="remove duplicates, recording them in this JSON file")
+  args = parser.parse_args(argv)
+  if args.command == "build":
+    failed = build(args.paths, args.output, args.jobs,
+        cache=not args.force, index=args.index, formats=args.formats)
+    return 1 if failed else 0
+  if args.command == "watch":
+    watch(args.paths, args.output, args.jobs, interval=args.interval,
+        formats=args.formats)
+    return 0
+  if args.command == "serve":
+    try:
+      serve(args.socket, args.jobs)
+    except ValueError as e:
+      sys.stderr.write("%s\n" % e)
+      return 2
+    return 0
+  if args.command == "submit":
+    try:
+      failed = submit(args.paths, args.output, args.socket,
+          cache=not args.force, formats=args.formats, verbose=args.verbose)
+    except OSError as e:
+      sys.stderr.write("cannot reach the build server: %s\n" % e)
+      return 2
+    return 1 if failed else 0
+  if args.command == "pack":
+    return _pack_command(args.pack, args.paths)
+  if args.command == "unpack":
+    return _unpack_command(args.pack, args.output, args.names)
+  if args.command == "index":
+    index = FootprintIndex(args.database)
+    count = sum(_index_directory(index, d) for d in args.directories)
+    index.close()
+    print("%d footprints indexed" % count)
+    return 0
+  if args.command == "query":
+    return _query_command(args.database, args.conditions)
+  if args.command == "check":
+    rules = {}
+    for rule in Footprint.design_rules:
+      value = getattr(args, rule)
+      if value is not None:
+        rules[rule] = None if value == "off" else _parse_length(value)
+    return _check_command(args.paths, rules, args.verbose)
+  if args.command == "dedup":
+    return _dedup_command(args.paths, args.link, args.aliases)
+
+
+if __name__ != "__main__" and os.environ.get("FOOTPRINT_CACHE"):
+  use_output_cache(os.environ["FOOTPRINT_CACHE"])
+if __name__ != "__main__" and os.environ.get("FOOTPRINT_INDEX"):
+  use_metadata_index(os.environ["FOOTPRINT_INDEX"])
+if __name__ != "__main__" and os.environ.get("FOOTPRINT_PROFILE"):
+  use_profiler(os.environ["FOOTPRINT_PROFILE"])
+if __name__ != "__main__" and os.environ.get("FOOTPRINT_FORMATS"):
+  use_formats(*os.environ["FOOTPRINT_FORMATS"].split(","))
+if __name__ != "__main__" and os.environ.get("FOOTPRINT_ASYNC_WRITES"):
+  use_async_writer(int(os.environ["FOOTPRINT_ASYNC_WRITES"]))
+
+
+if __name__ == "__main__":
+  # run through the imported module so that scripts doing
+  # `from footprint import *` share its state
+  import footprint
+  sys.exit(footprint.main())